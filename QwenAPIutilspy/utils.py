@@ -17,6 +17,8 @@ from types import SimpleNamespace as config
 import tiktoken
 from dotenv import load_dotenv
 from openai import OpenAI  # 引入 OpenAI SDK 以兼容 Qwen
+# 运行日志（JSON Lines、缓冲写盘、按大小轮转）与 pageindex 共用同一实现
+from pageindex.utils import JsonLogger, read_json_log
 
 try:
     import pdfplumber
@@ -189,21 +191,6 @@ def get_pdf_name(pdf_path):
     if hasattr(pdf_path, 'name'): return pdf_path.name
     return os.path.basename(pdf_path)
 
-class JsonLogger:
-    def __init__(self, file_path):
-        name = get_pdf_name(file_path)
-        self.filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        os.makedirs("./logs", exist_ok=True); self.log_data = []
-    def log(self, level, message, **kwargs):
-        entry = {'message': str(message), 'level': level, 'timestamp': datetime.now().isoformat()}
-        self.log_data.append(entry)
-        try:
-            with open(os.path.join("logs", self.filename), "w", encoding="utf-8-sig") as f:
-                json.dump(self.log_data, f, indent=2, ensure_ascii=False)
-        except Exception: pass
-    def info(self, m): self.log("INFO", m)
-    def error(self, m): self.log("ERROR", m)
-
 def get_page_tokens(pdf_path, model=None):
     page_list = []
     if HAS_PDFPLUMBER:
@@ -8,6 +8,9 @@ import time
 import numpy as np
 import re
 import hashlib
+import queue
+import socket
+import threading
 import jieba
 import jieba.posseg as pseg
 from collections import defaultdict
@@ -16,6 +19,15 @@ from dotenv import load_dotenv
 # PyQt Core 组件用于线程和信号
 from PyQt5.QtCore import QThread, pyqtSignal, QMutex, QMutexLocker
 
+# PageIndex 结果文件读取（自动识别 gzip / zstd 压缩）；缺少 pageindex 包时只支持纯 JSON
+try:
+    from pageindex.result_io import load_result_json, RESULT_FILE_PATTERNS
+except ImportError:
+    RESULT_FILE_PATTERNS = "*.json"
+    def load_result_json(path):
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            return json.load(f)
+
 # ================= 配置与环境 =================
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 os.environ['CURL_CA_BUNDLE'] = ''
@@ -43,6 +55,31 @@ DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "sk-56d6522248d046cd8f460297d7e
 DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1")
 DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-v3")
 
+# 5. 最终回答对冲请求 (Hedged Request)
+# 主模型首 Token 超过阈值 (按 p95 TTFT 设定) 仍未返回时，向备用模型发起同一请求，先出字者胜出
+SUMMARY_HEDGE_ENABLED = os.getenv("SUMMARY_HEDGE_ENABLED", "no").lower() in ("1", "yes", "true")
+SUMMARY_HEDGE_TTFT_SECONDS = float(os.getenv("SUMMARY_HEDGE_TTFT_SECONDS", "8"))
+SUMMARY_HEDGE_FALLBACK_MODEL = os.getenv("SUMMARY_HEDGE_FALLBACK_MODEL", "qwen-turbo")
+SUMMARY_HEDGE_STATS_PATH = os.getenv("SUMMARY_HEDGE_STATS_PATH", os.path.join("logs", "summary_hedge_stats.jsonl"))
+
+# 6. 最终回答上下文预算 (Context Packer)
+SUMMARY_CONTEXT_TOKEN_BUDGET = int(os.getenv("SUMMARY_CONTEXT_TOKEN_BUDGET", "12000"))
+SUMMARY_KEYWORD_WINDOW_CHARS = int(os.getenv("SUMMARY_KEYWORD_WINDOW_CHARS", "300"))
+# 超出预算的条目剩余空间小于此值时不再截断装入；第一条至少装入这么多
+SUMMARY_MIN_PARTIAL_TOKENS = 200
+TRUNCATION_MARK = "\n...(truncated)"
+
+# 模型名称映射：将前端显示名称转换为API实际模型名称
+SUMMARY_MODEL_MAPPING = {
+    "qwen-plus": "qwen-plus",
+    "qwen-turbo": "qwen-turbo",
+    "qwen-max": "qwen-max",
+    "DeepSeek-R1": "deepseek-chat",
+    "DeepSeek-V3": "deepseek-v3",
+    "X1-70B-thinking": "x1-70b-thinking",
+    "X1-70B-fast": "x1-70b-fast"
+}
+
 # ================= System Prompts =================
 REWRITE_SYSTEM_PROMPT = """你是一个工业级 RAG 系统中的「Query Rewrite 模块」。
 你的职责不是回答问题，而是：
@@ -176,6 +213,189 @@ def extract_keywords_with_jieba(query, stopwords=None, airline_dict=None, top_n=
             
     return result[:top_n]
 
+def resolve_summary_endpoint(target_model):
+    """根据前端模型名返回 (api_key, api_url, actual_model)"""
+    if target_model in ["DeepSeek-R1", "DeepSeek-V3"]:
+        return DEEPSEEK_API_KEY, f"{DEEPSEEK_API_BASE}/chat/completions", SUMMARY_MODEL_MAPPING.get(target_model, target_model)
+    if target_model.startswith("qwen"):
+        return LLM_API_KEY, LLM_API_URL, SUMMARY_MODEL_MAPPING.get(target_model, target_model)
+    return LLM_API_KEY, LLM_API_URL, target_model
+
+def record_hedge_result(stats):
+    """追加一条对冲结果记录 (JSONL)，用于调优 TTFT 阈值与备用模型"""
+    try:
+        os.makedirs(os.path.dirname(SUMMARY_HEDGE_STATS_PATH) or ".", exist_ok=True)
+        with open(SUMMARY_HEDGE_STATS_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(stats, ensure_ascii=False) + "\n")
+    except Exception:
+        pass
+
+def _stream_socket(response):
+    raw = response.raw
+    conn = getattr(raw, 'connection', None) or getattr(raw, '_connection', None)
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        # 'Connection: close' 的响应：http.client 已把 socket 交给响应自己的文件对象
+        fp = getattr(getattr(raw, '_fp', None), 'fp', None)
+        sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+    return sock
+
+def abort_stream(response):
+    """
+    从其他线程中断流式响应。单独 close() 会等读线程释放锁（即等到服务端下一个数据块），
+    所以先 shutdown socket 唤醒阻塞在 iter_lines 上的读线程，再关闭连接。
+    """
+    sock = _stream_socket(response)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    try:
+        response.close()
+    except Exception:
+        pass
+
+def estimate_tokens(text):
+    """粗略估算 Token 数：CJK 字符约 1 Token/字，其余约 4 字符/Token"""
+    if not text:
+        return 0
+    cjk_count = len(re.findall(r'[\u3000-\u303f\u3400-\u9fff\uac00-\ud7af\uff00-\uffef]', text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+def truncate_to_tokens(text, max_tokens):
+    """按字符截断文本，使 estimate_tokens 不超过 max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+def extract_keyword_windows(text, keywords, window=300):
+    """截取关键词命中位置前后 window 个字符，合并重叠窗口；无命中时返回空字符串"""
+    if not text or not keywords:
+        return ""
+    text_lower = text.lower()
+    spans = []
+    for kw in keywords:
+        kw_lower = str(kw).lower()
+        if not kw_lower:
+            continue
+        start = text_lower.find(kw_lower)
+        while start != -1:
+            spans.append((max(0, start - window), min(len(text), start + len(kw_lower) + window)))
+            start = text_lower.find(kw_lower, start + len(kw_lower))
+    if not spans:
+        return ""
+    spans.sort()
+    merged = [list(spans[0])]
+    for s_start, s_end in spans[1:]:
+        if s_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], s_end)
+        else:
+            merged.append([s_start, s_end])
+    parts = []
+    for s_start, s_end in merged:
+        prefix = "..." if s_start > 0 else ""
+        suffix = "..." if s_end < len(text) else ""
+        parts.append(f"{prefix}{text[s_start:s_end]}{suffix}")
+    return "\n".join(parts)
+
+def format_context_chunk(item, content):
+    source_tag = item.get('source', 'VECTOR')
+    return f"""
+---
+[Rank {item['rank']}] [Source: {source_tag}] (RRF: {item['final_score']:.4f})
+Section Path: {item['path']}
+Content:
+{content}
+"""
+
+def pack_context(top_results, keywords=None, token_budget=SUMMARY_CONTEXT_TOKEN_BUDGET, window=SUMMARY_KEYWORD_WINDOW_CHARS):
+    """
+    按 Rank 顺序将召回结果装入 token_budget：
+    1. JSON_Source 条目只保留关键词命中窗口；
+    2. 父子节点重叠的正文按行指纹去重 (父节点 text 包含子节点的全部页面)；
+    3. 超出预算的条目按行截断，之后的条目丢弃；
+       第一条连一整行都放不下时按字符截取开头，top_results 非空时上下文不会为空。
+    返回 (context_str, stats)。token_budget <= 0 时不限预算。
+    """
+    original_tokens = sum(estimate_tokens(format_context_chunk(item, item.get('content', ''))) for item in top_results)
+
+    seen_lines = set()
+    chunks = []
+    used_tokens = 0
+    included = 0
+    truncated = False
+
+    for item in top_results:
+        content = item.get('content', '')
+        if keywords and "JSON" in item.get('source', ''):
+            windows = extract_keyword_windows(content, keywords, window)
+            if windows:
+                content = windows
+
+        # 行级去重：短行 (标记、标题) 保留，长行只出现一次
+        kept_lines = []
+        new_lines = 0
+        duplicate_lines = 0
+        for line in content.split('\n'):
+            fingerprint = re.sub(r'\s+', '', line).lower()
+            if len(fingerprint) >= 20:
+                if fingerprint in seen_lines:
+                    duplicate_lines += 1
+                    continue
+                seen_lines.add(fingerprint)
+                new_lines += 1
+            kept_lines.append(line)
+        if duplicate_lines and not new_lines:
+            continue  # 内容已被更高 Rank 的条目 (通常是父节点) 完整覆盖
+
+        chunk = format_context_chunk(item, '\n'.join(kept_lines).strip())
+        chunk_tokens = estimate_tokens(chunk)
+        if token_budget > 0 and used_tokens + chunk_tokens > token_budget:
+            remaining = token_budget - used_tokens - estimate_tokens(format_context_chunk(item, TRUNCATION_MARK))
+            partial = ""
+            if remaining >= SUMMARY_MIN_PARTIAL_TOKENS or not chunks:
+                partial_lines = []
+                partial_tokens = 0
+                for line in kept_lines:
+                    line_tokens = estimate_tokens(line) + 1
+                    if partial_tokens + line_tokens > remaining:
+                        break
+                    partial_lines.append(line)
+                    partial_tokens += line_tokens
+                partial = '\n'.join(partial_lines).strip()
+            if not partial and not chunks:
+                # 第一条的开头就是超长行（或预算极小）：按字符截断，保证上下文非空
+                partial = truncate_to_tokens('\n'.join(kept_lines).strip(), max(remaining, SUMMARY_MIN_PARTIAL_TOKENS))
+            if partial:
+                chunk = format_context_chunk(item, partial + TRUNCATION_MARK)
+                chunks.append(chunk)
+                used_tokens += estimate_tokens(chunk)
+                included += 1
+            truncated = True
+            break
+
+        chunks.append(chunk)
+        used_tokens += chunk_tokens
+        included += 1
+
+    stats = {
+        "original_tokens": original_tokens,
+        "packed_tokens": used_tokens,
+        "saved_tokens": max(0, original_tokens - used_tokens),
+        "included": included,
+        "total": len(top_results),
+        "truncated": truncated
+    }
+    return "".join(chunks), stats
+
 def is_precise_intent(query):
     """
     动态路由逻辑：检测是否包含大写字母+数字的组合（如 CA1234, B737 等）
@@ -195,8 +415,7 @@ class PageIndexLoader:
             return False, "文件不存在"
         
         try:
-            with open(json_path, 'r', encoding='utf-8-sig') as f:
-                data = json.load(f)
+            data = load_result_json(json_path)
             
             self.index = {}
             self.ordered_ids = []
@@ -253,8 +472,7 @@ class JsonHardQueryWorker(QThread):
 
         results = []
         try:
-            with open(self.json_path, 'r', encoding='utf-8-sig') as f:
-                data = json.load(f)
+            data = load_result_json(self.json_path)
             
             if self._is_interrupted: return 
 
@@ -317,7 +535,9 @@ class RecallWorker(QThread):
     finish_signal = pyqtSignal(bool)      
 
     def __init__(self, query_text, db_path, json_path, search_mode="smart", summary_model="DeepSeek-R1", 
-                 doc_type="不指定类型", stopwords=None, airline_names=None, chunk_limit=40):
+                 doc_type="不指定类型", stopwords=None, airline_names=None, chunk_limit=40,
+                 hedge_enabled=None, hedge_fallback_model=None, hedge_ttft_seconds=None,
+                 context_token_budget=None):
         super().__init__()
         self.original_query = query_text 
         self.search_query = query_text   
@@ -329,6 +549,15 @@ class RecallWorker(QThread):
         self.stopwords = stopwords if stopwords else []
         self.airline_names = airline_names if airline_names else [] # Step 1 Dictionary
         self.chunk_limit = chunk_limit # 动态流控参数
+
+        # 对冲请求参数 (默认读取环境变量)
+        self.hedge_enabled = SUMMARY_HEDGE_ENABLED if hedge_enabled is None else hedge_enabled
+        self.hedge_fallback_model = hedge_fallback_model or SUMMARY_HEDGE_FALLBACK_MODEL
+        self.hedge_ttft_seconds = SUMMARY_HEDGE_TTFT_SECONDS if hedge_ttft_seconds is None else hedge_ttft_seconds
+
+        # 最终回答上下文 Token 预算
+        self.context_token_budget = SUMMARY_CONTEXT_TOKEN_BUDGET if context_token_budget is None else context_token_budget
+        self.query_keywords = []
         
         self.page_index = PageIndexLoader()
         self.json_search_results = [] 
@@ -482,122 +711,210 @@ class RecallWorker(QThread):
 """
             current_system_prompt += doc_type_constraint
 
-        context_str = ""
-        for item in top_results:
-            source_tag = item.get('source', 'VECTOR')
-            context_str += f"""
----
-[Rank {item['rank']}] [Source: {source_tag}] (RRF: {item['final_score']:.4f})
-Section Path: {item['path']}
-Content:
-{item['content']}
-"""
+        context_str, pack_stats = pack_context(
+            top_results,
+            keywords=self.query_keywords,
+            token_budget=self.context_token_budget
+        )
+        self.log(f"📦 上下文装箱: {pack_stats['included']}/{pack_stats['total']} 条, "
+                 f"≈{pack_stats['packed_tokens']} tokens (原 ≈{pack_stats['original_tokens']}, 节省 ≈{pack_stats['saved_tokens']})")
         
         user_prompt_content = f"Query: {user_original_query}\n\nRetrieved Chunks:{context_str}"
+        messages = [
+            {"role": "system", "content": current_system_prompt},
+            {"role": "user", "content": user_prompt_content}
+        ]
 
-        # 模型名称映射：将前端显示名称转换为API实际模型名称
-        model_mapping = {
-            "qwen-plus": "qwen-plus",
-            "qwen-turbo": "qwen-turbo",
-            "qwen-max": "qwen-max",
-            "DeepSeek-R1": "deepseek-chat",
-            "DeepSeek-V3": "deepseek-v3",
-            "X1-70B-thinking": "x1-70b-thinking",
-            "X1-70B-fast": "x1-70b-fast"
-        }
-        
-        # 根据目标模型选择适当的API配置
-        if target_model in ["DeepSeek-R1", "DeepSeek-V3"]:
-            api_key = DEEPSEEK_API_KEY
-            api_url = f"{DEEPSEEK_API_BASE}/chat/completions"
-            # 映射到实际的API模型名称
-            actual_model = model_mapping.get(target_model, target_model)
-        elif target_model.startswith("qwen"):
-            api_key = LLM_API_KEY
-            api_url = LLM_API_URL
-            # 映射到实际的API模型名称
-            actual_model = model_mapping.get(target_model, target_model)
-        else:
-            api_key = LLM_API_KEY
-            api_url = LLM_API_URL
-            actual_model = target_model
-        
+        hedge_model = self.hedge_fallback_model if self.hedge_enabled else None
+        if hedge_model == target_model:
+            hedge_model = None
+
+        events = queue.Queue()
+        cancel_events = {}
+        responses = {}
+        started_at = {}
+
+        def launch(model_name):
+            cancel_events[model_name] = threading.Event()
+            started_at[model_name] = time.time()
+            threading.Thread(
+                target=self._stream_summary_provider,
+                args=(model_name, messages, events, cancel_events[model_name], responses),
+                daemon=True
+            ).start()
+
+        def cancel(model_name):
+            # 置位后工作线程不再读取；已建立的连接立即断开，释放连接和配额
+            cancel_events[model_name].set()
+            response = responses.pop(model_name, None)
+            if response is not None:
+                abort_stream(response)
+
+        launch(target_model)
+        request_start = time.time()
+        winner = None
+        first_token_time = None
+        hedge_launched = False
+        finished = set()
+        full_reasoning = ""
+        full_content = ""
+        is_thinking_logged = False
+
+        try:
+            while True:
+                if self._is_interrupted:
+                    self.log("🛑 总结生成已中断")
+                    self.summary_signal.emit("\n\n[用户终止了生成]")
+                    break
+
+                try:
+                    kind, model_name, reasoning_delta, content_delta = events.get(timeout=0.1)
+                except queue.Empty:
+                    # 首 Token 超时：发起对冲请求
+                    if (winner is None and hedge_model and not hedge_launched
+                            and time.time() - request_start >= self.hedge_ttft_seconds):
+                        self.log(f"⏱️ {target_model} 首 Token 超过 {self.hedge_ttft_seconds:.1f}s，对冲请求 {hedge_model}...")
+                        launch(hedge_model)
+                        hedge_launched = True
+                    continue
+
+                if winner is None:
+                    if kind == 'delta':
+                        winner = model_name
+                        first_token_time = time.time() - started_at[model_name]
+                        for name in list(cancel_events):
+                            if name != winner:
+                                cancel(name)
+                        if hedge_launched:
+                            self.log(f"🏁 对冲胜出: {winner} (TTFT {first_token_time:.2f}s)，已取消其余请求")
+                    else:
+                        finished.add(model_name)
+                        if kind == 'error' and hedge_model:
+                            self.log(f"❌ {model_name} 调用失败: {reasoning_delta}")
+                        # 主模型直接失败时立即启用备用模型
+                        if hedge_model and not hedge_launched:
+                            self.log(f"↪️ {target_model} 失败，立即切换到 {hedge_model}")
+                            launch(hedge_model)
+                            hedge_launched = True
+                            continue
+                        if len(finished) == len(cancel_events):
+                            if kind == 'error' and content_delta is not None:
+                                self.log(f"❌ API 错误: {content_delta}")
+                                self.summary_signal.emit(f"⚠️ 无法生成总结: {reasoning_delta}")
+                            elif kind == 'error':
+                                self.log(f"❌ DeepSeek 调用异常: {reasoning_delta}")
+                                self.summary_signal.emit(f"⚠️ 总结生成失败: {reasoning_delta}")
+                            elif hedge_launched:
+                                self.summary_signal.emit("⚠️ 无法生成总结: empty response")
+                            else:
+                                # 与未启用对冲时的单模型流程一致：空流按正常结束处理
+                                self.log(f"✅ {target_model} 总结生成完毕")
+                            break
+                        continue
+
+                if model_name != winner:
+                    continue
+
+                if kind == 'delta':
+                    if reasoning_delta:
+                        if not is_thinking_logged:
+                            self.log("🧠 检测到思维链 (CoT)，正在思考...")
+                            is_thinking_logged = True
+                        full_reasoning += reasoning_delta
+                    if content_delta:
+                        full_content += content_delta
+
+                    formatted_output = ""
+                    if full_reasoning:
+                        clean_reasoning = full_reasoning.replace('\n', '\n> ')
+                        formatted_output += f"> 🧠 **Thinking Process:**\n> {clean_reasoning}\n\n"
+
+                    if full_reasoning and full_content:
+                        formatted_output += "---\n\n"
+
+                    if full_content:
+                        formatted_output += f"{full_content}"
+
+                    self.summary_signal.emit(formatted_output)
+                elif kind == 'error':
+                    self.log(f"❌ {winner} 流式输出中断: {reasoning_delta}")
+                    self.summary_signal.emit(f"⚠️ 总结生成失败: {reasoning_delta}")
+                    break
+                else:
+                    self.log(f"✅ {winner} 总结生成完毕")
+                    break
+
+        except Exception as e:
+            self.log(f"❌ DeepSeek 调用异常: {str(e)}")
+            self.summary_signal.emit(f"⚠️ 总结生成失败: {str(e)}")
+        finally:
+            for name in list(cancel_events):
+                cancel(name)
+
+        if self.hedge_enabled:
+            record_hedge_result({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "primary": target_model,
+                "fallback": hedge_model,
+                "hedged": hedge_launched,
+                "winner": winner,
+                "ttft_sec": round(first_token_time, 3) if first_token_time is not None else None,
+                "threshold_sec": self.hedge_ttft_seconds,
+                "total_sec": round(time.time() - request_start, 3)
+            })
+
+    def _stream_summary_provider(self, model_name, messages, events, cancel_event, responses):
+        """
+        在独立线程中读取某个模型的 SSE 流，将增量放入 events 队列。
+        建立连接后把 response 放进 responses，主线程取消时可直接断开；cancel_event 置位后不再读取。
+        HTTP 状态错误的事件为 ('error', model, 消息, 状态码)，其余异常为 ('error', model, 消息, None)。
+        """
+        api_key, api_url, actual_model = resolve_summary_endpoint(model_name)
         headers = { 'Content-Type': 'application/json', 'Authorization': f'Bearer {api_key}' }
         payload = {
-            "model": actual_model, 
-            "messages": [
-                {"role": "system", "content": current_system_prompt},
-                {"role": "user", "content": user_prompt_content}
-            ],
+            "model": actual_model,
+            "messages": messages,
             "stream": True,
             "temperature": 0.6
         }
 
+        response = None
         try:
-            if self._is_interrupted: return
-
             response = requests.post(api_url, headers=headers, json=payload, verify=False, stream=True, timeout=120)
-            
-            if response.status_code == 200:
-                full_reasoning = ""
-                full_content = ""
-                is_thinking_logged = False
-                
-                for line in response.iter_lines():
-                    if self._is_interrupted: 
-                        self.log("🛑 总结生成已中断")
-                        self.summary_signal.emit("\n\n[用户终止了生成]")
-                        break
-
-                    if line:
-                        decoded_line = line.decode('utf-8')
-                        if decoded_line.startswith("data: "):
-                            data_str = decoded_line[6:] 
-                            if data_str.strip() == "[DONE]":
-                                break
-                            try:
-                                json_chunk = json.loads(data_str)
-                                delta = json_chunk['choices'][0]['delta']
-                                
-                                current_reasoning_delta = delta.get('reasoning_content', '')
-                                current_content_delta = delta.get('content', '')
-                                updated = False
-                                
-                                if current_reasoning_delta:
-                                    if not is_thinking_logged:
-                                        self.log("🧠 检测到思维链 (CoT)，正在思考...")
-                                        is_thinking_logged = True
-                                    full_reasoning += current_reasoning_delta
-                                    updated = True
-                                
-                                if current_content_delta:
-                                    full_content += current_content_delta
-                                    updated = True
-
-                                if updated:
-                                    formatted_output = ""
-                                    if full_reasoning:
-                                        clean_reasoning = full_reasoning.replace('\n', '\n> ')
-                                        formatted_output += f"> 🧠 **Thinking Process:**\n> {clean_reasoning}\n\n"
-                                    
-                                    if full_reasoning and full_content:
-                                        formatted_output += "---\n\n" 
-                                        
-                                    if full_content:
-                                        formatted_output += f"{full_content}"
-                                        
-                                    self.summary_signal.emit(formatted_output)
-                            except Exception:
-                                continue
-                if not self._is_interrupted:
-                    self.log(f"✅ {target_model} 总结生成完毕")
-            else:
-                self.log(f"❌ API 错误: {response.status_code}")
-                self.summary_signal.emit(f"⚠️ 无法生成总结: API Error {response.status_code}")
+            responses[model_name] = response
+            # 等待响应头期间已被取消（对手先出了首 Token）
+            if cancel_event.is_set():
+                return
+            if response.status_code != 200:
+                events.put(('error', model_name, f"API Error {response.status_code}", response.status_code))
+                return
 
+            for line in response.iter_lines():
+                if cancel_event.is_set():
+                    return
+                if not line:
+                    continue
+                decoded_line = line.decode('utf-8')
+                if not decoded_line.startswith("data: "):
+                    continue
+                data_str = decoded_line[6:]
+                if data_str.strip() == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(data_str)['choices'][0]['delta']
+                except Exception:
+                    continue
+                reasoning_delta = delta.get('reasoning_content', '') or ''
+                content_delta = delta.get('content', '') or ''
+                if reasoning_delta or content_delta:
+                    events.put(('delta', model_name, reasoning_delta, content_delta))
+            events.put(('done', model_name, None, None))
         except Exception as e:
-            self.log(f"❌ DeepSeek 调用异常: {str(e)}")
-            self.summary_signal.emit(f"⚠️ 总结生成失败: {str(e)}")
+            if not cancel_event.is_set():
+                events.put(('error', model_name, str(e), None))
+        finally:
+            if response is not None:
+                response.close()
 
     # --- 核心算法: RRF Fusion ---
     def apply_rrf_fusion(self, vector_items, json_items, k=60):
@@ -688,6 +1005,7 @@ Content:
                     self.airline_names
                 )
                 self.log(f"🔍 [三步走策略] 提取关键词: {keywords}")
+                self.query_keywords = keywords
                 
                 if keywords:
                     self.log("🚀 启动 JSON 原文硬查询线程...")
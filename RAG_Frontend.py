@@ -444,7 +444,7 @@ class RAGRecallApp(QMainWindow):
             self.settings.setValue("last_db_path", path)
 
     def browse_json(self):
-        path, _ = QFileDialog.getOpenFileName(self, "选择 JSON", "", "JSON Files (*.json);;All Files (*.*)")
+        path, _ = QFileDialog.getOpenFileName(self, "选择 JSON", "", "PageIndex Results (*.json *.json.gz *.json.zst);;All Files (*.*)")
         if path:
             self.json_path_edit.setText(path)
             self.settings.setValue("last_json_path", path)
@@ -0,0 +1,115 @@
+"""
+目录页启发式检测的精确率 / 召回率基准。
+
+标注来源：tests/results/<name>_structure.json 中的节点标题。
+一页如果同时列出了大量节点标题（>= MIN_TITLE_HITS 个，且占该页非空行的比例足够高），
+就视为目录页；其余页视为非目录页。PDF 取自 tests/pdfs/<name>.pdf。
+注意：截断版结构只覆盖前 50 页，其第二张目录页列出的全是后面的章节，会被标成非目录页。
+
+用法:
+    python benchmark_toc_heuristic.py
+    python benchmark_toc_heuristic.py --pages 20 --verbose
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import unicodedata
+
+from pageindex.utils import get_page_tokens
+from pageindex.toc_heuristic import score_toc_page, TOC_YES_THRESHOLD, TOC_NO_THRESHOLD
+
+PDF_DIR = os.path.join('tests', 'pdfs')
+RESULT_DIR = os.path.join('tests', 'results')
+MIN_TITLE_HITS = 5
+MIN_TITLE_LINE_RATIO = 0.3
+
+
+def _normalize(text):
+    text = unicodedata.normalize('NFKC', text).lower()
+    return re.sub(r'[\W_]+', '', text)
+
+
+def _collect_titles(nodes, titles):
+    for node in nodes or []:
+        title = _normalize(node.get('title', ''))
+        if len(title) >= 6: titles.add(title)
+        _collect_titles(node.get('nodes'), titles)
+    return titles
+
+
+def label_toc_pages(page_texts, structure):
+    titles = _collect_titles(structure, set())
+    labels = []
+    for text in page_texts:
+        lines = [_normalize(l) for l in text.split('\n') if l.strip()]
+        hit_lines = sum(1 for l in lines if any(t in l for t in titles if len(t) <= len(l) + 4))
+        page = _normalize(text)
+        title_hits = sum(1 for t in titles if t in page)
+        labels.append(bool(lines) and title_hits >= MIN_TITLE_HITS and hit_lines / len(lines) >= MIN_TITLE_LINE_RATIO)
+    return labels
+
+
+def run_benchmark(max_pages=None, verbose=False):
+    totals = {'tp': 0, 'fp': 0, 'fn': 0, 'tn': 0, 'ambiguous': 0, 'pages': 0}
+    confident = {'tp': 0, 'fp': 0, 'fn': 0, 'tn': 0}
+    elapsed = 0.0
+    for fname in sorted(os.listdir(RESULT_DIR)):
+        if not fname.endswith('_structure.json'): continue
+        name = fname[:-len('_structure.json')]
+        pdf_path = os.path.join(PDF_DIR, name + '.pdf')
+        if not os.path.exists(pdf_path):
+            print(f'[WARN] Missing PDF for {name}, skipped.')
+            continue
+        with open(os.path.join(RESULT_DIR, fname), 'r', encoding='utf-8') as f:
+            structure = json.load(f).get('structure', [])
+        page_texts = [text for text, _ in get_page_tokens(pdf_path)]
+        if max_pages: page_texts = page_texts[:max_pages]
+        labels = label_toc_pages(page_texts, structure)
+
+        start = time.perf_counter()
+        scores = [score_toc_page(text)[0] for text in page_texts]
+        elapsed += time.perf_counter() - start
+
+        doc = {'tp': 0, 'fp': 0, 'fn': 0, 'tn': 0, 'ambiguous': 0}
+        for i, (score, is_toc) in enumerate(zip(scores, labels)):
+            # 总体口径：score >= 0.5 视为预测目录页
+            predicted = score >= 0.5
+            key = ('tp' if is_toc else 'fp') if predicted else ('fn' if is_toc else 'tn')
+            doc[key] += 1
+            # 置信口径：只统计启发式直接给出结论（不走 LLM）的页
+            if score >= TOC_YES_THRESHOLD: confident['tp' if is_toc else 'fp'] += 1
+            elif score <= TOC_NO_THRESHOLD: confident['fn' if is_toc else 'tn'] += 1
+            else: doc['ambiguous'] += 1
+            if verbose and (is_toc or predicted):
+                print(f'  {name} page {i}: label={"toc" if is_toc else "-"} score={score:.2f}')
+        for k, v in doc.items(): totals[k] += v
+        totals['pages'] += len(page_texts)
+        print(f'{name}: pages={len(page_texts)} toc_pages={sum(labels)} '
+              f'tp={doc["tp"]} fp={doc["fp"]} fn={doc["fn"]} ambiguous={doc["ambiguous"]}')
+
+    def _ratio(a, b): return a / b if b else float('nan')
+    print('\n=== Overall (score >= 0.5) ===')
+    print(f'precision={_ratio(totals["tp"], totals["tp"] + totals["fp"]):.3f} '
+          f'recall={_ratio(totals["tp"], totals["tp"] + totals["fn"]):.3f}')
+    print(f'=== Confident decisions (yes >= {TOC_YES_THRESHOLD}, no <= {TOC_NO_THRESHOLD}) ===')
+    print(f'yes precision={_ratio(confident["tp"], confident["tp"] + confident["fp"]):.3f} '
+          f'no precision={_ratio(confident["tn"], confident["tn"] + confident["fn"]):.3f}')
+    decided = totals['pages'] - totals['ambiguous']
+    print(f'LLM calls skipped: {decided}/{totals["pages"]} ({_ratio(decided, totals["pages"]):.1%}), '
+          f'scoring time {elapsed * 1000:.1f} ms')
+    return totals, confident
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the heuristic TOC page detector')
+    parser.add_argument('--pages', type=int, default=None, help='Only score the first N pages of each PDF')
+    parser.add_argument('--verbose', action='store_true', help='Print every labelled or predicted TOC page')
+    args = parser.parse_args()
+    run_benchmark(args.pages, args.verbose)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,7 +8,8 @@ import urllib3
 import time
 from dotenv import load_dotenv
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QLabel, QLineEdit, QPushButton, QTextEdit, QFileDialog, QMessageBox, QProgressBar, QComboBox)
+                             QLabel, QLineEdit, QPushButton, QTextEdit, QFileDialog, QMessageBox, QProgressBar, QComboBox,
+                             QCheckBox)
 from PyQt5.QtCore import QThread, pyqtSignal, QSettings, Qt
 
 # 禁用 HTTPS 警告（适配Win7旧环境）
@@ -104,11 +105,12 @@ class VectorWorker(QThread):
     finish_signal = pyqtSignal(bool, str) # 完成信号
     progress_signal = pyqtSignal(int)  # 进度信号
 
-    def __init__(self, input_path):
+    def __init__(self, input_path, db_path=None, incremental=False):
         super().__init__()
         self.input_path = input_path
         self.output_json_path = input_path.replace(".json", "_embedded.json")
-        self.output_db_path = input_path.replace(".json", "_rag.db")
+        self.output_db_path = db_path or input_path.replace(".json", "_rag.db")
+        self.incremental = incremental  # 增量模式：embedding_text 未变的条目复用已有向量
         self.batch_size = 8  # 批处理大小，避免一次请求过大
 
     def generate_stable_id(self, metadata):
@@ -148,6 +150,38 @@ class VectorWorker(QThread):
         conn.commit()
         return conn
 
+    def load_existing_vectors(self, cursor):
+        """读取已有条目: id -> (embedding_text, embedding_json)"""
+        cursor.execute('''
+            SELECT d.id, d.embedding_text, v.embedding FROM documents d JOIN vectors v ON d.id = v.id
+        ''')
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    def update_document_row(self, cursor, stable_id, item, metadata):
+        """原地更新 documents 表中除 embedding_text 以外的字段（章节路径、片段等可能随新版本变化）"""
+        cursor.execute('''
+            UPDATE documents SET section_hint = ?, original_snippet = ?, section_path = ?, depth = ?, original_length = ?
+            WHERE id = ?
+        ''', (
+            item.get('section_hint', ''),
+            item.get('original_snippet', ''),
+            json.dumps(metadata.get('section_path', [])),
+            metadata.get('depth', 0),
+            metadata.get('original_length', 0),
+            stable_id
+        ))
+
+    def delete_stale_rows(self, cursor, doc_titles, live_ids):
+        """删除同一文档中已不存在的章节"""
+        stale_ids = []
+        for doc_title in doc_titles:
+            cursor.execute("SELECT id FROM vectors WHERE doc_title = ?", (doc_title,))
+            stale_ids.extend(row[0] for row in cursor.fetchall() if row[0] not in live_ids)
+        for stale_id in stale_ids:
+            cursor.execute("DELETE FROM vectors WHERE id = ?", (stale_id,))
+            cursor.execute("DELETE FROM documents WHERE id = ?", (stale_id,))
+        return len(stale_ids)
+
     def call_bge_embedding_api(self, text_batch):
         """调用远程 BGE-M3 嵌入接口"""
         headers = {
@@ -205,9 +239,37 @@ class VectorWorker(QThread):
 
             processed_results = [] # 用于保存最终 JSON
             
+            # 增量模式：embedding_text 与库中一致的条目直接复用向量，只对新增/变化条目调用 API
+            pending_items = data
+            if self.incremental:
+                existing = self.load_existing_vectors(cursor)
+                pending_items, live_ids, doc_titles = [], set(), set()
+                for item in data:
+                    metadata = item.get('metadata', {})
+                    stable_id = self.generate_stable_id(metadata)
+                    live_ids.add(stable_id)
+                    doc_titles.add(metadata.get('doc_title', ''))
+                    previous = existing.get(stable_id)
+                    if previous and previous[0] == item.get('embedding_text', ''):
+                        self.update_document_row(cursor, stable_id, item, metadata)
+                        processed_results.append({
+                            "id": stable_id,
+                            "embedding": json.loads(previous[1]),
+                            "embedding_text": item.get('embedding_text', ''),
+                            "section_hint": item.get('section_hint', ''),
+                            "metadata": metadata,
+                            "original_snippet": item.get('original_snippet', '')
+                        })
+                    else:
+                        pending_items.append(item)
+                removed = self.delete_stale_rows(cursor, doc_titles, live_ids)
+                conn.commit()
+                self.log_signal.emit(f"增量模式: 复用 {len(processed_results)} 条，需重新向量化 {len(pending_items)} 条，删除过期 {removed} 条")
+                total_items = len(pending_items)
+            
             # 3. 批处理循环
             for i in range(0, total_items, self.batch_size):
-                batch_items = data[i : i + self.batch_size]
+                batch_items = pending_items[i : i + self.batch_size]
                 batch_texts = [item.get('embedding_text', '') for item in batch_items]
                 
                 # 过滤空文本
@@ -440,6 +502,8 @@ class VectorApp(QMainWindow):
 
         # 3. 操作选项
         option_layout = QHBoxLayout()
+        self.incremental_check = QCheckBox("增量更新已有数据库 (复用未变化条目)")
+        self.incremental_check.setStyleSheet("color: #cccccc;")
         
         self.operation_combo = QLabel("操作类型:")
         self.operation_combo.setStyleSheet("color: #cccccc; font-size: 14px; font-weight: bold;")
@@ -452,6 +516,7 @@ class VectorApp(QMainWindow):
         
         option_layout.addWidget(self.operation_combo)
         option_layout.addWidget(self.operation_selector)
+        option_layout.addWidget(self.incremental_check)
         
         main_layout.addLayout(option_layout)
         
@@ -519,8 +584,14 @@ class VectorApp(QMainWindow):
             self.log("正在启动重排序任务线程...")
             self.worker = RerankWorker(json_path)  # 新的重排序工作线程
         else:
+            db_path = None
+            if self.incremental_check.isChecked():
+                db_path, _ = QFileDialog.getOpenFileName(
+                    self, "选择要增量更新的数据库", os.path.dirname(json_path), "SQLite DB (*.db)"
+                )
+                self.log(f"增量更新数据库: {db_path or '(默认路径)'}")
             self.log("正在启动向量化任务线程...")
-            self.worker = VectorWorker(json_path)
+            self.worker = VectorWorker(json_path, db_path=db_path or None, incremental=self.incremental_check.isChecked())
         
         self.worker.log_signal.connect(self.log)
         self.worker.progress_signal.connect(self.progress_bar.setValue)
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+离线 Mock API Server - OpenAI 兼容的本地替身服务
+实现 /embeddings、/rerank 与 (流式) /chat/completions，返回确定性的向量、分数与回复，
+用于在无法访问 SiliconFlow / DashScope / DeepSeek 的机器上运行和压测整条流水线。
+
+用法:
+    python mock_api_server.py --port 8765 --latency 200 --jitter 50 --error-rate 0.01 --rate-limit-rate 0.02
+
+然后将以下环境变量指向本服务 (或写入 .env):
+    BGE_API_BASE=http://127.0.0.1:8765/v1
+    BGE_RERANK_API_BASE=http://127.0.0.1:8765/v1
+    QWEN_API_BASE=http://127.0.0.1:8765/v1
+    DEEPSEEK_API_BASE=http://127.0.0.1:8765/v1
+
+调试接口:
+    GET  /__requests   最近记录的请求 (JSON)
+    GET  /__stats      按接口统计的请求数 / 注入错误数
+    POST /__reset      清空记录
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_EMBEDDING_DIM = 1024  # 与 BAAI/bge-m3 一致
+
+
+# ================= 确定性向量与分数 =================
+def tokenize_for_hash(text):
+    """英文按单词、CJK 按单字 + 相邻二元组切分，保证相似文本得到相似向量"""
+    text = (text or "").lower()
+    tokens = re.findall(r'[a-z0-9]+', text)
+    cjk_chars = re.findall(r'[\u3400-\u9fff]', text)
+    tokens.extend(cjk_chars)
+    tokens.extend(a + b for a, b in zip(cjk_chars, cjk_chars[1:]))
+    return tokens
+
+
+def deterministic_embedding(text, dim=DEFAULT_EMBEDDING_DIM):
+    """Feature hashing：每个 token 经 MD5 映射到固定维度与符号，最后做 L2 归一化"""
+    vec = [0.0] * dim
+    for token in tokenize_for_hash(text):
+        digest = hashlib.md5(token.encode('utf-8')).digest()
+        idx = int.from_bytes(digest[:4], 'little') % dim
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vec[idx] += sign
+    norm = math.sqrt(sum(v * v for v in vec))
+    if norm == 0:
+        # 空文本也返回稳定的非零向量
+        digest = hashlib.md5((text or "").encode('utf-8')).digest()
+        vec[int.from_bytes(digest[:4], 'little') % dim] = 1.0
+        return vec
+    return [round(v / norm, 6) for v in vec]
+
+
+def deterministic_rerank_score(query, document):
+    """基于 token 重合度的确定性相关性分数，范围 [0, 1]"""
+    q_tokens = set(tokenize_for_hash(query))
+    d_tokens = set(tokenize_for_hash(document))
+    if not q_tokens or not d_tokens:
+        return 0.0
+    overlap = len(q_tokens & d_tokens)
+    return round(overlap / math.sqrt(len(q_tokens) * len(d_tokens)), 6)
+
+
+# ================= 确定性对话回复 =================
+def _last_user_prompt(messages):
+    for msg in reversed(messages or []):
+        if msg.get("role") == "user":
+            return str(msg.get("content", ""))
+    return ""
+
+
+def _mock_toc_items(prompt, max_items=8):
+    """从 <physical_index_X> 标记中挑选若干页，用页首行作为标题，模拟无 TOC 文档的结构生成"""
+    pages = re.findall(r'<physical_index_(\d+)>\n(.*?)\n<physical_index_\1>', prompt, re.DOTALL)
+    if not pages:
+        return []
+    step = max(1, len(pages) // max_items)
+    items = []
+    for page_num, page_text in pages[::step][:max_items]:
+        first_line = next((line.strip() for line in page_text.split('\n') if line.strip()), f"Section {page_num}")
+        items.append({
+            "structure": str(len(items) + 1),
+            "title": first_line[:60],
+            "physical_index": f"<physical_index_{page_num}>"
+        })
+    return items
+
+
+def mock_chat_reply(messages):
+    """
+    根据提示词特征返回 PageIndex / RAG 各环节能解析的确定性回复。
+    回复内容只依赖输入，同一提示词总是得到同一回复。
+    """
+    prompt = _last_user_prompt(messages)
+    digest = hashlib.md5(prompt.encode('utf-8')).hexdigest()[:8]
+
+    if '"toc_pages"' in prompt:
+        pages = sorted(set(re.findall(r'<page_(\d+)>', prompt)), key=int)
+        return json.dumps({"thinking": "mock", "toc_pages": {p: "no" for p in pages}})
+    if '"toc_detected"' in prompt:
+        return json.dumps({"thinking": "mock", "toc_detected": "no"})
+    if '"page_index_given_in_toc"' in prompt:
+        return json.dumps({"thinking": "mock", "page_index_given_in_toc": "no"})
+    if '"completed"' in prompt:
+        return json.dumps({"thinking": "mock", "completed": "yes"})
+    if '"start_begin"' in prompt:
+        return json.dumps({"thinking": "mock", "start_begin": "yes"})
+    if '"answer"' in prompt:
+        return json.dumps({"thinking": "mock", "answer": "yes"})
+    if 'table_of_contents' in prompt:
+        return json.dumps({"table_of_contents": []})
+    if '"summaries"' in prompt:
+        ids = re.findall(r'<section id="([^"]+)">', prompt)
+        return json.dumps({"summaries": {i: f"Mock summary {digest}-{i}." for i in ids}})
+    if '"summary"' in prompt:
+        return json.dumps({"summary": f"Mock summary {digest}."})
+    if '"description"' in prompt:
+        return json.dumps({"description": f"Mock document description {digest}."})
+    if 'physical_index' in prompt:
+        return json.dumps(_mock_toc_items(prompt), ensure_ascii=False)
+
+    # RAG 查询重写 / 最终回答
+    first_line = prompt.strip().split('\n')[0][:80]
+    return f"**Mock answer** ({digest}) for: {first_line}"
+
+
+def split_stream_chunks(text, chunk_size=8):
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+
+
+# ================= HTTP 服务 =================
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.stats = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint, body, status, elapsed):
+        entry = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "endpoint": endpoint,
+            "model": body.get("model") if isinstance(body, dict) else None,
+            "status": status,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "body": body if self.args.record_bodies else None,
+        }
+        with self.lock:
+            self.requests.append(entry)
+            if len(self.requests) > self.args.max_records:
+                del self.requests[:len(self.requests) - self.args.max_records]
+            self.stats[endpoint]["requests"] += 1
+            self.stats[endpoint][f"status_{status}"] += 1
+        if self.args.record_file:
+            with self.lock:
+                with open(self.args.record_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def sample_delay(self):
+        with self.lock:
+            jitter = self.rng.uniform(-self.args.jitter, self.args.jitter)
+        return max(0.0, (self.args.latency + jitter) / 1000.0)
+
+    def sample_fault(self):
+        """返回需要注入的 HTTP 状态码，None 表示正常响应"""
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.args.rate_limit_rate:
+            return 429
+        if roll < self.args.rate_limit_rate + self.args.error_rate:
+            return 500
+        return None
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server_version = "PageIndexMock/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, fmt, *args):
+        if not self.state.args.quiet:
+            sys.stderr.write("[MOCK] %s - %s\n" % (self.address_string(), fmt % args))
+
+    def _send_json(self, status, payload, extra_headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (extra_headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ("", "/health"):
+            return self._send_json(200, {"status": "ok"})
+        if self.path.startswith("/__requests"):
+            with self.state.lock:
+                return self._send_json(200, list(self.state.requests))
+        if self.path.startswith("/__stats"):
+            with self.state.lock:
+                return self._send_json(200, {k: dict(v) for k, v in self.state.stats.items()})
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        start = time.time()
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw.decode('utf-8')) if raw else {}
+        except ValueError:
+            body = {}
+
+        path = self.path.split('?')[0].rstrip('/')
+        if path.endswith("/__reset"):
+            with self.state.lock:
+                self.state.requests.clear()
+                self.state.stats.clear()
+            return self._send_json(200, {"status": "reset"})
+
+        if path.endswith("/embeddings"):
+            endpoint = "embeddings"
+        elif path.endswith("/rerank"):
+            endpoint = "rerank"
+        elif path.endswith("/chat/completions"):
+            endpoint = "chat"
+        else:
+            return self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        time.sleep(self.state.sample_delay())
+
+        fault = self.state.sample_fault()
+        if fault == 429:
+            self.state.record(endpoint, body, 429, time.time() - start)
+            return self._send_json(429, {"error": {"message": "Rate limit exceeded (mock)", "type": "rate_limit"}},
+                                   extra_headers={"Retry-After": "1"})
+        if fault == 500:
+            self.state.record(endpoint, body, 500, time.time() - start)
+            return self._send_json(500, {"error": {"message": "Injected server error (mock)", "type": "server_error"}})
+
+        if endpoint == "embeddings":
+            self._handle_embeddings(body)
+        elif endpoint == "rerank":
+            self._handle_rerank(body)
+        else:
+            self._handle_chat(body)
+        self.state.record(endpoint, body, 200, time.time() - start)
+
+    def _handle_embeddings(self, body):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = self.state.args.dim
+        data = [{"object": "embedding", "index": i, "embedding": deterministic_embedding(text, dim)}
+                for i, text in enumerate(inputs)]
+        tokens = sum(len(tokenize_for_hash(t)) for t in inputs)
+        self._send_json(200, {
+            "object": "list",
+            "model": body.get("model", "mock-embedding"),
+            "data": data,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    def _handle_rerank(self, body):
+        query = body.get("query", "")
+        documents = body.get("documents", [])
+        results = []
+        for i, doc in enumerate(documents):
+            text = doc.get("text", "") if isinstance(doc, dict) else str(doc)
+            results.append({"index": i, "relevance_score": deterministic_rerank_score(query, text)})
+        results.sort(key=lambda r: r["relevance_score"], reverse=True)
+        top_n = body.get("top_n")
+        if isinstance(top_n, int) and top_n > 0:
+            results = results[:top_n]
+        self._send_json(200, {"id": "mock-rerank", "results": results})
+
+    def _handle_chat(self, body):
+        content = mock_chat_reply(body.get("messages", []))
+        model = body.get("model", "mock-chat")
+        created = int(time.time())
+
+        if not body.get("stream"):
+            return self._send_json(200, {
+                "id": "mock-chat",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(content), "total_tokens": len(content)}
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        chunk_delay = self.state.args.chunk_delay / 1000.0
+        try:
+            for piece in split_stream_chunks(content):
+                chunk = {
+                    "id": "mock-chat",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                if chunk_delay:
+                    time.sleep(chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端主动断开 (如对冲请求取消)
+            pass
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible mock server for embeddings / rerank / chat")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="Base latency before each response (ms)")
+    parser.add_argument("--jitter", type=float, default=0, help="Uniform +/- jitter added to latency (ms)")
+    parser.add_argument("--chunk-delay", type=float, default=0, help="Delay between streamed chunks (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of an injected HTTP 429")
+    parser.add_argument("--dim", type=int, default=DEFAULT_EMBEDDING_DIM, help="Embedding dimension")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for latency/fault sampling")
+    parser.add_argument("--record-file", default=None, help="Append every request to this JSONL file")
+    parser.add_argument("--record-bodies", action="store_true", help="Keep full request bodies in the records")
+    parser.add_argument("--max-records", type=int, default=10000, help="In-memory request records to keep")
+    parser.add_argument("--quiet", action="store_true", help="Suppress per-request access logs")
+    return parser
+
+
+def create_server(args):
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(args)
+    return server
+
+
+def main():
+    args = build_parser().parse_args()
+    server = create_server(args)
+    base = f"http://{args.host}:{server.server_address[1]}/v1"
+    print(f"[INFO] Mock API server listening on {base}", flush=True)
+    print("[INFO] Point the pipeline at it with:", flush=True)
+    for name in ("BGE_API_BASE", "BGE_RERANK_API_BASE", "QWEN_API_BASE", "DEEPSEEK_API_BASE"):
+        print(f"    {name}={base}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] Mock server stopped.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
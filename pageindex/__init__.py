@@ -1,2 +1,3 @@
 from .page_index import *
-from .page_index_md import md_to_tree
\ No newline at end of file
+from .page_index_md import md_to_tree
+from .page_index_doc import doc_index_main
\ No newline at end of file
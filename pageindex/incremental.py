@@ -0,0 +1,165 @@
+"""
+修订版 PDF 的增量重建。
+
+每次完整运行后把逐页文本哈希、结构树（含摘要，不含正文）和文档描述存为索引产物。
+增量运行时用 difflib 对齐新旧页哈希序列：
+  - 变化页比例过高、目录页变化、或变化区间内的标题已找不到 → 返回 None，走完整流程；
+  - 否则复用旧结构树（页码按对齐结果重映射），页范围与变化页相交、含被删除页或页数变少的节点需要重新生成摘要，
+    旧页全部被删除的节点从树中移除。
+索引产物按 PDF 文件名 + 绝对路径哈希存放，不同目录下的同名 PDF 互不覆盖。
+"""
+import os
+import copy
+import json
+import hashlib
+import difflib
+from datetime import datetime
+
+from .toc_heuristic import classify_toc_page
+from .title_matcher import match_title_appearance
+from .utils import get_pdf_name, remove_structure_text, iter_preorder, iter_postorder
+
+INDEX_ARTIFACT_DIR = os.getenv("PAGEINDEX_ARTIFACT_DIR", os.path.join("cache", "index_artifacts"))
+INCREMENTAL_MAX_CHANGED_RATIO = 0.3
+# generate_document_description 只读前 2 页
+DESCRIPTION_PAGES = 2
+
+
+def get_page_hashes(page_list):
+    return [hashlib.sha1(text.encode('utf-8')).hexdigest()[:16] for text, _ in page_list]
+
+
+def _artifact_path(doc):
+    if not isinstance(doc, str): return None
+    # 按路径而不是内容区分：同一路径的修订版要找到上一版的产物
+    path_hash = hashlib.sha1(os.path.abspath(doc).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(INDEX_ARTIFACT_DIR, f"{os.path.splitext(get_pdf_name(doc))[0]}_{path_hash}.json")
+
+
+def load_index_artifact(doc):
+    path = _artifact_path(doc)
+    if not path or not os.path.exists(path): return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+    except Exception as e:
+        print(f"[WARNING] Index artifact unreadable ({path}): {e}")
+        return None
+
+
+def save_index_artifact(doc, page_hashes, structure, doc_description, fingerprint):
+    path = _artifact_path(doc)
+    if not path: return
+    structure = copy.deepcopy(structure)
+    remove_structure_text(structure)
+    data = {
+        'doc_name': get_pdf_name(doc),
+        'saved_at': datetime.now().isoformat(),
+        'fingerprint': fingerprint,
+        'page_hashes': page_hashes,
+        'doc_description': doc_description,
+        'structure': structure or [],
+    }
+    try:
+        os.makedirs(INDEX_ARTIFACT_DIR, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[WARNING] Failed to save index artifact: {e}")
+
+
+def map_pages(old_hashes, new_hashes):
+    """
+    返回 (page_map, changed_pages, deleted_pages)：
+      page_map      旧物理页 -> 新物理页（1-based）
+      changed_pages 新文档中内容有变化或新插入的物理页集合；删除位置之后的第一个新页也算变化
+                    （它现在接在被删内容的位置上，标题和摘要都要重新检查）
+      deleted_pages 旧文档中被删除（在新文档里没有对应页）的物理页集合
+    """
+    page_map, changed, deleted = {}, set(), set()
+    new_count = len(new_hashes)
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for k in range(i2 - i1): page_map[i1 + k + 1] = j1 + k + 1
+            continue
+        if tag == 'delete':
+            deleted.update(range(i1 + 1, i2 + 1))
+            # 删除的页映射到其后第一个新页（删在末尾时为最后一页）
+            neighbor = min(j1 + 1, new_count)
+            for k in range(i2 - i1): page_map[i1 + k + 1] = neighbor
+            if neighbor: changed.add(neighbor)
+            continue
+        changed.update(range(j1 + 1, j2 + 1))
+        # 替换块按位置一一对应，多出来的旧页落在块的最后一页上
+        for k in range(i2 - i1): page_map[i1 + k + 1] = min(j1 + k, j2 - 1) + 1
+    return page_map, changed, deleted
+
+
+def _drop_deleted_nodes(structure, deleted):
+    """移除旧页范围全部被删除的节点（连同子树），返回剩下的根节点列表"""
+    def alive(node):
+        try:
+            start, end = int(node['start_index']), int(node['end_index'])
+        except (KeyError, TypeError, ValueError):
+            return True
+        return not all(page in deleted for page in range(start, end + 1))
+
+    if not deleted: return structure
+    for node in iter_postorder(structure):
+        if node.get('nodes'):
+            node['nodes'] = [child for child in node['nodes'] if alive(child)]
+            if not node['nodes']: del node['nodes']
+    return [node for node in structure if alive(node)]
+
+
+def plan_incremental_update(previous, page_list, page_hashes, fingerprint, toc_check_page_num=20):
+    """
+    返回 {'structure', 'summaries', 'doc_description', 'dirty', 'changed_pages'}，不适合增量时返回 None。
+    summaries 以节点先序位置为键（旧页全部被删除的节点已先移除），与 generate_summaries_for_structure 的 reuse 参数对应。
+    """
+    if not previous or previous.get('fingerprint') != fingerprint:
+        if previous: print("[INFO] Incremental: options changed since the previous run, rebuilding.")
+        return None
+    old_hashes = previous.get('page_hashes') or []
+    page_map, changed, deleted = map_pages(old_hashes, page_hashes)
+    new_count = len(page_hashes)
+    ratio = len(changed) / new_count if new_count else 1.0
+    print(f"[INFO] Incremental: {len(changed)} of {new_count} pages changed ({ratio:.0%}), {len(deleted)} pages deleted.")
+    if ratio > INCREMENTAL_MAX_CHANGED_RATIO: return None
+    for page in changed:
+        if page <= toc_check_page_num and classify_toc_page(page_list[page - 1][0]) != 'no':
+            print(f"[INFO] Incremental: page {page} may be part of the table of contents, rebuilding.")
+            return None
+
+    structure = _drop_deleted_nodes(copy.deepcopy(previous.get('structure') or []), deleted)
+    if not structure: return None
+    old_count = len(old_hashes)
+    summaries, dirty = {}, 0
+    for key, node in enumerate(iter_preorder(structure)):
+        try:
+            start, end = int(node['start_index']), int(node['end_index'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        new_start = page_map.get(start, start)
+        # 旧结束页之后插入的页归入本节点
+        new_end = new_count if end >= old_count else max(page_map.get(end, end), page_map.get(end + 1, end + 1) - 1)
+        node['start_index'], node['end_index'] = new_start, max(new_start, min(new_end, new_count))
+        # 页数变少或旧范围内有页被删除：内容少了，旧摘要不再准确
+        shrank = node['end_index'] - node['start_index'] < end - start or any(start <= page <= end for page in deleted)
+        if shrank or any(node['start_index'] <= page <= node['end_index'] for page in changed):
+            dirty += 1
+            node.pop('summary', None)
+            if new_start in changed and match_title_appearance(node.get('title', ''), page_list[new_start - 1][0]) == 'no':
+                print(f"[INFO] Incremental: title '{node.get('title')}' no longer found on page {new_start}, rebuilding.")
+                return None
+        elif node.get('summary'):
+            # 上次生成失败的空摘要不复用，留给本次重试
+            summaries[key] = node['summary']
+
+    doc_description = previous.get('doc_description')
+    if any(page <= DESCRIPTION_PAGES for page in changed): doc_description = None
+    print(f"[INFO] Incremental: reusing {len(summaries)} node summaries, {dirty} nodes need new summaries.")
+    return {'structure': structure, 'summaries': summaries, 'doc_description': doc_description,
+            'dirty': dirty, 'changed_pages': sorted(changed)}
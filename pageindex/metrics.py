@@ -0,0 +1,198 @@
+"""
+page_index_main 的分阶段性能统计。
+
+每次运行一个 RunMetrics，放在 contextvar 里；阶段名同样放在 contextvar 中，
+所以 asyncio.gather 出来的任务自动继承所在阶段，线程池任务需要用 bind_context 提交。
+ChatGPT_API_with_finish_reason 每次调用后把调用次数、token 估算、重试和失败记到当前（最内层）阶段。
+
+每个阶段：
+  invocations        进入次数
+  wall_time          墙钟时间（秒）。同名阶段嵌套时只计最外层；并发执行的同名阶段会累加
+  llm_calls          实际发出的 LLM 请求（cache_hits 为缓存命中，不计入 llm_calls）
+  prompt_tokens / completion_tokens   token 估算
+  retries / failures 重试次数 / 重试耗尽后失败的调用
+另外按运行统计标题检查由本地匹配 / LLM 判断的次数（title_checks）。
+阶段开始和结束时打印 @@PROGRESS@@ 事件，GUI 可直接解析绘图；结束时写出 metrics JSON。
+"""
+import json
+import time
+import asyncio
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+PROGRESS_PREFIX = "@@PROGRESS@@"
+STAGE_FIELDS = ('invocations', 'wall_time', 'llm_calls', 'cache_hits', 'prompt_tokens', 'completion_tokens', 'retries', 'failures')
+# 不在任何阶段内发出的调用
+UNSTAGED = 'other'
+
+_metrics_var = contextvars.ContextVar('pageindex_metrics', default=None)
+_stage_var = contextvars.ContextVar('pageindex_stage', default=())
+# count_title_checks 的计数器：gather 出来的任务继承同一个 dict，所以只统计本次调用
+_title_counter_var = contextvars.ContextVar('pageindex_title_checks', default=None)
+
+
+class RunMetrics:
+    def __init__(self, doc_name=None, emit_progress=True):
+        self.doc_name = doc_name
+        self.started_at = datetime.now().isoformat()
+        self.emit_progress = emit_progress
+        self.stages = {}
+        self.title_checks = {'local': 0, 'llm': 0}
+        self.lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def _stage(self, name):
+        if name not in self.stages: self.stages[name] = {k: 0 for k in STAGE_FIELDS}
+        return self.stages[name]
+
+    def record_llm_call(self, stage, prompt_tokens=0, completion_tokens=0, retries=0, failed=False, cached=False):
+        with self.lock:
+            s = self._stage(stage)
+            if cached:
+                s['cache_hits'] += 1
+                return
+            s['llm_calls'] += 1
+            s['prompt_tokens'] += prompt_tokens
+            s['completion_tokens'] += completion_tokens
+            s['retries'] += retries
+            s['failures'] += int(failed)
+
+    def record_title_check(self, source):
+        with self.lock:
+            self.title_checks[source] += 1
+
+    def record_stage(self, name, elapsed, outermost=True):
+        with self.lock:
+            s = self._stage(name)
+            s['invocations'] += 1
+            if outermost: s['wall_time'] = round(s['wall_time'] + elapsed, 3)
+            return dict(s)
+
+    def totals(self):
+        with self.lock:
+            totals = {k: sum(s[k] for s in self.stages.values()) for k in STAGE_FIELDS if k not in ('invocations', 'wall_time')}
+        totals['wall_time'] = round(time.perf_counter() - self._start, 3)
+        return totals
+
+    def to_dict(self):
+        return {
+            'doc_name': self.doc_name,
+            'started_at': self.started_at,
+            'finished_at': datetime.now().isoformat(),
+            'totals': self.totals(),
+            'title_checks': dict(self.title_checks),
+            'stages': {name: dict(s) for name, s in self.stages.items()},
+        }
+
+    def emit(self, event, stage, **fields):
+        if not self.emit_progress: return
+        data = {'phase': stage, 'current': 0, 'total': 0, 'event': event, 'doc_name': self.doc_name, **fields}
+        print(f"{PROGRESS_PREFIX}{json.dumps(data, ensure_ascii=False)}", flush=True)
+
+    def save(self, path):
+        data = self.to_dict()
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            print(f"[INFO] Metrics saved: {path}")
+        except Exception as e:
+            print(f"[WARNING] Failed to save metrics: {e}")
+        return data
+
+    def print_report(self):
+        print("\n=== Stage Metrics ===")
+        print(f"{'stage':<44}{'time(s)':>9}{'calls':>7}{'cached':>8}{'prompt':>9}{'compl':>8}{'retry':>7}{'fail':>6}")
+        for name, s in self.stages.items():
+            print(f"{name[:43]:<44}{s['wall_time']:>9.2f}{s['llm_calls']:>7}{s['cache_hits']:>8}"
+                  f"{s['prompt_tokens']:>9}{s['completion_tokens']:>8}{s['retries']:>7}{s['failures']:>6}")
+        t = self.totals()
+        print(f"{'TOTAL':<44}{t['wall_time']:>9.2f}{t['llm_calls']:>7}{t['cache_hits']:>8}"
+              f"{t['prompt_tokens']:>9}{t['completion_tokens']:>8}{t['retries']:>7}{t['failures']:>6}")
+
+
+def start_run(doc_name=None, emit_progress=True):
+    """在当前上下文开始一次运行的统计；之后在此上下文内创建的任务都记到它上面"""
+    metrics = RunMetrics(doc_name, emit_progress)
+    _metrics_var.set(metrics)
+    _stage_var.set(())
+    return metrics
+
+
+def get_run_metrics():
+    return _metrics_var.get()
+
+
+def current_stage():
+    stack = _stage_var.get()
+    return stack[-1] if stack else UNSTAGED
+
+
+def record_llm_call(prompt_tokens=0, completion_tokens=0, retries=0, failed=False, cached=False):
+    metrics = _metrics_var.get()
+    if metrics is None: return
+    metrics.record_llm_call(current_stage(), prompt_tokens, completion_tokens, retries, failed, cached)
+
+
+def record_title_check(source):
+    """source: 'local'（本地匹配给出结论）或 'llm'（交给 LLM 判断）"""
+    metrics = _metrics_var.get()
+    if metrics is not None: metrics.record_title_check(source)
+    counter = _title_counter_var.get()
+    if counter is not None: counter[source] += 1
+
+
+@contextmanager
+def count_title_checks():
+    """with 块内创建的任务所做的标题检查计入返回的 dict，不混入同一运行或其他运行里并发的检查"""
+    counter = {'local': 0, 'llm': 0}
+    token = _title_counter_var.set(counter)
+    try:
+        yield counter
+    finally:
+        _title_counter_var.reset(token)
+
+
+@contextmanager
+def stage(name):
+    metrics = _metrics_var.get()
+    if metrics is None:
+        yield
+        return
+    stack = _stage_var.get()
+    outermost = name not in stack
+    token = _stage_var.set(stack + (name,))
+    if outermost: metrics.emit('stage_start', name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_var.reset(token)
+        snapshot = metrics.record_stage(name, time.perf_counter() - start, outermost)
+        if outermost: metrics.emit('stage_end', name, **snapshot)
+
+
+def profile_stage(name):
+    """把整个函数（同步或 async）记为一个阶段"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name): return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name): return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind_context(func, *args, **kwargs):
+    """
+    线程池提交用：在提交线程里复制上下文，让工作线程里的 LLM 调用记到正确的运行和阶段。
+    每次提交都复制一次，同一个 Context 不能被多个线程同时进入。
+    """
+    return functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
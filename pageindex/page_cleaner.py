@@ -0,0 +1,104 @@
+"""
+页眉 / 页脚 / 页码去重预处理。
+
+逐页取开头和结尾各 EDGE_LINES 个非空行作为候选，按"位置槽 + 相似度"与相邻页比较：
+同一槽位（如"第 1 行"、"倒数第 1 行"）在前后 NEIGHBOR_WINDOW 页内至少 MIN_NEIGHBOR_MATCHES 页
+出现相似的行，就认为是页眉 / 页脚；第 2、3 行只有在更靠页边的行也被删除时才删除。
+比较前把数字统一替换为 #，所以 "Page 3 of 50" 与 "Page 4 of 50"、"- 12 -" 与 "- 13 -" 视为相同；
+其余行用 difflib 相似度判断。
+每段连续重复的第一页保留该行：章节起始页的标题往往与后续页的页眉相同，删掉会影响标题定位。
+被删除的行按 {页码: [[行号, 原文], ...]} 返回，restore_page_text 可还原原始页文本。
+"""
+import re
+import difflib
+
+EDGE_LINES = 3
+NEIGHBOR_WINDOW = 4
+MIN_NEIGHBOR_MATCHES = 2
+LINE_SIMILARITY = 0.85
+# 页数太少时无法区分页眉和正文
+MIN_PAGES = 4
+MIN_TEXT_CHARS = 3
+
+_DIGITS = re.compile(r'\d+')
+_SPACES = re.compile(r'\s+')
+
+
+def _normalize(line):
+    return _SPACES.sub(' ', _DIGITS.sub('#', line.strip().lower()))
+
+
+def _edge_slots(lines):
+    """返回 {槽位: (行号, 归一化文本)}；槽位 0,1,2 为开头，-1,-2,-3 为结尾，两端不重叠"""
+    indices = [i for i, line in enumerate(lines) if line.strip()]
+    head = indices[:EDGE_LINES]
+    tail = [i for i in indices[-EDGE_LINES:] if i not in head]
+    slots = {pos: (i, _normalize(lines[i])) for pos, i in enumerate(head)}
+    slots.update({-(pos + 1): (i, _normalize(lines[i])) for pos, i in enumerate(reversed(tail))})
+    return slots
+
+
+def _similar(a, b):
+    if a == b: return True
+    if not a or not b or min(len(a), len(b)) < LINE_SIMILARITY * max(len(a), len(b)): return False
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return matcher.quick_ratio() >= LINE_SIMILARITY and matcher.ratio() >= LINE_SIMILARITY
+
+
+def detect_repeated_lines(page_texts):
+    """返回 {页下标(0-based): [行号, ...]}，为需要删除的页眉 / 页脚行"""
+    if len(page_texts) < MIN_PAGES: return {}
+    page_lines = [text.split('\n') for text in page_texts]
+    page_slots = [_edge_slots(lines) for lines in page_lines]
+
+    def has_similar(q, pos, key):
+        other = page_slots[q].get(pos)
+        return other is not None and _similar(key, other[1])
+
+    def is_repeated(p, pos, key):
+        # 不含数字的极短行（旋转文字、公式碎片）不当作页眉页脚
+        if len(key) < MIN_TEXT_CHARS and '#' not in key: return False
+        neighbors = [q for q in range(max(0, p - NEIGHBOR_WINDOW), min(len(page_slots), p + NEIGHBOR_WINDOW + 1)) if q != p]
+        if sum(1 for q in neighbors if has_similar(q, pos, key)) < MIN_NEIGHBOR_MATCHES: return False
+        # 连续重复段的第一页保留（奇偶页交替的页眉隔一页出现，所以看前两页）
+        return any(has_similar(q, pos, key) for q in range(max(0, p - 2), p))
+
+    removals = {}
+    for p, slots in enumerate(page_slots):
+        # 从页边向内逐槽检查，遇到第一个不重复的行就停止：页眉页脚只会贴着页边，
+        # 更靠内的重复行（如每页表格的表头）属于正文
+        for edge in (range(EDGE_LINES), range(-1, -EDGE_LINES - 1, -1)):
+            for pos in edge:
+                if pos not in slots: break
+                line_idx, key = slots[pos]
+                if not is_repeated(p, pos, key): break
+                removals.setdefault(p, []).append(line_idx)
+    return removals
+
+
+def strip_repeated_lines(page_list, count_fn=None):
+    """
+    page_list: [(text, tokens), ...]。返回 (cleaned_page_list, removed)，
+    removed = {页码(1-based, str): [[行号, 原文], ...]}，可 JSON 序列化。
+    count_fn 用于重新计算被修改页的 token 数（默认保留原值）。
+    """
+    removals = detect_repeated_lines([text for text, _ in page_list])
+    cleaned, removed = [], {}
+    for p, (text, tokens) in enumerate(page_list):
+        line_indices = set(removals.get(p, ()))
+        if not line_indices:
+            cleaned.append((text, tokens))
+            continue
+        lines = text.split('\n')
+        removed[str(p + 1)] = [[i, lines[i]] for i in sorted(line_indices)]
+        new_text = '\n'.join(line for i, line in enumerate(lines) if i not in line_indices)
+        cleaned.append((new_text, count_fn(new_text) if count_fn else tokens))
+    return cleaned, removed
+
+
+def restore_page_text(text, removed_lines):
+    """把 strip_repeated_lines 删掉的行按原行号插回去，得到原始页文本"""
+    lines = text.split('\n')
+    for line_idx, line in sorted(removed_lines):
+        lines.insert(line_idx, line)
+    return '\n'.join(lines)
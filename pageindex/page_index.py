@@ -7,6 +7,7 @@ import re
 import asyncio
 from datetime import datetime
 from io import BytesIO
+from statistics import NormalDist
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Import from your utils file
@@ -31,24 +32,27 @@ from .utils import (
     get_json_content,
     config,
     get_nodes,
+    iter_preorder,
+    llm_cache_scope,
+    StageCheckpoint,
+    get_options_fingerprint,
     clean_deepseek_content  # 确保 utils 中有这个函数，如果没有请忽略
 )
+from .toc_heuristic import classify_toc_page, heuristic_toc_labels
+from .incremental import get_page_hashes, load_index_artifact, save_index_artifact, plan_incremental_update
+from .toc_aligner import TocAligner, LOCAL_ALIGN_MIN_COVERAGE
+from .title_matcher import match_title_appearance, match_title_at_start, local_title_match_scope
+from .metrics import start_run, stage, profile_stage, bind_context, record_title_check, count_title_checks
+from .result_io import write_result_json
+from .page_cleaner import strip_repeated_lines
 
 # === CRITICAL FIX: Reference-based node collector ===
 def collect_nodes_by_reference(structure):
     """
-    Recursively collects references to all node dictionaries in the structure.
+    Collects references to all node dictionaries in the structure (pre-order).
     Does NOT use deepcopy, allowing in-place modifications.
     """
-    nodes = []
-    if isinstance(structure, list):
-        for item in structure:
-            nodes.extend(collect_nodes_by_reference(item))
-    elif isinstance(structure, dict):
-        nodes.append(structure)
-        if 'nodes' in structure:
-            nodes.extend(collect_nodes_by_reference(structure['nodes']))
-    return nodes
+    return list(iter_preorder(structure))
 
 ################### Helper: Robustness Utils ###################
 def ensure_dict_result(data):
@@ -61,6 +65,7 @@ def ensure_dict_result(data):
     return {}
 
 ################### Helper: Document Description ###################
+@profile_stage('generate_document_description')
 async def generate_document_description(page_list, model=None):
     intro_text = ""
     # 限制前2页或前6000字，防止 Token 超出
@@ -104,23 +109,112 @@ async def generate_document_description(page_list, model=None):
         return "Description generation failed due to API error."
 
 ################### Helper: Node Summaries ###################
-async def generate_summaries_for_structure(structure, model=None):
+SUMMARY_NODE_CHARS = 2500
+SUMMARY_BATCH_TOKEN_BUDGET = 6000
+# 截断后超过该 token 数的节点单独发送，不参与打包
+SUMMARY_BATCH_NODE_MAX_TOKENS = 1000
+SUMMARY_BATCH_MAX_NODES = 12
+
+def pack_summary_batches(items, token_budget=SUMMARY_BATCH_TOKEN_BUDGET, source=None):
+    """
+    items: [(key, node), ...]，按先序排列；source(key, node) 返回节点的摘要输入文本。
+    返回 (batches, singles)：小节点按 token 预算贪心打包，大节点单独成组。
+    """
+    source = source or (lambda key, node: node.get('text', '')[:SUMMARY_NODE_CHARS])
+    batches, singles = [], []
+    current, current_tokens = [], 0
+    for key, node in items:
+        tokens = count_tokens(source(key, node))
+        if tokens > SUMMARY_BATCH_NODE_MAX_TOKENS:
+            singles.append((key, node))
+            continue
+        if current and (current_tokens + tokens > token_budget or len(current) >= SUMMARY_BATCH_MAX_NODES):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((key, node))
+        current_tokens += tokens
+    if current: batches.append(current)
+    # 只有一个节点的批次没有打包收益，按单节点处理
+    singles.extend(batch[0] for batch in batches if len(batch) == 1)
+    return [batch for batch in batches if len(batch) > 1], singles
+
+def get_parent_only_text(node, page_list):
+    """
+    父节点自身的正文：从父节点起始页到第一个子节点标题之前的文字。
+    子节点与父节点同页开始时，只取该页中子节点标题之前的部分。
+    """
+    children = node.get('nodes') or []
+    if not children: return node.get('text', '')
+    try:
+        start = int(node.get('start_index') or 1)
+        child_start = int(children[0].get('start_index') or start)
+    except (TypeError, ValueError):
+        return ""
+    text = "".join(page_list[i][0] + "\n" for i in range(max(0, start - 1), min(len(page_list), child_start - 1)))
+    if 0 < child_start <= len(page_list):
+        boundary = page_list[child_start - 1][0]
+        pos = boundary.lower().find(str(children[0].get('title', '')).strip().lower())
+        if pos > 0: text += boundary[:pos]
+    return text
+
+def build_parent_summary_input(node, page_list):
+    """
+    父节点的摘要输入：自身正文 + 各子节点的摘要。
+    没有 page_list 时（MD / DOCX / TXT 结构）node['text'] 本身就只含父节点自己的正文。
+    """
+    own_text = (get_parent_only_text(node, page_list) if page_list is not None else node.get('text', '')).strip()[:SUMMARY_NODE_CHARS // 2]
+    lines = [f"- {child.get('title', '')}: {child.get('summary', '')}" for child in node.get('nodes') or [] if child.get('summary')]
+    parts = [f"Section: {node.get('title', '')}"]
+    if own_text: parts.append(f"Introduction of this section:\n{own_text}")
+    if lines: parts.append("Summaries of its subsections:\n" + "\n".join(lines))
+    return "\n\n".join(parts) if own_text or lines else ""
+
+def group_nodes_by_height(items):
+    """按高度分层（叶子为 0，父节点为子节点最大高度 + 1），同层节点互不依赖，可以并行"""
+    heights = {}
+    for key, node in reversed(items):
+        children = node.get('nodes') or []
+        heights[id(node)] = 1 + max(heights[id(c)] for c in children) if children else 0
+    levels = {}
+    for key, node in items:
+        levels.setdefault(heights[id(node)], []).append((key, node))
+    return [levels[h] for h in sorted(levels)]
+
+async def generate_summaries_for_structure(structure, model=None, checkpoint=None, reuse=None, batch_token_budget=SUMMARY_BATCH_TOKEN_BUDGET,
+                                           mode='flat', page_list=None):
     """
     Generates summaries for each node by modifying the structure IN-PLACE.
+    With a checkpoint, finished summaries are appended as they complete and
+    reused on resume (nodes are keyed by their pre-order position).
+    `reuse` maps the same keys to summaries carried over by an incremental run.
+    Small nodes are packed into one prompt up to `batch_token_budget` tokens (0 disables).
+    mode='bottom_up' summarizes leaves from their own text and parents from their
+    children's summaries plus parent-only text, one tree level at a time. Without
+    page_list a node's own 'text' is taken as its parent-only text.
+    Every request of a level is issued at once; concurrency and request rate are
+    bounded by the global LLM budget (set_llm_limits / PAGEINDEX_LLM_CONCURRENCY).
     """
     nodes = collect_nodes_by_reference(structure)
+    # 自底向上模式下父节点的摘要输入（key -> text，已控制长度），其余节点用截断后的 node['text']
+    inputs = {}
+    def summary_source(key, node):
+        return inputs[key] if key in inputs else node.get('text', '')[:SUMMARY_NODE_CHARS]
+    done = dict(reuse or {})
+    if checkpoint:
+        done.update({r['key']: r['summary'] for r in checkpoint.load_records('summaries') if 'key' in r and r.get('summary')})
+        if done: print(f"[INFO] Resume: {len(done)}/{len(nodes)} node summaries restored from checkpoint.")
+    # 内网环境容易触发 WAF 429 时，用 PAGEINDEX_LLM_CONCURRENCY=2（或 PAGEINDEX_LLM_RPM）限制全局并发
 
-    # === 关键修改：降低并发 ===
-    # 内网环境建议设置为 2 或 1，防止触发 WAF 429 错误
-    sem = asyncio.Semaphore(2) 
-
-    async def summarize_node(node):
-        text_content = node.get('text', '')
+    async def summarize_node(node, key):
+        if key in done:
+            node['summary'] = done[key]
+            return
+        text_content = summary_source(key, node)
         if not text_content or len(text_content.strip()) < 10: 
             node['summary'] = ""
             return
         
-        safe_content = text_content[:2500] # 减少 token 消耗
+        safe_content = text_content # 已截断，减少 token 消耗
         
         prompt = f"""
         Task: Summarize the following academic/technical text into ONE concise English sentence.
@@ -133,56 +227,116 @@ async def generate_summaries_for_structure(structure, model=None):
         Format: {{ "summary": "<your summary here>" }}
         """
         
-        async with sem:
-            try:
-                # 增加随机延时，避免瞬间并发击穿限流
-                await asyncio.sleep(random.uniform(0.5, 1.5))
-                
-                response_str = await ChatGPT_API_async(model, prompt)
-                
-                # 1. 尝试标准提取
-                data = extract_json(response_str)
-                data = ensure_dict_result(data)
-                summary_text = data.get("summary", "")
-                
-                # 2. 强力兜底 (DeepSeek 经常返回带思考过程的非标准 JSON)
-                if not summary_text and response_str and "Error" not in response_str:
-                     clean_raw = response_str.replace("```json", "").replace("```", "").strip()
-                     # 移除 <think> 标签 (如果 utils 没处理干净)
-                     clean_raw = re.sub(r'<think>.*?</think>', '', clean_raw, flags=re.DOTALL).strip()
-                     
-                     # 简单清洗尝试获取内容
-                     if "summary" in clean_raw:
-                         # 极其暴力的提取，为了保证有内容
-                         try:
-                             summary_text = clean_raw.split('"summary":')[1].strip().strip('"}').strip("',")
-                         except:
-                             summary_text = clean_raw
-                     else:
-                         summary_text = clean_raw # 既然无法解析 JSON，就认为整个回复都是摘要
-
-                # 清洗一下可能的首尾引号
-                if summary_text:
-                    summary_text = summary_text.strip('"').strip("'")
-
-                node['summary'] = summary_text
-                
-                if summary_text:
-                    # 在控制台打印简略信息，证明正在工作
-                    print(f"  [SUM] OK: {node.get('title', 'Node')[:15]}...", flush=True)
-                else:
-                    print(f"  [SUM] Empty: {node.get('title')}", flush=True)
-                
-            except Exception as e:
-                print(f"[ERROR] Failed to summarize node {node.get('title')}: {e}")
+        try:
+            response_str = await ChatGPT_API_async(model, prompt)
+            
+            # 1. 尝试标准提取
+            data = extract_json(response_str)
+            data = ensure_dict_result(data)
+            summary_text = data.get("summary", "")
+            
+            # 2. 强力兜底 (DeepSeek 经常返回带思考过程的非标准 JSON)
+            if not summary_text and response_str and "Error" not in response_str:
+                 clean_raw = response_str.replace("```json", "").replace("```", "").strip()
+                 # 移除 <think> 标签 (如果 utils 没处理干净)
+                 clean_raw = re.sub(r'<think>.*?</think>', '', clean_raw, flags=re.DOTALL).strip()
+                 
+                 # 简单清洗尝试获取内容
+                 if "summary" in clean_raw:
+                     # 极其暴力的提取，为了保证有内容
+                     try:
+                         summary_text = clean_raw.split('"summary":')[1].strip().strip('"}').strip("',")
+                     except:
+                         summary_text = clean_raw
+                 else:
+                     summary_text = clean_raw # 既然无法解析 JSON，就认为整个回复都是摘要
+
+            # 清洗一下可能的首尾引号
+            if summary_text:
+                summary_text = summary_text.strip('"').strip("'")
+
+            node['summary'] = summary_text
+            # 空摘要不写入检查点，--resume 时会重试
+            if checkpoint and summary_text: checkpoint.append('summaries', {'key': key, 'summary': summary_text})
+            
+            if summary_text:
+                # 在控制台打印简略信息，证明正在工作
+                print(f"  [SUM] OK: {node.get('title', 'Node')[:15]}...", flush=True)
+            else:
+                print(f"  [SUM] Empty: {node.get('title')}", flush=True)
+            
+        except Exception as e:
+            print(f"[ERROR] Failed to summarize node {node.get('title')}: {e}")
+            node['summary'] = ""
+
+    async def summarize_batch(batch):
+        """一次请求总结多个小节点，返回 node_id -> summary 的 JSON；漏答的节点退回单节点请求"""
+        ids = {str(node.get('node_id') or key): (key, node) for key, node in batch}
+        sections = "\n".join(
+            f'<section id="{node_id}">\n{summary_source(key, node)}\n</section>'
+            for node_id, (key, node) in ids.items()
+        )
+        prompt = f"""
+        Task: Summarize EACH of the following academic/technical text sections into ONE concise English sentence.
+        Each section is wrapped in <section id="..."> and </section>.
+        
+        {sections}
+        
+        Output Requirement:
+        Return ONLY the JSON object mapping every section id to its summary. Do not add markdown blocks.
+        Format: {{ "summaries": {{ "<section id>": "<summary of that section>", ... }} }}
+        """
+        summaries = {}
+        try:
+            response_str = await ChatGPT_API_async(model, prompt)
+            data = ensure_dict_result(extract_json(response_str))
+            summaries = data.get("summaries", {})
+            if not isinstance(summaries, dict): summaries = {}
+        except Exception as e:
+            print(f"[ERROR] Batched summary failed for {len(batch)} nodes: {e}")
+        missing = []
+        for node_id, (key, node) in ids.items():
+            summary_text = str(summaries.get(node_id, "")).strip().strip('"').strip("'")
+            if not summary_text:
+                missing.append((key, node))
+                continue
+            node['summary'] = summary_text
+            if checkpoint: checkpoint.append('summaries', {'key': key, 'summary': summary_text})
+        print(f"  [SUM] Batch OK: {len(batch) - len(missing)}/{len(batch)} nodes", flush=True)
+        if missing:
+            await asyncio.gather(*(summarize_node(node, key) for key, node in missing))
+
+    async def summarize_level(items):
+        pending = []
+        for key, node in items:
+            text_content = summary_source(key, node)
+            if key in done:
+                node['summary'] = done[key]
+            elif not text_content or len(text_content.strip()) < 10:
                 node['summary'] = ""
+            else:
+                pending.append((key, node))
 
-    tasks = []
-    for node in nodes: 
-        tasks.append(summarize_node(node))
-    
-    if tasks: 
-        await asyncio.gather(*tasks)
+        if batch_token_budget:
+            batches, singles = pack_summary_batches(pending, batch_token_budget, summary_source)
+            print(f"[INFO] Summaries: {len(pending)} nodes in {len(batches)} batches + {len(singles)} single requests.")
+        else:
+            batches, singles = [], pending
+        tasks = [summarize_batch(batch) for batch in batches] + [summarize_node(node, key) for key, node in singles]
+        
+        if tasks: 
+            await asyncio.gather(*tasks)
+
+    items = list(enumerate(nodes))
+    if mode == 'bottom_up':
+        levels = group_nodes_by_height(items)
+        for height, level in enumerate(levels):
+            if height:
+                inputs.update({key: build_parent_summary_input(node, page_list) for key, node in level})
+            print(f"[INFO] Bottom-up summaries: level {height + 1}/{len(levels)}, {len(level)} nodes.")
+            await summarize_level(level)
+    else:
+        await summarize_level(items)
     return structure
 
 ################### (以下逻辑保持原样，无需变动) ###################
@@ -200,7 +354,8 @@ def init_node_fields(structure):
         if 'nodes' in structure:
             init_node_fields(structure['nodes'])
 
-async def check_title_appearance(item, page_list, start_index=1, model=None):    
+def check_title_appearance_local(item, page_list, start_index=1):
+    """不调用 LLM 就能确定的结果（缺页码、页码越界、本地匹配命中）；需要 LLM 判断时返回 None"""
     title = item['title']
     if 'physical_index' not in item or item['physical_index'] is None:
         return {'list_index': item.get('list_index'), 'answer': 'no', 'title': title, 'page_number': None}
@@ -211,7 +366,19 @@ async def check_title_appearance(item, page_list, start_index=1, model=None):
     list_idx = page_number - start_index
     if list_idx < 0 or list_idx >= len(page_list):
         return {'list_index': item.get('list_index'), 'answer': 'no', 'title': title, 'page_number': page_number}
-    page_text = page_list[list_idx][0]
+    local_answer = match_title_appearance(title, page_list[list_idx][0])
+    if local_answer is not None:
+        record_title_check('local')
+        return {'list_index': item.get('list_index'), 'answer': local_answer, 'title': title, 'page_number': page_number}
+    return None
+
+async def check_title_appearance(item, page_list, start_index=1, model=None):    
+    local_result = check_title_appearance_local(item, page_list, start_index)
+    if local_result is not None: return local_result
+    title = item['title']
+    page_number = int(item['physical_index'])
+    page_text = page_list[page_number - start_index][0]
+    record_title_check('llm')
     prompt = f"""
     Your job is to check if the given section appears or starts in the given page_text.
     Note: do fuzzy matching, ignore any space inconsistency in the page_text.
@@ -233,6 +400,11 @@ async def check_title_appearance(item, page_list, start_index=1, model=None):
     return {'list_index': item.get('list_index'), 'answer': answer, 'title': title, 'page_number': page_number}
 
 async def check_title_appearance_in_start(title, page_text, model=None, logger=None):    
+    local_answer = match_title_at_start(title, page_text)
+    if local_answer is not None:
+        record_title_check('local')
+        return local_answer
+    record_title_check('llm')
     prompt = f"""
     You will be given the current section title and the current page_text.
     Your job is to check if the current section starts in the beginning of the given page_text.
@@ -254,6 +426,7 @@ async def check_title_appearance_in_start(title, page_text, model=None, logger=N
         logger.info(f"Response: {response}")
     return response.get("start_begin", "no")
 
+@profile_stage('check_title_appearance_in_start_concurrent')
 async def check_title_appearance_in_start_concurrent(structure, page_list, model=None, logger=None):
     if logger:
         logger.info("Checking title appearance in start concurrently")
@@ -269,7 +442,9 @@ async def check_title_appearance_in_start_concurrent(structure, page_list, model
                 page_text = page_list[idx - 1][0]
                 tasks.append(check_title_appearance_in_start(item['title'], page_text, model=model, logger=logger))
                 valid_items.append(item)
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    with count_title_checks() as counts:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    print(f"[INFO] Title start check: {counts['local']} local, {counts['llm']} LLM")
     for item, result in zip(valid_items, results):
         if isinstance(result, Exception):
             if logger:
@@ -295,6 +470,73 @@ def toc_detector_single_page(content, model=None):
     json_content = ensure_dict_result(json_content)
     return json_content.get('toc_detected', 'no')
 
+TOC_DETECT_PAGE_CHARS = 3000
+TOC_DETECT_MAX_WORKERS = 8
+NO_TOC_MAX_WORKERS = 8
+
+def toc_detector_multi_page(pages, model=None):
+    """
+    一次调用判断一个窗口内的多页是否为目录页。
+    pages: [(page_index, text), ...]，返回 {page_index: 'yes'/'no'}；模型漏答的页不出现在结果中。
+    """
+    content = ''.join(f"<page_{i}>\n{text[:TOC_DETECT_PAGE_CHARS]}\n</page_{i}>\n" for i, text in pages)
+    prompt = f"""
+    Your job is to detect, for each page below, if there is a table of content in that page.
+    Each page is wrapped in <page_X> and </page_X> tags, X is the page index.
+    Given pages: {content}
+    return the following JSON format:
+    {{
+        "thinking": <which pages contain a table of content and why>
+        "toc_pages": {{"<page index X>": "<yes or no>", ...}}
+    }}
+    Answer every page. Directly return the final JSON structure. Do not output anything else.
+    Please note: abstract,summary, notation list, figure list, table list, etc. are not table of contents."""
+    response = ChatGPT_API(model=model, prompt=prompt)
+    json_content = ensure_dict_result(extract_json(response))
+    raw = json_content.get('toc_pages', {})
+    wanted = {i for i, _ in pages}
+    result = {}
+    if isinstance(raw, dict):
+        for key, value in raw.items():
+            m = re.search(r'\d+', str(key))
+            value = str(value).strip().lower()
+            if m and int(m.group()) in wanted and value in ('yes', 'no'):
+                result[int(m.group())] = value
+    return result
+
+def detect_toc_pages(indices, page_list, opt, logger=None):
+    """
+    对一批页并发做目录检测，返回 {page_index: 'yes'/'no'}。
+    batch 模式：每 toc_detect_batch_size 页一次调用，各窗口并发；
+    concurrent 模式或批量结果缺页时：单页检测并发扇出。单页调用失败的页记为 'no'。
+    """
+    mode = getattr(opt, 'toc_detect_mode', 'batch')
+    results = {}
+    if getattr(opt, 'toc_heuristic', 'yes') == 'yes':
+        results, indices = heuristic_toc_labels(indices, page_list)
+        print(f'[INFO] Heuristic toc detection decided {len(results)} pages, {len(indices)} left for LLM.')
+        if not indices: return results
+    with ThreadPoolExecutor(max_workers=TOC_DETECT_MAX_WORKERS) as executor:
+        if mode == 'batch':
+            size = int(getattr(opt, 'toc_detect_batch_size', 10) or 10)
+            windows = [indices[k:k + size] for k in range(0, len(indices), size)]
+            futures = [executor.submit(bind_context(toc_detector_multi_page, [(i, page_list[i][0]) for i in w], opt.model)) for w in windows]
+            for future in futures:
+                try: results.update(future.result())
+                except Exception as e:
+                    if logger: logger.error(f'Batched toc detection failed: {e}')
+        missing = [i for i in indices if i not in results]
+        if missing:
+            if mode == 'batch': print(f'[INFO] Batched toc detection missed {len(missing)} pages, checking them one by one.')
+            futures = [executor.submit(bind_context(toc_detector_single_page, page_list[i][0], model=opt.model)) for i in missing]
+            for i, future in zip(missing, futures):
+                # 与批量路径一致：单页调用失败按"不是目录页"处理，不中断整个检测
+                try: results[i] = future.result()
+                except Exception as e:
+                    if logger: logger.error(f'Toc detection failed for page {i}: {e}')
+                    results[i] = 'no'
+    return results
+
 def check_if_toc_extraction_is_complete(content, toc, model=None):
     prompt = f"""
     You are given a partial document and a table of contents.
@@ -419,12 +661,41 @@ def toc_transformer(toc_content, model=None):
 
 def find_toc_pages(start_page_index, page_list, opt, logger=None):
     print('start find_toc_pages')
+    if getattr(opt, 'toc_detect_mode', 'batch') == 'sequential':
+        return find_toc_pages_sequential(start_page_index, page_list, opt, logger)
+
+    # 先并发检测 [start, toc_check_page_num) 整个窗口，再按"连续目录页"规则取第一段；
+    # 若目录一直延续到窗口末尾，则继续向后检测下一个窗口
+    toc_page_list = []
+    extend_size = int(getattr(opt, 'toc_detect_batch_size', 10) or 10)
+    window_end = min(max(start_page_index, opt.toc_check_page_num), len(page_list))
+    indices = list(range(start_page_index, window_end))
+    while indices:
+        detected = detect_toc_pages(indices, page_list, opt, logger)
+        for i in indices:
+            if detected.get(i) == 'yes':
+                if logger: logger.info(f'Page {i} has toc')
+                toc_page_list.append(i)
+            elif toc_page_list:
+                if logger: logger.info(f'Found the last page with toc: {i-1}')
+                return toc_page_list
+        if not toc_page_list: break
+        next_start = indices[-1] + 1
+        indices = list(range(next_start, min(next_start + extend_size, len(page_list))))
+    if not toc_page_list and logger: logger.info('No toc found')
+    return toc_page_list
+
+def find_toc_pages_sequential(start_page_index, page_list, opt, logger=None):
     last_page_is_yes = False
     toc_page_list = []
     i = start_page_index
     while i < len(page_list):
         if i >= opt.toc_check_page_num and not last_page_is_yes: break
-        detected_result = toc_detector_single_page(page_list[i][0],model=opt.model)
+        detected_result = None
+        if getattr(opt, 'toc_heuristic', 'yes') == 'yes':
+            detected_result = classify_toc_page(page_list[i][0])
+        if detected_result is None:
+            detected_result = toc_detector_single_page(page_list[i][0],model=opt.model)
         if detected_result == 'yes':
             if logger: logger.info(f'Page {i} has toc')
             toc_page_list.append(i)
@@ -561,7 +832,60 @@ def generate_toc_init(part, model=None):
     print("[WARNING] generate_toc_init failed. Returning empty list.")
     return []
 
-def process_no_toc(page_list, start_index=1, model=None, logger=None):
+def generate_toc_part(part, model=None):
+    print('start generate_toc_part')
+    prompt = """
+    You are an expert in extracting hierarchical tree structure.
+    You are given one part of a longer document; other parts are processed separately.
+    Your task is to extract the headings of the sections that start in this part.
+    Use the section numbering shown in the text for "structure" (e.g. "2.3") when it exists, otherwise use the relative level (e.g. "1", "1.1").
+    The response should be in the following format. 
+        [ {{ "structure": "...", "title": "...", "physical_index": "<physical_index_X>" }}, ],
+    Directly return the final JSON structure. Do not output anything else."""
+    prompt = prompt + '\nGiven text\n:' + part
+    response, finish_reason = ChatGPT_API_with_finish_reason(model=model, prompt=prompt)
+    if finish_reason == 'finished': return extract_json(response)
+    print("[WARNING] generate_toc_part failed. Returning empty list.")
+    return []
+
+def _normalize_title(title):
+    return re.sub(r'\s+', ' ', str(title or '')).strip().lower()
+
+def reconcile_toc_parts(parts):
+    """
+    合并各分组独立抽取的目录：按 physical_index 排序、去掉重叠页上的重复标题，
+    再按层级深度重新编号 structure，保证全局唯一且父子关系连续。
+    """
+    merged, seen = [], set()
+    for part in parts:
+        if not isinstance(part, list): continue
+        for item in convert_physical_index_to_int([i for i in part if isinstance(i, dict)]):
+            if item.get('physical_index') is None or not item.get('title'): continue
+            key = (_normalize_title(item['title']), item['physical_index'])
+            if key in seen: continue
+            seen.add(key)
+            merged.append(item)
+    merged.sort(key=lambda item: item['physical_index'])
+
+    counters = []
+    for item in merged:
+        depth = len([p for p in str(item.get('structure') or '1').split('.') if p.strip()]) or 1
+        depth = min(depth, len(counters) + 1)
+        counters = counters[:depth]
+        if len(counters) < depth: counters.append(0)
+        counters[-1] += 1
+        item['structure'] = '.'.join(str(c) for c in counters)
+    return merged
+
+def process_no_toc_parallel(group_texts, model=None, logger=None):
+    """map: 各分组并发抽取标题；reduce: 本地 reconcile，不再串行依赖上一组的结果"""
+    with ThreadPoolExecutor(max_workers=min(NO_TOC_MAX_WORKERS, len(group_texts))) as executor:
+        futures = [executor.submit(bind_context(generate_toc_part, text, model)) for text in group_texts]
+        parts = [future.result() for future in futures]
+    if logger: logger.info(f'generate_toc_part: {parts}')
+    return reconcile_toc_parts(parts)
+
+def process_no_toc(page_list, start_index=1, model=None, logger=None, mode='parallel'):
     page_contents=[]
     token_lengths=[]
     for page_index in range(start_index, start_index+len(page_list)):
@@ -570,6 +894,8 @@ def process_no_toc(page_list, start_index=1, model=None, logger=None):
         token_lengths.append(count_tokens(page_text, model))
     group_texts = page_list_to_group_text(page_contents, token_lengths)
     if logger: logger.info(f'len(group_texts): {len(group_texts)}')
+    if mode == 'parallel' and len(group_texts) > 1:
+        return process_no_toc_parallel(group_texts, model=model, logger=logger)
     toc_with_page_number = generate_toc_init(group_texts[0], model)
     if not isinstance(toc_with_page_number, list): toc_with_page_number = []
     for group_text in group_texts[1:]:
@@ -581,11 +907,21 @@ def process_no_toc(page_list, start_index=1, model=None, logger=None):
     if logger: logger.info(f'convert_physical_index_to_int: {toc_with_page_number}')
     return toc_with_page_number
 
-def process_toc_no_page_numbers(toc_content, toc_page_list, page_list,  start_index=1, model=None, logger=None):
+def process_toc_no_page_numbers(toc_content, toc_page_list, page_list,  start_index=1, model=None, logger=None, local_align=True):
     page_contents=[]
     token_lengths=[]
     toc_content = toc_transformer(toc_content, model)
     if logger: logger.info(f'toc_transformer: {toc_content}')
+    if local_align and isinstance(toc_content, list) and toc_content:
+        aligner = TocAligner(page_list, start_index, exclude_pages=[i + start_index for i in toc_page_list])
+        aligned = copy.deepcopy(toc_content)
+        first_page = toc_page_list[-1] + start_index + 1 if toc_page_list else None
+        coverage = aligner.align_monotonic(aligned, first_page=first_page)
+        print(f'[INFO] Local alignment placed {coverage:.0%} of toc items.')
+        if coverage >= LOCAL_ALIGN_MIN_COVERAGE:
+            toc_with_page_number = process_none_page_numbers(aligned, page_list, start_index=start_index, model=model, aligner=aligner)
+            if logger: logger.info(f'local_alignment: {toc_with_page_number}')
+            return toc_with_page_number
     for page_index in range(start_index, start_index+len(page_list)):
         page_text = f"<physical_index_{page_index}>\n{page_list[page_index-start_index][0]}\n<physical_index_{page_index}>\n\n"
         page_contents.append(page_text)
@@ -600,30 +936,36 @@ def process_toc_no_page_numbers(toc_content, toc_page_list, page_list,  start_in
     if logger: logger.info(f'convert_physical_index_to_int: {toc_with_page_number}')
     return toc_with_page_number
 
-def process_toc_with_page_numbers(toc_content, toc_page_list, page_list, toc_check_page_num=None, model=None, logger=None):
+def process_toc_with_page_numbers(toc_content, toc_page_list, page_list, toc_check_page_num=None, model=None, logger=None, local_align=True):
     toc_with_page_number = toc_transformer(toc_content, model)
     if logger: logger.info(f'toc_with_page_number: {toc_with_page_number}')
-    toc_no_page_number = remove_page_number(copy.deepcopy(toc_with_page_number))
     start_page_index = toc_page_list[-1] + 1
-    main_content = ""
-    for page_index in range(start_page_index, min(start_page_index + toc_check_page_num, len(page_list))):
-        if page_index < len(page_list):
-            main_content += f"<physical_index_{page_index+1}>\n{page_list[page_index][0]}\n<physical_index_{page_index+1}>\n\n"
-    toc_with_physical_index = toc_index_extractor(toc_no_page_number, main_content, model)
-    if logger: logger.info(f'toc_with_physical_index: {toc_with_physical_index}')
-    toc_with_physical_index = convert_physical_index_to_int(toc_with_physical_index)
-    if logger: logger.info(f'toc_with_physical_index: {toc_with_physical_index}')
-    matching_pairs = extract_matching_page_pairs(toc_with_page_number, toc_with_physical_index, start_page_index)
-    if logger: logger.info(f'matching_pairs: {matching_pairs}')
-    offset = calculate_page_offset(matching_pairs)
+    aligner = TocAligner(page_list, exclude_pages=[i + 1 for i in toc_page_list]) if local_align else None
+    offset = aligner.estimate_offset(toc_with_page_number) if aligner else None
+    if offset is not None:
+        print(f'[INFO] Local alignment voted page offset {offset}, skipping toc_index_extractor.')
+    else:
+        toc_no_page_number = remove_page_number(copy.deepcopy(toc_with_page_number))
+        main_content = ""
+        for page_index in range(start_page_index, min(start_page_index + toc_check_page_num, len(page_list))):
+            if page_index < len(page_list):
+                main_content += f"<physical_index_{page_index+1}>\n{page_list[page_index][0]}\n<physical_index_{page_index+1}>\n\n"
+        toc_with_physical_index = toc_index_extractor(toc_no_page_number, main_content, model)
+        if logger: logger.info(f'toc_with_physical_index: {toc_with_physical_index}')
+        toc_with_physical_index = convert_physical_index_to_int(toc_with_physical_index)
+        if logger: logger.info(f'toc_with_physical_index: {toc_with_physical_index}')
+        matching_pairs = extract_matching_page_pairs(toc_with_page_number, toc_with_physical_index, start_page_index)
+        if logger: logger.info(f'matching_pairs: {matching_pairs}')
+        offset = calculate_page_offset(matching_pairs)
     if logger: logger.info(f'offset: {offset}')
     toc_with_page_number = add_page_offset_to_toc_json(toc_with_page_number, offset)
     if logger: logger.info(f'toc_with_page_number: {toc_with_page_number}')
-    toc_with_page_number = process_none_page_numbers(toc_with_page_number, page_list, model=model)
+    toc_with_page_number = process_none_page_numbers(toc_with_page_number, page_list, model=model, aligner=aligner)
     if logger: logger.info(f'toc_with_page_number: {toc_with_page_number}')
     return toc_with_page_number
 
-def process_none_page_numbers(toc_items, page_list, start_index=1, model=None):
+def process_none_page_numbers(toc_items, page_list, start_index=1, model=None, aligner=None):
+    local_count = 0
     for i, item in enumerate(toc_items):
         if "physical_index" not in item:
             prev_physical_index = 0
@@ -636,6 +978,13 @@ def process_none_page_numbers(toc_items, page_list, start_index=1, model=None):
                 if toc_items[j].get('physical_index') is not None:
                     next_physical_index = toc_items[j]['physical_index']
                     break
+            if aligner:
+                local_index = aligner.place_between(item.get('title'), prev_physical_index, next_physical_index)
+                if local_index is not None:
+                    item['physical_index'] = local_index
+                    item.pop('page', None)
+                    local_count += 1
+                    continue
             page_contents = []
             for page_index in range(prev_physical_index, next_physical_index+1):
                 list_index = page_index - start_index
@@ -651,8 +1000,10 @@ def process_none_page_numbers(toc_items, page_list, start_index=1, model=None):
                 if isinstance(res_item.get('physical_index'), str) and res_item['physical_index'].startswith('<physical_index'):
                     item['physical_index'] = int(res_item['physical_index'].split('_')[-1].rstrip('>').strip())
                     if 'page' in item: del item['page']
+    if local_count: print(f'[INFO] Local alignment placed {local_count} unnumbered toc items.')
     return toc_items
 
+@profile_stage('check_toc')
 def check_toc(page_list, opt=None):
     toc_page_list = find_toc_pages(start_page_index=0, page_list=page_list, opt=opt)
     if len(toc_page_list) == 0:
@@ -755,6 +1106,7 @@ async def fix_incorrect_toc(toc_with_page_number, page_list, incorrect_results,
         else: invalid_results.append(result)
     return toc_with_page_number, invalid_results
 
+@profile_stage('fix_incorrect_toc_with_retries')
 async def fix_incorrect_toc_with_retries(toc_with_page_number, page_list, incorrect_results, start_index=1, max_attempts=3, model=None, logger=None):
     print('start fix_incorrect_toc')
     fix_attempt = 0
@@ -769,6 +1121,16 @@ async def fix_incorrect_toc_with_retries(toc_with_page_number, page_list, incorr
             break
     return current_toc, current_incorrect
 
+# verify_toc_sequential：meta_processor 在准确率 > VERIFY_FIX_THRESHOLD 时修复，否则回退到下一种模式
+VERIFY_FIX_THRESHOLD = 0.6
+# 没有发现错误时，整体准确率的置信下界达到该值即接受，不再检查剩余条目
+VERIFY_ACCEPT_LOWER = 0.95
+VERIFY_SAMPLE_BATCH = 8
+# 整个序贯检查的总置信水平（双侧 95%）；每次中途检查用 sequential_z 分摊后的更严格 z
+VERIFY_CONFIDENCE_Z = 1.96
+VERIFY_SAMPLE_SEED = 0
+
+@profile_stage('verify_toc')
 async def verify_toc(page_list, list_result, start_index=1, N=None, model=None):
     print('start verify_toc')
     last_physical_index = None
@@ -791,8 +1153,9 @@ async def verify_toc(page_list, list_result, start_index=1, N=None, model=None):
             item_with_index = item.copy()
             item_with_index['list_index'] = idx
             indexed_sample_list.append(item_with_index)
-    tasks = [check_title_appearance(item, page_list, start_index, model) for item in indexed_sample_list]
-    results = await asyncio.gather(*tasks)
+    with count_title_checks() as counts:
+        results = await asyncio.gather(*[check_title_appearance(item, page_list, start_index, model) for item in indexed_sample_list])
+    print(f"[INFO] Title appearance check: {counts['local']} local, {counts['llm']} LLM")
     correct_count = 0
     incorrect_results = []
     for result in results:
@@ -803,25 +1166,116 @@ async def verify_toc(page_list, list_result, start_index=1, N=None, model=None):
     print(f"accuracy: {accuracy*100:.2f}%")
     return accuracy, incorrect_results
 
+def sequential_z(looks, z=VERIFY_CONFIDENCE_Z):
+    """
+    alpha 均分（Bonferroni）：z 对应的总 alpha 平均分给最多 looks 次中途检查，返回每次检查用的 z。
+    每次检查的错误率 <= alpha / looks，所以不论在第几次停下，整体错误率仍 <= alpha。
+    """
+    alpha = 2 * (1 - NormalDist().cdf(z))
+    return NormalDist().inv_cdf(1 - alpha / (2 * max(1, looks)))
+
+def wilson_interval(successes, n, z=VERIFY_CONFIDENCE_Z):
+    if n == 0: return 0.0, 1.0
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+@profile_stage('verify_toc')
+async def verify_toc_sequential(page_list, list_result, start_index=1, model=None, logger=None):
+    """
+    verify_toc 的序贯抽样版本，返回值相同，供 meta_processor 在 1.0 / VERIFY_FIX_THRESHOLD 两个阈值间做决定。
+    本地就能判断的条目全部先算（不耗 LLM）；需要 LLM 的条目随机分批检查，每批后用 Wilson 区间估计整体准确率：
+      - 上界 <= VERIFY_FIX_THRESHOLD：准确率显然过低，提前停止，回退到下一种模式；
+      - 已发现错误且下界 > VERIFY_FIX_THRESHOLD：需要修复，检查剩余全部条目以找出所有错误；
+      - 没有错误且下界 >= VERIFY_ACCEPT_LOWER：接受，未抽到的条目不再检查。
+    重复查看会放大错误率，两个提前停止规则分别处理：
+      - 回退规则每批之后都要判断，上界用 sequential_z(最多检查次数)：总 alpha 在各次检查间均分（Bonferroni），
+        无论在哪一批停下，误回退的概率都不超过名义水平；
+      - 接受规则要求迄今没有任何错误，而零错误时下界随样本数单调上升，所以它等价于一次事先确定的检查：
+        先算出最小样本数 accept_n（零错误、VERIFY_CONFIDENCE_Z 下界达到 VERIFY_ACCEPT_LOWER 所需的 LLM 检查数），
+        只在检查数达到 accept_n 时判断一次，不存在多次查看的问题。
+    """
+    print('start verify_toc (sequential)')
+    indexed = [{**item, 'list_index': idx} for idx, item in enumerate(list_result) if item.get('physical_index') is not None]
+    if not indexed: return 0, []
+    local_results, pending = [], []
+    for item in indexed:
+        result = check_title_appearance_local(item, page_list, start_index)
+        if result is None: pending.append(item)
+        else: local_results.append(result)
+    random.Random(VERIFY_SAMPLE_SEED).shuffle(pending)
+
+    total, llm_total = len(indexed), len(pending)
+    local_correct = sum(1 for r in local_results if r['answer'] == 'yes')
+    incorrect_results = [r for r in local_results if r['answer'] != 'yes']
+    llm_correct, checked = 0, 0
+    decision = 'exact'
+    look_z = sequential_z(math.ceil(llm_total / VERIFY_SAMPLE_BATCH))
+    # 提前接受前至少要检查的 LLM 条目数（按批取整）；达不到时只能全部检查
+    accept_n = next((n for n in range(VERIFY_SAMPLE_BATCH, llm_total, VERIFY_SAMPLE_BATCH)
+                     if (local_correct + wilson_interval(n, n)[0] * llm_total) / total >= VERIFY_ACCEPT_LOWER), None)
+    while checked < llm_total:
+        # 未检查的条目按区间端点计入；一个都没查时区间为 [0, 1]，即最坏 / 最好情况
+        lo = wilson_interval(llm_correct, checked)[0]
+        hi = wilson_interval(llm_correct, checked, look_z)[1]
+        overall_lo = (local_correct + lo * llm_total) / total
+        overall_hi = (local_correct + hi * llm_total) / total
+        if overall_hi <= VERIFY_FIX_THRESHOLD:
+            decision = 'fallback'
+            break
+        if not incorrect_results and accept_n is not None and checked >= accept_n:
+            decision = 'accept'
+            break
+        # 需要修复时必须找出全部错误条目，一次检查完剩余部分
+        if incorrect_results and overall_lo > VERIFY_FIX_THRESHOLD:
+            batch = pending[checked:]
+        else:
+            batch = pending[checked:checked + VERIFY_SAMPLE_BATCH]
+        results = await asyncio.gather(*[check_title_appearance(item, page_list, start_index, model) for item in batch])
+        checked += len(batch)
+        for result in results:
+            if result['answer'] == 'yes': llm_correct += 1
+            else: incorrect_results.append(result)
+
+    # 分层估计：本地条目是精确值，LLM 条目按样本比例外推
+    llm_rate = llm_correct / checked if checked else 1.0
+    accuracy = (local_correct + llm_rate * llm_total) / total
+    print(f"[INFO] Sequential TOC verification: {checked}/{llm_total} LLM checks, {len(local_results)} local, "
+          f"decision={decision}, accuracy: {accuracy*100:.2f}%")
+    if logger: logger.info({'verify_toc': 'sequential', 'items': total, 'local_checks': len(local_results),
+                            'llm_checks': checked, 'llm_pending': llm_total, 'decision': decision, 'accuracy': accuracy})
+    return accuracy, incorrect_results
+
 async def meta_processor(page_list, mode=None, toc_content=None, toc_page_list=None, start_index=1, opt=None, logger=None):
+    # 每种模式单独统计；回退到下一种模式时记在新模式名下
+    with stage(f'meta_processor:{mode}'):
+        return await _meta_processor(page_list, mode, toc_content, toc_page_list, start_index, opt, logger)
+
+async def _meta_processor(page_list, mode=None, toc_content=None, toc_page_list=None, start_index=1, opt=None, logger=None):
     print(mode)
     print(f'start_index: {start_index}')
+    local_align = getattr(opt, 'if_local_toc_align', 'yes') == 'yes'
     if mode == 'process_toc_with_page_numbers':
-        toc_with_page_number = process_toc_with_page_numbers(toc_content, toc_page_list, page_list, toc_check_page_num=opt.toc_check_page_num, model=opt.model, logger=logger)
+        toc_with_page_number = process_toc_with_page_numbers(toc_content, toc_page_list, page_list, toc_check_page_num=opt.toc_check_page_num, model=opt.model, logger=logger, local_align=local_align)
     elif mode == 'process_toc_no_page_numbers':
-        toc_with_page_number = process_toc_no_page_numbers(toc_content, toc_page_list, page_list, model=opt.model, logger=logger)
+        toc_with_page_number = process_toc_no_page_numbers(toc_content, toc_page_list, page_list, model=opt.model, logger=logger, local_align=local_align)
     else:
-        toc_with_page_number = process_no_toc(page_list, start_index=start_index, model=opt.model, logger=logger)
+        toc_with_page_number = process_no_toc(page_list, start_index=start_index, model=opt.model, logger=logger, mode=getattr(opt, 'no_toc_mode', 'parallel'))
             
     toc_with_page_number = [item for item in toc_with_page_number if item.get('physical_index') is not None] 
     toc_with_page_number = validate_and_truncate_physical_indices(toc_with_page_number, len(page_list), start_index=start_index, logger=logger)
-    accuracy, incorrect_results = await verify_toc(page_list, toc_with_page_number, start_index=start_index, model=opt.model)
+    if getattr(opt, 'toc_verify_mode', 'sequential') == 'sequential':
+        accuracy, incorrect_results = await verify_toc_sequential(page_list, toc_with_page_number, start_index=start_index, model=opt.model, logger=logger)
+    else:
+        accuracy, incorrect_results = await verify_toc(page_list, toc_with_page_number, start_index=start_index, model=opt.model)
     if logger: logger.info({'mode': 'process_toc_with_page_numbers', 'accuracy': accuracy, 'incorrect_results': incorrect_results})
     
     if accuracy == 1.0 and len(incorrect_results) == 0:
         return toc_with_page_number
     
-    if accuracy > 0.6 and len(incorrect_results) > 0:
+    if accuracy > VERIFY_FIX_THRESHOLD and len(incorrect_results) > 0:
         toc_with_page_number, incorrect_results = await fix_incorrect_toc_with_retries(toc_with_page_number, page_list, incorrect_results,start_index=start_index, max_attempts=3, model=opt.model, logger=logger)
         return toc_with_page_number
     else:
@@ -855,22 +1309,40 @@ async def process_large_node_recursively(node, page_list, opt=None, logger=None)
         await asyncio.gather(*tasks)
     return node
 
-async def tree_parser(page_list, opt, doc=None, logger=None):
-    check_toc_result = check_toc(page_list, opt)
-    if logger: logger.info(check_toc_result)
-    if check_toc_result.get("toc_content") and check_toc_result["toc_content"].strip() and check_toc_result["page_index_given_in_toc"] == "yes":
-        toc_with_page_number = await meta_processor(page_list, mode='process_toc_with_page_numbers', start_index=1, toc_content=check_toc_result['toc_content'], toc_page_list=check_toc_result['toc_page_list'], opt=opt, logger=logger)
-    else:
-        toc_with_page_number = await meta_processor(page_list, mode='process_no_toc', start_index=1, opt=opt, logger=logger)
-    toc_with_page_number = add_preface_if_needed(toc_with_page_number)
-    toc_with_page_number = await check_title_appearance_in_start_concurrent(toc_with_page_number, page_list, model=opt.model, logger=logger)
+async def tree_parser(page_list, opt, doc=None, logger=None, checkpoint=None):
+    checkpoint = checkpoint or StageCheckpoint()
+    if checkpoint.has('large_nodes'):
+        return checkpoint.load('large_nodes')
+
+    toc_with_page_number = checkpoint.load('meta_processor')
+    if toc_with_page_number is None:
+        check_toc_result = checkpoint.load('check_toc')
+        if check_toc_result is None:
+            check_toc_result = check_toc(page_list, opt)
+            checkpoint.save('check_toc', check_toc_result)
+        if logger: logger.info(check_toc_result)
+        if check_toc_result.get("toc_content") and check_toc_result["toc_content"].strip() and check_toc_result["page_index_given_in_toc"] == "yes":
+            toc_with_page_number = await meta_processor(page_list, mode='process_toc_with_page_numbers', start_index=1, toc_content=check_toc_result['toc_content'], toc_page_list=check_toc_result['toc_page_list'], opt=opt, logger=logger)
+        else:
+            toc_with_page_number = await meta_processor(page_list, mode='process_no_toc', start_index=1, opt=opt, logger=logger)
+        toc_with_page_number = add_preface_if_needed(toc_with_page_number)
+        toc_with_page_number = await check_title_appearance_in_start_concurrent(toc_with_page_number, page_list, model=opt.model, logger=logger)
+        checkpoint.save('meta_processor', toc_with_page_number)
     valid_toc_items = [item for item in toc_with_page_number if item.get('physical_index') is not None]
     toc_tree = post_processing(valid_toc_items, len(page_list))
-    tasks = [process_large_node_recursively(node, page_list, opt, logger=logger) for node in toc_tree]
-    await asyncio.gather(*tasks)
+    with stage('process_large_node_recursively'):
+        tasks = [process_large_node_recursively(node, page_list, opt, logger=logger) for node in toc_tree]
+        await asyncio.gather(*tasks)
+    checkpoint.save('large_nodes', toc_tree)
     return toc_tree
 
 def page_index_main(doc, opt=None):
+    # 缓存旁路和本地标题匹配开关只作用于本次运行（批量索引时多个文档在同一进程内并行）
+    with llm_cache_scope(getattr(opt, 'if_use_llm_cache', 'yes') == 'yes'), \
+         local_title_match_scope(getattr(opt, 'if_local_title_match', 'yes') == 'yes'):
+        return _page_index_main(doc, opt)
+
+def _page_index_main(doc, opt=None):
     logger = JsonLogger(doc)
     is_valid_pdf = (
         (isinstance(doc, str) and os.path.isfile(doc) and doc.lower().endswith(".pdf")) or 
@@ -879,23 +1351,58 @@ def page_index_main(doc, opt=None):
     if not is_valid_pdf:
         raise ValueError("Unsupported input type. Expected a PDF file path or BytesIO object.")
 
+    if getattr(opt, 'if_use_llm_cache', 'yes') == 'no':
+        print('[INFO] LLM response cache bypassed for this run.')
+
+    metrics = start_run(get_pdf_name(doc), emit_progress=getattr(opt, 'if_emit_metrics', 'yes') == 'yes')
+    checkpoint = StageCheckpoint(doc, opt, work_dir=getattr(opt, 'work_dir', None), resume=getattr(opt, 'resume', 'no') == 'yes')
+
     print('Parsing PDF...')
-    page_list = get_page_tokens(doc)
+    page_list = checkpoint.load('pages')
+    if page_list is not None:
+        page_list = [tuple(page) for page in page_list]
+    else:
+        with stage('extraction'):
+            page_list = get_page_tokens(doc, workers=getattr(opt, 'extract_workers', None))
+        if page_list: checkpoint.save('pages', page_list)
     
     if not page_list:
         print("[CRITICAL] No text extracted from PDF. Check if pdfplumber is installed and file is valid.")
+        logger.close()
         return {"error": "PDF extraction failed"}
 
+    # 页眉 / 页脚 / 页码去重：之后所有 prompt、节点正文和页哈希都基于清理后的文本，删除的行保存在结果中
+    removed_page_lines = {}
+    if getattr(opt, 'if_strip_headers_footers', 'yes') == 'yes':
+        with stage('page_cleanup'):
+            page_list, removed_page_lines = strip_repeated_lines(page_list, count_tokens)
+        if removed_page_lines:
+            print(f"[INFO] Stripped {sum(len(v) for v in removed_page_lines.values())} repeated header/footer lines "
+                  f"from {len(removed_page_lines)} pages.")
+            logger.info({'removed_page_lines': removed_page_lines})
+
     logger.info({'total_page_number': len(page_list)})
     logger.info({'total_token': sum([page[1] for page in page_list])})
 
+    page_hashes = get_page_hashes(page_list)
+    fingerprint = get_options_fingerprint(opt)
+    plan = None
+    if getattr(opt, 'incremental', 'no') == 'yes':
+        plan = plan_incremental_update(load_index_artifact(doc), page_list, page_hashes, fingerprint, opt.toc_check_page_num)
+        if plan is None: print('[INFO] Incremental update not applicable, running the full pipeline.')
+
     async def page_index_builder():
         structure = []
         doc_description = ""
+        completed = False
         
         try:
             # 1. Parse Structure
-            structure = await tree_parser(page_list, opt, doc=doc, logger=logger)
+            if plan:
+                structure = plan['structure']
+                print(f"[INFO] Incremental: reused the previous tree ({len(plan['changed_pages'])} changed pages).")
+            else:
+                structure = await tree_parser(page_list, opt, doc=doc, logger=logger, checkpoint=checkpoint)
             
             # 2. Add Node IDs
             if opt.if_add_node_id == 'yes':
@@ -911,14 +1418,23 @@ def page_index_main(doc, opt=None):
                 init_node_fields(structure)
                 try:
                     # UPDATED to use the fixed in-place function
-                    await generate_summaries_for_structure(structure, model=opt.model)
+                    with stage('summaries'):
+                        await generate_summaries_for_structure(structure, model=opt.model, checkpoint=checkpoint, reuse=plan['summaries'] if plan else None,
+                                                               batch_token_budget=int(getattr(opt, 'summary_batch_tokens', SUMMARY_BATCH_TOKEN_BUDGET) or 0),
+                                                               mode=getattr(opt, 'summary_mode', 'bottom_up'), page_list=page_list)
                 except Exception as e:
                     print(f"[ERROR] Summary generation failed: {e}")
 
             # 5. Generate Document Description (Robust Version + JSON FORCE)
             if opt.if_add_doc_description == 'yes':
-                 print("Generating document description...")
-                 doc_description = await generate_document_description(page_list, model=opt.model)
+                 doc_description = plan['doc_description'] if plan else None
+                 if doc_description is None: doc_description = checkpoint.load('description')
+                 if doc_description is None:
+                     print("Generating document description...")
+                     doc_description = await generate_document_description(page_list, model=opt.model)
+                     checkpoint.save('description', doc_description)
+            completed = True
+            save_index_artifact(doc, page_hashes, structure, doc_description, fingerprint)
 
         except Exception as e:
             print(f"\n[CRITICAL ERROR] Process interrupted: {e}")
@@ -933,6 +1449,8 @@ def page_index_main(doc, opt=None):
                 "doc_description": doc_description if doc_description else "Description failed or skipped.",
                 "structure": structure if structure else [{"title": "Extraction Failed / Empty", "nodes": []}]
             }
+            # pageindex.page_cleaner.restore_page_text 可据此还原原始页文本
+            if removed_page_lines: final_data["removed_page_lines"] = removed_page_lines
 
             pdf_name = get_pdf_name(doc)
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -940,15 +1458,22 @@ def page_index_main(doc, opt=None):
             os.makedirs("results", exist_ok=True)
             
             try:
-                with open(full_save_path, 'w', encoding='utf-8-sig') as f:
-                    json.dump(final_data, f, ensure_ascii=False, indent=2)
+                full_save_path = write_result_json(final_data, full_save_path,
+                                                   compact=getattr(opt, 'result_format', 'compact') == 'compact',
+                                                   compression=getattr(opt, 'result_compression', 'none'))
                 print(f"\n[SUCCESS] Data Saved (Complete or Partial): {os.path.abspath(full_save_path)}")
+                metrics.print_report()
+                metrics_data = metrics.save(os.path.join("results", f"{pdf_name}_{timestamp}_metrics.json"))
+                metrics.emit('run_end', 'Metrics', completed=completed, **metrics_data['totals'])
+                # 完整成功后检查点不再需要；中断时保留，供 --resume 续跑
+                if completed: checkpoint.clear()
             except Exception as e:
                 print(f"[ERROR] Failed to save result file: {e}")
 
             if opt.if_add_node_text == 'no':
                  remove_structure_text(final_data['structure'])
-            
+
+            logger.close()
             return final_data  
 
     return asyncio.run(page_index_builder())
@@ -0,0 +1,262 @@
+"""
+Markdown / DOCX / TXT 的结构化快速路径。
+
+这类文档的标题本身就是目录：不做 PDF 流程里的目录检测、目录转换和校验，
+直接从标题标记（DOCX 的标题样式、TXT 的编号 / 下划线标题）构建与 page_index_main 相同的
+structure（title / node_id / text / nodes，另带 line_num），构树阶段零 LLM 调用。
+DOCX 和 TXT 先转换成 Markdown，再复用 page_index_md 的 extract_nodes_from_markdown。
+摘要和文档描述可选，沿用 PDF 流程的批量摘要与描述生成。
+python-docx 为可选依赖，只有处理 .docx 时才需要。
+"""
+import os
+import re
+import asyncio
+from datetime import datetime
+
+try:
+    import docx
+    HAS_DOCX = True
+except ImportError:
+    HAS_DOCX = False
+
+from .utils import (
+    ConfigLoader, JsonLogger, get_pdf_name, count_tokens, write_node_id, format_structure,
+    remove_structure_text, iter_preorder, llm_cache_scope,
+)
+from .page_index import (
+    generate_summaries_for_structure, generate_document_description, init_node_fields,
+    SUMMARY_BATCH_TOKEN_BUDGET,
+)
+from .page_index_md import (
+    extract_nodes_from_markdown, extract_node_text_content, update_node_list_with_text_token_count,
+    tree_thinning_for_index, build_tree_from_nodes,
+)
+from .metrics import start_run, stage
+from .result_io import write_result_json
+
+DOC_EXTENSIONS = ('.md', '.markdown', '.docx', '.txt')
+DOC_NODE_ORDER = ['title', 'node_id', 'line_num', 'summary', 'text', 'nodes']
+# generate_document_description 读取的开头长度
+DESCRIPTION_CHARS = 6000
+
+DOCX_HEADING_STYLE = re.compile(r'^(?:heading|标题)\s*(\d)$', re.IGNORECASE)
+# TXT 标题："1 Introduction"、"2.3.1 Results"、"Chapter 4 ..."、"第三章 ..."、"第二节 ..."
+# 编号最多 3 位、编号后须是文字，避免把 "2023 revenue ..." 或数字表格行当成标题
+TXT_NUMBERED_HEADING = re.compile(r'^(\d{1,3}(?:\.\d{1,3}){0,5})\.?\s+([^\W\d_].*)$')
+TXT_NAMED_HEADING = re.compile(r'^(chapter|part|section|appendix)\s+[\dIVXLC]+\b', re.IGNORECASE)
+TXT_CJK_HEADING = re.compile(r'^第[一二三四五六七八九十百零〇\d]+([章篇部节])')
+TXT_SETEXT_UNDERLINE = re.compile(r'^(=+|-+)\s*$')
+TXT_HEADING_MAX_CHARS = 80
+SENTENCE_END = ('.', '。', ';', '；', ',', '，', ':', '：')
+ESCAPED_BODY_LINE = re.compile(r'^\\(?=#|```)', re.MULTILINE)
+
+
+def _escape_body_line(line):
+    # 正文里以 # 或 ``` 开头的行会被 extract_nodes_from_markdown 当成标题 / 代码块
+    stripped = line.lstrip()
+    return '\\' + stripped if stripped.startswith(('#', '```')) else line
+
+
+def docx_to_markdown(path):
+    """标题样式（Heading N / 标题 N / Title）转为 Markdown 标题，表格按行输出为 'a | b | c'"""
+    if not HAS_DOCX:
+        raise ImportError("python-docx is required for .docx input (pip install python-docx)")
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(path)
+    lines = []
+    for child in document.element.body.iterchildren():
+        tag = child.tag.rsplit('}', 1)[-1]
+        if tag == 'tbl':
+            for row in Table(child, document).rows:
+                cells = [cell.text.strip().replace('\n', ' ') for cell in row.cells]
+                if any(cells): lines.append(' | '.join(cells))
+            lines.append('')
+            continue
+        if tag != 'p': continue
+        paragraph = Paragraph(child, document)
+        text = paragraph.text.strip()
+        if not text: continue
+        style = paragraph.style.name if paragraph.style is not None else ''
+        match = DOCX_HEADING_STYLE.match(style)
+        if style.lower() == 'title':
+            lines.append(f"# {text}")
+        elif match:
+            lines.append(f"{'#' * min(max(int(match.group(1)), 1), 6)} {text}")
+        else:
+            lines.extend(_escape_body_line(line) for line in paragraph.text.splitlines())
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def _txt_heading_level(line):
+    if len(line) > TXT_HEADING_MAX_CHARS or line.endswith(SENTENCE_END): return None
+    match = TXT_NUMBERED_HEADING.match(line)
+    if match: return min(match.group(1).count('.') + 1, 6)
+    match = TXT_CJK_HEADING.match(line)
+    if match: return 2 if match.group(1) == '节' else 1
+    if TXT_NAMED_HEADING.match(line): return 2 if line.lower().startswith('section') else 1
+    return None
+
+
+def _continues_list(number, dotted, list_item):
+    """number 是否是上一个列表项 list_item 的下一项（同样的编号写法，编号 +1）"""
+    if list_item is None: return False
+    prev_number, prev_dotted = list_item
+    return (dotted == prev_dotted and len(number) == len(prev_number)
+            and number[:-1] == prev_number[:-1] and number[-1] == prev_number[-1] + 1)
+
+
+def text_to_markdown(text):
+    """
+    纯文本按行识别标题：已有的 Markdown 标题保留；'===' / '---' 下划线标题为 1 / 2 级；
+    编号标题按编号层数定级；"第X章/节"、"Chapter/Part/Section N" 也视为标题。
+    过长或以句末标点结尾的行不当作标题。
+    编号行的编号还必须大于上一个编号标题（按层逐级比较，1 < 1.1 < 1.2 < 2），否则是正文里的编号列表，
+    例如 "1 Introduction" 之后的 "1. Open the file"；列表的后续项（同样写法、编号 +1）也按正文处理。
+    """
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    out = []
+    last_number, list_item = None, None
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        next_line = lines[i + 1].strip() if i + 1 < len(lines) else ''
+        if line and not line.startswith('#') and TXT_SETEXT_UNDERLINE.match(next_line) and len(line) <= TXT_HEADING_MAX_CHARS:
+            out.append(f"{'#' if next_line.startswith('=') else '##'} {line}")
+            i += 2
+            continue
+        level = _txt_heading_level(line) if line else None
+        numbered = TXT_NUMBERED_HEADING.match(line) if level else None
+        if numbered:
+            number = tuple(int(part) for part in numbered.group(1).split('.'))
+            dotted = line[len(numbered.group(1)):].startswith('.')
+            if _continues_list(number, dotted, list_item) or (last_number is not None and number <= last_number):
+                level, list_item = None, (number, dotted)
+            else:
+                last_number, list_item = number, None
+        if level:
+            out.append(f"{'#' * level} {line}")
+        elif line.startswith('```'):
+            out.append('\\' + line)
+        else:
+            out.append(lines[i])
+        i += 1
+    return '\n'.join(out)
+
+
+def load_document_markdown(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.docx':
+        return docx_to_markdown(path)
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        content = f.read()
+    return content if ext in ('.md', '.markdown') else text_to_markdown(content)
+
+
+def build_doc_structure(markdown_content, doc_title, min_node_tokens=0, unescape=False):
+    """
+    Markdown -> PageIndex structure。第一个标题之前的内容单独成为 Preface 节点，
+    完全没有标题时整篇文档是一个以文档名为标题的节点。min_node_tokens > 0 时合并过小的子树。
+    unescape=True 时去掉 DOCX / TXT 转换时给正文行加的转义反斜杠。
+    """
+    node_list, markdown_lines = extract_nodes_from_markdown(markdown_content)
+    nodes = extract_node_text_content(node_list, markdown_lines)
+
+    first_line = nodes[0]['line_num'] if nodes else len(markdown_lines) + 1
+    preface = '\n'.join(markdown_lines[:first_line - 1]).strip()
+    if preface:
+        level = min(node['level'] for node in nodes) if nodes else 1
+        title = 'Preface' if nodes else doc_title
+        nodes.insert(0, {'title': title, 'line_num': 1, 'level': level, 'text': preface})
+
+    if min_node_tokens:
+        nodes = update_node_list_with_text_token_count(nodes)
+        nodes = tree_thinning_for_index(nodes, min_node_tokens)
+
+    structure = build_tree_from_nodes(nodes)
+    # 与 PDF 结果一致：叶子节点不带空的 nodes
+    for node in iter_preorder(structure):
+        if not node['nodes']: del node['nodes']
+        if unescape: node['text'] = ESCAPED_BODY_LINE.sub('', node['text'])
+    return structure
+
+
+def doc_index_main(doc, opt=None):
+    """
+    page_index_main 的 MD / DOCX / TXT 版本：结果同样写到 results/<文件名>_<时间戳>.json 并返回。
+    opt 使用与 PDF 流程相同的选项（if_add_node_summary / if_add_doc_description / if_add_node_text ...），
+    另外 min_node_tokens > 0 时合并过小的章节。
+    """
+    opt = opt or ConfigLoader().load()
+    if not (isinstance(doc, str) and os.path.isfile(doc) and doc.lower().endswith(DOC_EXTENSIONS)):
+        raise ValueError(f"Unsupported input. Expected a file ending with one of: {', '.join(DOC_EXTENSIONS)}")
+    logger = JsonLogger(doc)
+
+    if getattr(opt, 'if_use_llm_cache', 'yes') == 'no':
+        print('[INFO] LLM response cache bypassed for this run.')
+    doc_name = get_pdf_name(doc)
+    metrics = start_run(doc_name, emit_progress=getattr(opt, 'if_emit_metrics', 'yes') == 'yes')
+
+    print('Parsing document structure...')
+    with stage('structure'):
+        markdown_content = load_document_markdown(doc)
+        structure = build_doc_structure(markdown_content, os.path.splitext(doc_name)[0],
+                                        min_node_tokens=int(getattr(opt, 'min_node_tokens', 0) or 0),
+                                        unescape=not doc.lower().endswith(('.md', '.markdown')))
+    node_count = sum(1 for _ in iter_preorder(structure))
+    print(f"[INFO] {node_count} sections found from headings (no LLM calls).")
+    logger.info({'node_count': node_count, 'total_token': count_tokens(markdown_content, cache=False)})
+
+    async def doc_index_builder():
+        doc_description = ""
+        completed = False
+        try:
+            if opt.if_add_node_id == 'yes':
+                write_node_id(structure)
+            if opt.if_add_node_summary == 'yes':
+                print("Generating summaries...")
+                init_node_fields(structure)
+                with stage('summaries'):
+                    await generate_summaries_for_structure(structure, model=opt.model,
+                                                           batch_token_budget=int(getattr(opt, 'summary_batch_tokens', SUMMARY_BATCH_TOKEN_BUDGET) or 0),
+                                                           mode=getattr(opt, 'summary_mode', 'bottom_up'))
+            if opt.if_add_doc_description == 'yes':
+                print("Generating document description...")
+                doc_description = await generate_document_description([(markdown_content[:DESCRIPTION_CHARS], 0)], model=opt.model)
+            completed = True
+        except Exception as e:
+            print(f"\n[CRITICAL ERROR] Process interrupted: {e}")
+            print("[INFO] Attempting to save partial results...")
+            import traceback
+            traceback.print_exc()
+        finally:
+            order = DOC_NODE_ORDER if opt.if_add_node_id == 'yes' else [k for k in DOC_NODE_ORDER if k != 'node_id']
+            format_structure(structure, order=order)
+            final_data = {
+                "doc_name": doc_name,
+                "doc_description": doc_description if doc_description else "Description failed or skipped.",
+                "structure": structure if structure else [{"title": "Extraction Failed / Empty", "nodes": []}]
+            }
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            full_save_path = os.path.join("results", f"{doc_name}_{timestamp}.json")
+            os.makedirs("results", exist_ok=True)
+            try:
+                full_save_path = write_result_json(final_data, full_save_path,
+                                                   compact=getattr(opt, 'result_format', 'compact') == 'compact',
+                                                   compression=getattr(opt, 'result_compression', 'none'))
+                print(f"\n[SUCCESS] Data Saved (Complete or Partial): {os.path.abspath(full_save_path)}")
+                metrics.print_report()
+                metrics_data = metrics.save(os.path.join("results", f"{doc_name}_{timestamp}_metrics.json"))
+                metrics.emit('run_end', 'Metrics', completed=completed, **metrics_data['totals'])
+            except Exception as e:
+                print(f"[ERROR] Failed to save result file: {e}")
+
+            if opt.if_add_node_text == 'no':
+                remove_structure_text(final_data['structure'])
+            logger.close()
+            return final_data
+
+    with llm_cache_scope(getattr(opt, 'if_use_llm_cache', 'yes') == 'yes'):
+        return asyncio.run(doc_index_builder())
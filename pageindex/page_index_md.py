@@ -87,103 +87,54 @@ def extract_node_text_content(node_list, markdown_lines):
     return all_nodes
 
 def update_node_list_with_text_token_count(node_list, model=None):
+    """
+    text_token_count = tokens of the node's own text plus all of its descendants.
+    Single pass over a stack of open headers: each text is tokenized once and a closed
+    subtree adds its total to its parent, no combined text is built.
+    """
+    stack = []  # 尚未闭合的祖先节点，层级严格递增
 
-    def find_all_children(parent_index, parent_level, node_list):
-        """Find all direct and indirect children of a parent node"""
-        children_indices = []
-        
-        # Look for children after the parent
-        for i in range(parent_index + 1, len(node_list)):
-            current_level = node_list[i]['level']
-            
-            # If we hit a node at same or higher level than parent, stop
-            if current_level <= parent_level:
-                break
-                
-            # This is a descendant
-            children_indices.append(i)
-        
-        return children_indices
-    
-    # Make a copy to avoid modifying the original
-    result_list = node_list.copy()
-    
-    # Process nodes from end to beginning to ensure children are processed before parents
-    for i in range(len(result_list) - 1, -1, -1):
-        current_node = result_list[i]
-        current_level = current_node['level']
-        
-        # Get all children of this node
-        children_indices = find_all_children(i, current_level, result_list)
-        
-        # Start with the node's own text
-        node_text = current_node.get('text', '')
-        total_text = node_text
-        
-        # Add all children's text
-        for child_index in children_indices:
-            child_text = result_list[child_index].get('text', '')
-            if child_text:
-                total_text += '\n' + child_text
-        
-        # Calculate token count for combined text
-        result_list[i]['text_token_count'] = count_tokens(total_text, model=model)
-    
-    return result_list
+    def close_until(level):
+        while stack and stack[-1]['level'] >= level:
+            closed = stack.pop()
+            if stack: stack[-1]['text_token_count'] += closed['text_token_count']
+
+    for node in node_list:
+        close_until(node['level'])
+        node['text_token_count'] = count_tokens(node.get('text', ''), model=model)
+        stack.append(node)
+    close_until(0)
+    return node_list
 
 
 def tree_thinning_for_index(node_list, min_node_token=None, model=None):
-    def find_all_children(parent_index, parent_level, node_list):
-        children_indices = []
-        
-        for i in range(parent_index + 1, len(node_list)):
-            current_level = node_list[i]['level']
-            
-            if current_level <= parent_level:
-                break
-                
-            children_indices.append(i)
-        
-        return children_indices
-    
-    result_list = node_list.copy()
-    nodes_to_remove = set()
-    
-    for i in range(len(result_list) - 1, -1, -1):
-        if i in nodes_to_remove:
+    """
+    Merge every subtree below min_node_token tokens into its root node.
+    Descendants of a small node are smaller still, so only the top-most small node of each
+    branch absorbs text: one forward pass, each text appended once.
+    """
+    if min_node_token is None:
+        return node_list
+
+    result_list = []
+    merge_into, merge_level, merged_texts = None, None, []
+
+    def finish_merge():
+        if merge_into is not None and merged_texts:
+            merge_into['text'] = '\n\n'.join(t for t in [merge_into.get('text', '')] + merged_texts if t)
+
+    for node in node_list:
+        if merge_into is not None and node['level'] > merge_level:
+            child_text = node.get('text', '')
+            if child_text.strip():
+                merged_texts.append(child_text)
             continue
-            
-        current_node = result_list[i]
-        current_level = current_node['level']
-        
-        total_tokens = current_node.get('text_token_count', 0)
-        
-        if total_tokens < min_node_token:
-            children_indices = find_all_children(i, current_level, result_list)
-            
-            children_texts = []
-            for child_index in sorted(children_indices):
-                if child_index not in nodes_to_remove:
-                    child_text = result_list[child_index].get('text', '')
-                    if child_text.strip():
-                        children_texts.append(child_text)
-                    nodes_to_remove.add(child_index)
-            
-            if children_texts:
-                parent_text = current_node.get('text', '')
-                merged_text = parent_text
-                for child_text in children_texts:
-                    if merged_text and not merged_text.endswith('\n'):
-                        merged_text += '\n\n'
-                    merged_text += child_text
-                
-                result_list[i]['text'] = merged_text
-                
-                result_list[i]['text_token_count'] = count_tokens(merged_text, model=model)
-    
-    for index in sorted(nodes_to_remove, reverse=True):
-        result_list.pop(index)
-    
+        finish_merge()
+        merge_into, merge_level, merged_texts = None, None, []
+        if node.get('text_token_count', 0) < min_node_token:
+            merge_into, merge_level = node, node['level']
+        result_list.append(node)
+    finish_merge()
     return result_list
 
 
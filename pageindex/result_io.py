@@ -0,0 +1,108 @@
+"""
+PageIndex 结果文件的读写。
+
+写：json.JSONEncoder.iterencode 流式分块写盘，不先在内存里拼出整个字符串；
+    compact 模式去掉缩进和多余空白；可选 gzip / zstd 容器（zstd 需要 zstandard 包，缺失时退回 gzip）。
+    先写临时文件再替换，写到一半中断不会留下损坏的结果文件。
+读：按文件头魔数识别 gzip / zstd / 纯 JSON，与扩展名无关；兼容带 BOM 的旧结果文件。
+只依赖标准库（zstandard 可选），GUI / RAG 端可以直接导入。
+"""
+import io
+import os
+import json
+import gzip
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+RESULT_COMPRESSION_EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+RESULT_FILE_PATTERNS = "*.json *.json.gz *.json.zst"
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+WRITE_CHUNK_CHARS = 1 << 16
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+
+def resolve_result_compression(compression):
+    compression = (compression or 'none').lower()
+    if compression not in RESULT_COMPRESSION_EXTENSIONS:
+        print(f"[WARNING] Unknown result compression '{compression}', writing plain JSON.")
+        return 'none'
+    if compression == 'zstd' and not HAS_ZSTD:
+        print("[WARNING] zstandard is not installed, falling back to gzip.")
+        return 'gzip'
+    return compression
+
+
+def result_path_with_extension(path, compression):
+    """results/x.json + gzip -> results/x.json.gz"""
+    return path + RESULT_COMPRESSION_EXTENSIONS[resolve_result_compression(compression)]
+
+
+def _open_binary_writer(raw, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL)
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False)
+    return None
+
+
+def write_result_json(data, path, compact=True, compression=None):
+    """
+    流式写出结果 JSON，返回实际写入的路径（压缩时带 .gz / .zst 后缀）。
+    纯 JSON 保持 utf-8-sig（与旧结果文件一致）；压缩容器内为不带 BOM 的 utf-8。
+    """
+    compression = resolve_result_compression(compression)
+    path = path + RESULT_COMPRESSION_EXTENSIONS[compression]
+    encoder = json.JSONEncoder(ensure_ascii=False, indent=None if compact else 2,
+                               separators=(',', ':') if compact else None)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as raw:
+            compressor = _open_binary_writer(raw, compression)
+            text = io.TextIOWrapper(compressor or raw, encoding='utf-8' if compressor else 'utf-8-sig',
+                                    write_through=False)
+            buffer, size = [], 0
+            for chunk in encoder.iterencode(data):
+                buffer.append(chunk)
+                size += len(chunk)
+                if size >= WRITE_CHUNK_CHARS:
+                    text.write(''.join(buffer))
+                    buffer, size = [], 0
+            text.write(''.join(buffer))
+            text.flush()
+            text.detach()
+            if compressor: compressor.close()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+    return path
+
+
+def open_result_json(path):
+    """以文本流打开结果文件，自动识别 gzip / zstd"""
+    raw = open(path, 'rb')
+    head = raw.read(4)
+    raw.seek(0)
+    if head.startswith(GZIP_MAGIC):
+        # GzipFile(fileobj=...) 关闭时不会关闭 raw；gzip.open 自己打开的文件会随流一起关闭
+        raw.close()
+        stream = gzip.open(path, 'rb')
+    elif head.startswith(ZSTD_MAGIC):
+        if not HAS_ZSTD:
+            raw.close()
+            raise RuntimeError("This result file is zstd-compressed; install the 'zstandard' package to read it.")
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    else:
+        stream = raw
+    return io.TextIOWrapper(stream, encoding='utf-8-sig')
+
+
+def load_result_json(path):
+    with open_result_json(path) as f:
+        return json.load(f)
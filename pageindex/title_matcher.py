@@ -0,0 +1,121 @@
+"""
+本地模糊标题匹配：在调用 LLM 之前判断标题是否出现在页面中 / 是否位于页首。
+
+标题和页面文本先做归一化（NFKC、小写、去掉空白和标点，CJK 字符原样保留），
+再用近似子串编辑距离（Sellers 算法）打分。有把握时直接给出 yes/no，
+只有低置信度的条目才交给 check_title_appearance / check_title_appearance_in_start 的 LLM 提示词。
+"""
+import re
+import unicodedata
+import contextvars
+from contextlib import contextmanager
+
+MATCH_YES_SCORE = 0.85
+MATCH_NO_SCORE = 0.5
+MIN_TITLE_CHARS = 4
+# 页首判定：标题之前允许出现的归一化字符数（页码、罗马数字、短页眉）
+START_PREFIX_CHARS = 12
+# 标题之前已有这么多内容时，可以确定标题不在页首
+NOT_START_PREFIX_CHARS = 200
+
+_NON_WORD_PATTERN = re.compile(r'[\W_]+', re.UNICODE)
+_LEADING_NUMBER_PATTERN = re.compile(
+    r'^\s*((\d+(\.\d+)*|[ivxlc]+|[a-z])[\s.、:)]+|第[一二三四五六七八九十百零\d]+[章节篇部分条]\s*)', re.IGNORECASE)
+
+_local_match_enabled = True
+# 单次运行的开关：同一进程内并行处理多个文档时互不影响
+_local_match_bypass = contextvars.ContextVar('pageindex_local_title_match_bypass', default=False)
+
+
+def set_local_title_match_enabled(enabled):
+    """进程级开关，影响所有运行；单次运行请用 local_title_match_scope"""
+    global _local_match_enabled
+    _local_match_enabled = bool(enabled)
+
+
+@contextmanager
+def local_title_match_scope(enabled=True):
+    """with 块内（含 asyncio 任务和 bind_context 提交的线程）按 enabled 使用或跳过本地匹配，退出时恢复"""
+    token = _local_match_bypass.set(not enabled)
+    try:
+        yield
+    finally:
+        _local_match_bypass.reset(token)
+
+
+def is_local_title_match_enabled():
+    return _local_match_enabled and not _local_match_bypass.get()
+
+
+def normalize_for_match(text):
+    text = unicodedata.normalize('NFKC', str(text or '')).lower()
+    return _NON_WORD_PATTERN.sub('', text)
+
+
+def _title_variants(title):
+    variants = {normalize_for_match(title)}
+    stripped = _LEADING_NUMBER_PATTERN.sub('', str(title or ''), count=1)
+    if stripped != title: variants.add(normalize_for_match(stripped))
+    return [v for v in variants if v]
+
+
+def approximate_substring_match(pattern, text):
+    """
+    Sellers 算法：pattern 与 text 中任意子串的最小编辑距离。
+    返回 (distance, end)，end 为最佳匹配在 text 中的结束位置（不含）。
+    """
+    m = len(pattern)
+    if m == 0: return 0, 0
+    col = list(range(m + 1))
+    best, best_end = m, 0
+    for j, ch in enumerate(text, 1):
+        prev_diag, col[0] = col[0], 0
+        for i in range(1, m + 1):
+            current = col[i]
+            col[i] = min(current + 1, col[i - 1] + 1, prev_diag + (pattern[i - 1] != ch))
+            prev_diag = current
+        if col[m] < best:
+            best, best_end = col[m], j
+            if best == 0: break
+    return best, best_end
+
+
+def _bigram_overlap(pattern, text):
+    grams = {pattern[i:i + 2] for i in range(len(pattern) - 1)}
+    if not grams: return 1.0
+    return sum(1 for g in grams if g in text) / len(grams)
+
+
+def score_title_in_text(title, text):
+    """返回 (score, start)：score 在 [0, 1]，start 为最佳匹配在归一化文本中的起始位置"""
+    norm_text = normalize_for_match(text)
+    best_score, best_start = 0.0, None
+    for pattern in _title_variants(title):
+        pos = norm_text.find(pattern)
+        if pos >= 0: return 1.0, pos
+        # 二元组重合度太低时不可能高分，跳过逐字符 DP
+        if _bigram_overlap(pattern, norm_text) < MATCH_NO_SCORE * 0.6: continue
+        distance, end = approximate_substring_match(pattern, norm_text)
+        score = max(0.0, 1 - distance / len(pattern))
+        if score > best_score: best_score, best_start = score, max(0, end - len(pattern))
+    return best_score, best_start
+
+
+def match_title_appearance(title, page_text):
+    """标题是否出现在页面中：有把握返回 'yes' / 'no'，否则 None"""
+    if not is_local_title_match_enabled() or len(normalize_for_match(title)) < MIN_TITLE_CHARS: return None
+    score, _ = score_title_in_text(title, page_text)
+    if score >= MATCH_YES_SCORE: return 'yes'
+    if score < MATCH_NO_SCORE: return 'no'
+    return None
+
+
+def match_title_at_start(title, page_text):
+    """标题是否位于页首：有把握返回 'yes' / 'no'，否则 None"""
+    if not is_local_title_match_enabled() or len(normalize_for_match(title)) < MIN_TITLE_CHARS: return None
+    score, start = score_title_in_text(title, page_text)
+    if score < MATCH_NO_SCORE: return 'no'
+    if score >= MATCH_YES_SCORE:
+        if start <= START_PREFIX_CHARS: return 'yes'
+        if start >= NOT_START_PREFIX_CHARS: return 'no'
+    return None
@@ -0,0 +1,120 @@
+"""
+本地目录-物理页对齐引擎。
+
+对正文页建立字符 n-gram 倒排索引，用目录标题查询候选页，再用 title_matcher 的
+编辑距离打分确认。在此基础上：
+  - estimate_offset: 对带页码的目录条目按 (物理页 - 页码) 投票，得到页码偏移；
+  - place_between:   没有页码的条目在前后邻居的物理页之间定位；
+  - align_monotonic: 没有页码的整份目录按顺序单调对齐。
+无法确定的条目留给 toc_index_extractor / add_page_number_to_toc 的 LLM 调用。
+"""
+from collections import Counter, defaultdict
+
+from .title_matcher import normalize_for_match, approximate_substring_match, MATCH_YES_SCORE, MIN_TITLE_CHARS, START_PREFIX_CHARS
+
+NGRAM_SIZE = 3
+GRAM_COVERAGE = 0.7
+MAX_CANDIDATE_PAGES = 20
+OFFSET_MIN_VOTES = 3
+OFFSET_MIN_SUPPORT = 0.25
+LOCAL_ALIGN_MIN_COVERAGE = 0.6
+
+
+class TocAligner:
+    def __init__(self, page_list, start_index=1, exclude_pages=(), n=NGRAM_SIZE):
+        self.start_index = start_index
+        self.end_index = start_index + len(page_list) - 1
+        self.norm_pages = [normalize_for_match(page[0]) for page in page_list]
+        self.n = n
+        self.index = defaultdict(set)
+        exclude = set(exclude_pages)
+        for i, norm in enumerate(self.norm_pages):
+            physical_index = i + start_index
+            if physical_index in exclude: continue
+            for k in range(len(norm) - n + 1):
+                self.index[norm[k:k + n]].add(physical_index)
+
+    def candidates(self, title, lo=None, hi=None):
+        """返回标题可信出现的页 [(physical_index, score, start), ...]，按页序排列"""
+        pattern = normalize_for_match(title)
+        if len(pattern) < MIN_TITLE_CHARS: return []
+        lo = self.start_index if lo is None else lo
+        hi = self.end_index if hi is None else hi
+        grams = {pattern[k:k + self.n] for k in range(len(pattern) - self.n + 1)} or {pattern}
+        counts = Counter()
+        for gram in grams:
+            for physical_index in self.index.get(gram, ()):
+                if lo <= physical_index <= hi: counts[physical_index] += 1
+        shortlist = [p for p, c in counts.most_common(MAX_CANDIDATE_PAGES) if c / len(grams) >= GRAM_COVERAGE]
+        results = []
+        for physical_index in shortlist:
+            score, start = self._score_on_page(pattern, self.norm_pages[physical_index - self.start_index])
+            if score >= MATCH_YES_SCORE: results.append((physical_index, score, start))
+        return sorted(results)
+
+    def _score_on_page(self, pattern, norm_page):
+        """
+        只在 n-gram 命中最集中的窗口内做编辑距离，避免对整页跑 O(m*n) 的 DP。
+        返回 (score, start)，start 为匹配在归一化页面中的起始位置。
+        """
+        pos = norm_page.find(pattern)
+        if pos >= 0: return 1.0, pos
+        m = len(pattern)
+        anchors, hits = Counter(), 0
+        for k in range(len(pattern) - self.n + 1):
+            q = norm_page.find(pattern[k:k + self.n])
+            while q >= 0 and hits < 200:
+                anchors[q - k] += 1
+                hits += 1
+                q = norm_page.find(pattern[k:k + self.n], q + 1)
+        if not anchors: return 0.0, None
+        anchor = anchors.most_common(1)[0][0]
+        lo = max(0, anchor - m // 2)
+        distance, end = approximate_substring_match(pattern, norm_page[lo:anchor + m + m // 2])
+        return max(0.0, 1 - distance / m), lo + max(0, end - m)
+
+    @staticmethod
+    def _pick(candidates):
+        """唯一候选直接采用；多个候选时只接受唯一一个位于页首的"""
+        if len(candidates) == 1: return candidates[0][0]
+        at_start = [c for c in candidates if c[2] <= START_PREFIX_CHARS]
+        if len(at_start) == 1: return at_start[0][0]
+        return None
+
+    def estimate_offset(self, toc_items):
+        """按 (物理页 - 目录页码) 投票；页首命中权重加倍。没有足够共识时返回 None"""
+        votes = Counter()
+        numbered = 0
+        for item in toc_items:
+            page = item.get('page')
+            if not isinstance(page, int): continue
+            numbered += 1
+            for physical_index, _, start in self.candidates(item.get('title')):
+                votes[physical_index - page] += 2 if start <= START_PREFIX_CHARS else 1
+        if not votes or not numbered: return None
+        offset, weight = votes.most_common(1)[0]
+        if weight < OFFSET_MIN_VOTES or weight < OFFSET_MIN_SUPPORT * numbered: return None
+        return offset
+
+    def place_between(self, title, prev_index, next_index):
+        """在邻居的物理页区间 [prev_index, next_index] 内定位，无法确定返回 None"""
+        if prev_index and prev_index == next_index: return prev_index
+        return self._pick(self.candidates(title, prev_index or self.start_index, next_index or self.end_index))
+
+    def align_monotonic(self, toc_items, first_page=None):
+        """
+        无页码目录的顺序对齐：每个条目取不早于前一条目的最早一个页首命中；
+        没有页首命中时只接受唯一候选，否则留空交给后续步骤。
+        已定位的条目写入 physical_index，返回定位比例。
+        """
+        cursor = first_page or self.start_index
+        resolved = 0
+        for item in toc_items:
+            candidates = self.candidates(item.get('title'), cursor, self.end_index)
+            at_start = [c for c in candidates if c[2] <= START_PREFIX_CHARS]
+            if at_start: physical_index = at_start[0][0]
+            elif len(candidates) == 1: physical_index = candidates[0][0]
+            else: continue
+            item['physical_index'] = cursor = physical_index
+            resolved += 1
+        return resolved / len(toc_items) if toc_items else 0.0
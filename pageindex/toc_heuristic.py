@@ -0,0 +1,79 @@
+"""
+基于规则的目录页预检测。
+
+在调用 LLM 之前先对 page_list 打分：点状引导线、行尾页码、"Contents/目录" 标题、
+密集的编号标题都是目录页的典型特征。打分很有把握的页直接给出 yes/no，
+只有模糊的页才交给 toc_detector_single_page / toc_detector_multi_page。
+"""
+import re
+
+TOC_HEADER_PATTERN = re.compile(
+    r'^\s*(table\s+of\s+contents|contents|content|目\s*录|目\s*次)\s*$', re.IGNORECASE)
+# 点状引导线 + 页码："Overview ........ 12"、"概述……12"
+DOT_LEADER_PATTERN = re.compile(
+    r'(\.{4,}|(\.\s){3,}|…{2,}|·{4,}|_{4,}|-{6,})\s*(\d{1,4}|[ivxlcdm]{1,6})\s*$', re.IGNORECASE)
+# 标题 + 行尾页码："2 Monetary Policy 3"；标题最后一个词不能是数字，以排除表格行
+TRAILING_PAGE_PATTERN = re.compile(r'[\s.·…_-](\d{1,4}|[ivxlcdm]{1,6})\s*$', re.IGNORECASE)
+LETTER_PATTERN = re.compile(r'[A-Za-z一-鿿]')
+NUMBERED_HEADING_PATTERN = re.compile(
+    r'^\s*(\d{1,2}(\.\d{1,2}){0,3}\.?\s+\S|[IVX]{1,5}\.\s+\S|'
+    r'(chapter|part|section|appendix)\s+[\dIVXA-Z]+|第[一二三四五六七八九十百零\d]+[章节篇部分条])',
+    re.IGNORECASE)
+
+TOC_YES_THRESHOLD = 0.75
+TOC_NO_THRESHOLD = 0.15
+
+
+def _is_trailing_page_line(line):
+    m = TRAILING_PAGE_PATTERN.search(line)
+    if not m: return False
+    title = line[:m.start()].rstrip(' .·…_-')
+    last_token = title.split()[-1] if title.split() else ''
+    if re.search(r'\d', last_token) and not NUMBERED_HEADING_PATTERN.match(title): return False
+    return len(LETTER_PATTERN.findall(title)) >= 2
+
+
+def score_toc_page(text):
+    """
+    返回 (score, signals)。score 在 [0, 1] 之间，越高越像目录页。
+    """
+    lines = [l.strip() for l in (text or '').split('\n') if l.strip()]
+    signals = {'lines': len(lines), 'header': False, 'dot_leaders': 0, 'trailing_pages': 0, 'numbered': 0, 'avg_line_len': 0}
+    if len(lines) < 3: return 0.0, signals
+
+    signals['header'] = any(TOC_HEADER_PATTERN.match(l) for l in lines[:6])
+    signals['dot_leaders'] = sum(1 for l in lines if DOT_LEADER_PATTERN.search(l))
+    signals['trailing_pages'] = sum(1 for l in lines if _is_trailing_page_line(l))
+    signals['numbered'] = sum(1 for l in lines if NUMBERED_HEADING_PATTERN.match(l))
+    signals['avg_line_len'] = sum(len(l) for l in lines) / len(lines)
+
+    n = len(lines)
+    leader_ratio = signals['dot_leaders'] / n
+    trailing_ratio = signals['trailing_pages'] / n
+    numbered_ratio = signals['numbered'] / n
+
+    score = 0.55 * min(1.0, leader_ratio / 0.3)
+    score += 0.3 * min(1.0, trailing_ratio / 0.5)
+    score += 0.15 * min(1.0, numbered_ratio / 0.3)
+    if signals['header']: score += 0.3
+    # 只有一两行引导线的页（如图表目录尾部、表格）不足以定论
+    if signals['dot_leaders'] < 3 and not signals['header']: score = min(score, 0.6)
+    return min(1.0, score), signals
+
+
+def classify_toc_page(text, yes_threshold=TOC_YES_THRESHOLD, no_threshold=TOC_NO_THRESHOLD):
+    """有把握时返回 'yes' / 'no'，模糊时返回 None（交给 LLM）。"""
+    score, _ = score_toc_page(text)
+    if score >= yes_threshold: return 'yes'
+    if score <= no_threshold: return 'no'
+    return None
+
+
+def heuristic_toc_labels(indices, page_list, yes_threshold=TOC_YES_THRESHOLD, no_threshold=TOC_NO_THRESHOLD):
+    """对 indices 中的页打标签，返回 ({page_index: 'yes'/'no'}, [模糊页 index])"""
+    labels, ambiguous = {}, []
+    for i in indices:
+        label = classify_toc_page(page_list[i][0], yes_threshold, no_threshold)
+        if label is None: ambiguous.append(i)
+        else: labels[i] = label
+    return labels, ambiguous
@@ -3,20 +3,39 @@ import re
 import ssl
 import json
 import time
-import copy
 import asyncio
 import logging
 import requests
 import urllib3
 import yaml
+import math
 import random
+import shutil
+import sqlite3
+import hashlib
+import gzip
+import threading
+import atexit
+import contextvars
+from contextlib import contextmanager
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from types import SimpleNamespace as config
+from typing import NamedTuple, Optional
 
-import tiktoken
+from collections import OrderedDict
 from dotenv import load_dotenv
 
+from .metrics import record_llm_call, bind_context
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
 try:
     import pdfplumber
     HAS_PDFPLUMBER = True
@@ -39,6 +58,53 @@ load_dotenv()
 QWEN_API_KEY = os.getenv("QWEN_API_KEY", os.getenv("CHATGPT_API_KEY", "your api key"))
 QWEN_API_BASE = os.getenv("QWEN_API_BASE", "https://dashscope.aliyuncs.com/compatible-mode/v1")
 QWEN_MODEL = os.getenv("QWEN_MODEL", "qwen2.5-vl-72b")
+LLM_TEMPERATURE = 0.1
+
+# 3. LLM Response Cache Config
+# 同一 (model, prompt, temperature) 的回复持久化缓存，重跑文档时直接回放
+LLM_CACHE_ENABLED = os.getenv("PAGEINDEX_LLM_CACHE", "on").lower() not in ("0", "off", "no", "false")
+LLM_CACHE_PATH = os.getenv("PAGEINDEX_LLM_CACHE_PATH", os.path.join("cache", "llm_cache.db"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("PAGEINDEX_LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_MAX_MB = int(os.getenv("PAGEINDEX_LLM_CACHE_MAX_MB", "512"))
+
+# 4. Page Text Cache Config
+# 按 PDF 内容 SHA-256 + 提取器版本缓存逐页文本，避免每次重新跑 pdfplumber
+PAGE_CACHE_ENABLED = os.getenv("PAGEINDEX_PAGE_CACHE", "on").lower() not in ("0", "off", "no", "false")
+PAGE_CACHE_DIR = os.getenv("PAGEINDEX_PAGE_CACHE_DIR", os.path.join("cache", "pages"))
+PAGE_EXTRACTOR_VERSION = "1"
+
+# 5. Parallel Extraction Config
+# 0 = 按 CPU 核数自动决定，1 = 单进程串行
+PAGE_EXTRACT_WORKERS = int(os.getenv("PAGEINDEX_EXTRACT_WORKERS", "0"))
+PAGE_EXTRACT_MIN_PAGES_PER_WORKER = 16
+
+# 6. Stage Checkpoint Config
+CHECKPOINT_DIR = os.getenv("PAGEINDEX_WORK_DIR", "work")
+
+# 7. Tokenizer Config
+# 优先使用 tiktoken 编码（离线时从打包目录加载），否则退回 CJK 感知的估算器
+TOKENIZER_ENCODING = os.getenv("PAGEINDEX_TOKENIZER", "cl100k_base")
+TOKENIZER_BUNDLED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer_data")
+TOKENIZER_ALLOW_DOWNLOAD = os.getenv("PAGEINDEX_TOKENIZER_DOWNLOAD", "off").lower() in ("1", "on", "yes", "true")
+TIKTOKEN_BLOB_URLS = {
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+}
+
+# 8. Global LLM Budget Config
+# 进程内所有 LLM 请求共享的并发上限和每分钟请求数（0 = 不限），批量索引多文档时使用
+LLM_MAX_CONCURRENCY = int(os.getenv("PAGEINDEX_LLM_CONCURRENCY", "0"))
+LLM_RATE_LIMIT_RPM = float(os.getenv("PAGEINDEX_LLM_RPM", "0"))
+
+# 9. Run Log Config
+# JsonLogger 的 JSON Lines 日志：缓冲写盘 + 按大小轮转
+LOG_DIR = os.getenv("PAGEINDEX_LOG_DIR", "logs")
+LOG_FLUSH_ENTRIES = 50
+LOG_FLUSH_INTERVAL = 2.0
+LOG_MAX_BYTES = int(os.getenv("PAGEINDEX_LOG_MAX_MB", "50")) * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+# 这些级别的条目立即写盘（进程被 GUI 直接结束时也不会丢）
+LOG_IMMEDIATE_LEVELS = ('WARNING', 'ERROR', 'CRITICAL')
 
 # --- Universal Fallback Object ---
 class UniversalFallback(dict):
@@ -54,9 +120,159 @@ class UniversalFallback(dict):
     def __len__(self): return 0
     def get(self, key, default=None): return super().get(key, default)
 
+def resolve_model(model):
+    return model if model else os.getenv("QWEN_MODEL", "qwen-plus")
+
+class LLMResponseCache:
+    """
+    Content-addressed LLM response cache (SQLite).
+    Key = sha256(model + messages + temperature); evicts least-recently-used entries
+    once max_entries or max_bytes is exceeded.
+    """
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                size INTEGER,
+                created_at REAL,
+                last_access REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+        self._conn.commit()
+        self._evict()
+
+    @staticmethod
+    def make_key(model, messages, temperature=LLM_TEMPERATURE):
+        raw = json.dumps({"model": model, "messages": messages, "temperature": temperature}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM llm_cache WHERE key=?", (key,)).fetchone()
+            if row is None: return None
+            self._conn.execute("UPDATE llm_cache SET last_access=? WHERE key=?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode('utf-8')), now, now)
+            )
+            self._conn.commit()
+            self._puts_since_evict += 1
+            if self._puts_since_evict < 50: return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            self._puts_since_evict = 0
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            if count <= self.max_entries and total <= self.max_bytes: return
+            # 淘汰到上限的 90%，避免每次写入都触发淘汰
+            target_count = int(self.max_entries * 0.9)
+            target_bytes = int(self.max_bytes * 0.9)
+            rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall()
+            to_delete = []
+            for key, size in rows:
+                if count <= target_count and total <= target_bytes: break
+                to_delete.append((key,))
+                count -= 1
+                total -= size or 0
+            self._conn.executemany("DELETE FROM llm_cache WHERE key=?", to_delete)
+            self._conn.commit()
+            logging.info(f"LLM cache evicted {len(to_delete)} entries")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+# 单次运行的旁路开关：放在 contextvar 里，同一进程内并发 / 先后的其他运行不受影响
+_llm_cache_bypass = contextvars.ContextVar('pageindex_llm_cache_bypass', default=False)
+
+def set_llm_cache_enabled(enabled):
+    """全局旁路开关 (等价于环境变量 PAGEINDEX_LLM_CACHE=off)，影响整个进程；单次运行请用 llm_cache_scope"""
+    global LLM_CACHE_ENABLED
+    LLM_CACHE_ENABLED = bool(enabled)
+
+@contextmanager
+def llm_cache_scope(enabled=True):
+    """with 块内（含 asyncio 任务和 bind_context 提交的线程）按 enabled 使用或旁路缓存，退出时恢复"""
+    token = _llm_cache_bypass.set(not enabled)
+    try:
+        yield
+    finally:
+        _llm_cache_bypass.reset(token)
+
+def get_llm_cache():
+    global _llm_cache
+    if not LLM_CACHE_ENABLED or _llm_cache_bypass.get(): return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            try:
+                _llm_cache = LLMResponseCache()
+            except Exception as e:
+                logging.warning(f"⚠️ LLM cache unavailable: {e}")
+                return None
+        return _llm_cache
+
+class LLMRateLimiter:
+    """
+    全局 LLM 请求预算：并发上限（信号量）+ 每分钟请求数（按固定间隔发放请求时间）。
+    以 with 语句包住每次 HTTP 请求；多个文档在同一进程内并行时共享同一个预算。
+    """
+    def __init__(self, max_concurrency=0, rpm=0):
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self.semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def __enter__(self):
+        if self.interval:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.next_time - now
+                self.next_time = max(now, self.next_time) + self.interval
+            if wait > 0: time.sleep(wait)
+        if self.semaphore: self.semaphore.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.semaphore: self.semaphore.release()
+        return False
+
+_llm_limiter = LLMRateLimiter(LLM_MAX_CONCURRENCY, LLM_RATE_LIMIT_RPM)
+
+def set_llm_limits(max_concurrency=0, rpm=0):
+    """替换全局 LLM 预算（等价于环境变量 PAGEINDEX_LLM_CONCURRENCY / PAGEINDEX_LLM_RPM）"""
+    global _llm_limiter
+    _llm_limiter = LLMRateLimiter(int(max_concurrency or 0), float(rpm or 0))
+    return _llm_limiter
+
+def get_llm_limiter():
+    return _llm_limiter
+
 def request_api_stream_sync(model, messages, timeout=600):
     # 使用Qwen API
-    target_model = model if model else os.getenv("QWEN_MODEL", "qwen-plus")
+    target_model = resolve_model(model)
 
     headers = {
         "Content-Type": "application/json",
@@ -69,7 +285,7 @@ def request_api_stream_sync(model, messages, timeout=600):
         "model": target_model,
         "messages": messages,
         "stream": True,
-        "temperature": 0.1
+        "temperature": LLM_TEMPERATURE
     }
 
     # 使用Qwen API
@@ -148,30 +364,47 @@ def clean_deepseek_content(content):
     content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL)
     return content.strip()
 
-def ChatGPT_API_with_finish_reason(model, prompt, api_key=None, chat_history=None):
+def ChatGPT_API_with_finish_reason(model, prompt, api_key=None, chat_history=None, use_cache=True):
     messages = chat_history + [{"role": "user", "content": prompt}] if chat_history else [{"role": "user", "content": prompt}]
+
+    cache = get_llm_cache() if use_cache else None
+    cache_key = None
+    if cache:
+        cache_key = LLMResponseCache.make_key(resolve_model(model), messages)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            record_llm_call(cached=True)
+            return cached, "finished"
     
+    prompt_tokens = sum(count_tokens(str(m.get("content", "")), cache=False) for m in messages)
     max_retries = 5
     for i in range(max_retries):
-        raw = request_api_stream_sync(model, messages)
+        with _llm_limiter:
+            raw = request_api_stream_sync(model, messages)
         if raw != "Error" and raw.strip():
             # 简单校验 JSON 结构
             if '{' in raw or '[' in raw:
-                return clean_deepseek_content(raw), "finished"
+                result = clean_deepseek_content(raw)
+                if cache:
+                    cache.put(cache_key, resolve_model(model), result)
+                record_llm_call(prompt_tokens, count_tokens(raw, cache=False), retries=i)
+                return result, "finished"
         
         wait_time = 3 * (2 ** i)
         print(f'************* API Retry ({i+1}/{max_retries}) - Waiting {wait_time}s *************')
         time.sleep(wait_time)
         
+    record_llm_call(prompt_tokens, 0, retries=max_retries - 1, failed=True)
     return "Error", "failed"
 
-def ChatGPT_API(model, prompt, api_key=None, chat_history=None):
-    res, _ = ChatGPT_API_with_finish_reason(model, prompt, api_key, chat_history)
+def ChatGPT_API(model, prompt, api_key=None, chat_history=None, use_cache=True):
+    res, _ = ChatGPT_API_with_finish_reason(model, prompt, api_key, chat_history, use_cache=use_cache)
     return res
 
 async def ChatGPT_API_async(model, prompt, api_key=None):
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, ChatGPT_API, model, prompt)
+    # 复制上下文，工作线程里的调用才能记到当前运行的阶段统计上
+    return await loop.run_in_executor(None, bind_context(ChatGPT_API, model, prompt))
 
 def get_json_content(content):
     if not content: return ""
@@ -231,54 +464,506 @@ def extract_json(content):
         logging.error(f"JSON Parsing fatal error: {e}")
         return UniversalFallback()
 
-def count_tokens(text, model=None):
-    return len(text) // 2
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+def estimate_tokens(text):
+    """无分词器时的估算：CJK 字符约 1 token/字，其余约 4 字符/token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def _find_tiktoken_cache_dir(encoding_name):
+    """找到已包含该编码文件的缓存目录（tiktoken 以 sha1(url) 作文件名）"""
+    url = TIKTOKEN_BLOB_URLS.get(encoding_name)
+    if not url: return None
+    cache_key = hashlib.sha1(url.encode()).hexdigest()
+    import tempfile
+    candidates = [os.getenv("TIKTOKEN_CACHE_DIR"), TOKENIZER_BUNDLED_DIR, os.path.join(tempfile.gettempdir(), "data-gym-cache")]
+    for cache_dir in candidates:
+        if cache_dir and os.path.exists(os.path.join(cache_dir, cache_key)): return cache_dir
+    return None
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+def _load_default_tokenizer():
+    if HAS_TIKTOKEN:
+        cache_dir = _find_tiktoken_cache_dir(TOKENIZER_ENCODING)
+        if cache_dir or TOKENIZER_ALLOW_DOWNLOAD:
+            try:
+                if cache_dir: os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+                encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                return f"tiktoken-{TOKENIZER_ENCODING}", lambda text: len(encoding.encode(text, disallowed_special=()))
+            except Exception as e:
+                logging.warning(f"⚠️ tiktoken encoding {TOKENIZER_ENCODING} unavailable: {e}")
+    print(f"[INFO] Tokenizer {TOKENIZER_ENCODING} not bundled, using the CJK-aware estimator.")
+    return "estimate-v1", estimate_tokens
+
+def get_tokenizer():
+    """返回 (tokenizer_id, count_fn)，首次调用时加载"""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None: _tokenizer = _load_default_tokenizer()
+    return _tokenizer
+
+def set_tokenizer(count_fn, tokenizer_id):
+    """注册自定义分词计数函数（如模型自带的 tokenizer），tokenizer_id 会写入页缓存"""
+    global _tokenizer
+    with _tokenizer_lock:
+        _tokenizer = (tokenizer_id, count_fn)
+    with _token_count_lock:
+        _token_count_memo.clear()
+    _page_cache_memo.clear()
+
+def get_tokenizer_id():
+    return get_tokenizer()[0]
+
+# 记忆表以文本摘要为键，只保存 16 字节摘要和计数，不长期持有页文本本身
+TOKEN_COUNT_MEMO_SIZE = 4096
+_token_count_memo = OrderedDict()
+_token_count_lock = threading.Lock()
+
+def count_tokens(text, model=None, cache=True):
+    """cache=False 用于只数一次的文本（整段 prompt、LLM 回复），直接计数，不进入记忆表"""
+    if not text: return 0
+    count_fn = get_tokenizer()[1]
+    if not cache: return count_fn(text)
+    key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    with _token_count_lock:
+        if key in _token_count_memo:
+            _token_count_memo.move_to_end(key)
+            return _token_count_memo[key]
+    tokens = count_fn(text)
+    with _token_count_lock:
+        _token_count_memo[key] = tokens
+        if len(_token_count_memo) > TOKEN_COUNT_MEMO_SIZE: _token_count_memo.popitem(last=False)
+    return tokens
+
+# --- Tree Traversal ---
+# 结构树的统一遍历：显式栈迭代，不递归（任意深度都不会触发 RecursionError），不复制节点。
+# structure 可以是单个节点 dict 或节点列表，子节点放在 'nodes' 中；非 dict 元素跳过。
+class NodeVisit(NamedTuple):
+    node: dict
+    parent: Optional[dict]
+    depth: int
+    path: tuple  # 从根到该节点的下标路径，如 (0, 2, 1)
+
+def _child_nodes(node):
+    children = node.get('nodes')
+    return children if isinstance(children, list) else ()
+
+def _root_nodes(structure):
+    if isinstance(structure, dict): return [structure]
+    return structure if isinstance(structure, list) else []
+
+def walk_tree(structure, order='pre'):
+    """
+    逐个产出 NodeVisit(node, parent, depth, path)。
+    order='pre' 先序（父在子前），order='post' 后序（子在父前，适合自底向上聚合）。
+    遍历期间不要增删正在遍历的 nodes 列表；修改节点自身字段是安全的。
+    path 每个节点新建一个元组（O(深度)）；不需要 parent / path 时用 iter_preorder / iter_postorder。
+    """
+    roots = _root_nodes(structure)
+    stack = [(node, None, 0, (i,), False) for i, node in reversed(list(enumerate(roots)))]
+    while stack:
+        node, parent, depth, path, expanded = stack.pop()
+        if not isinstance(node, dict): continue
+        children = _child_nodes(node)
+        if order == 'post':
+            if expanded or not children:
+                yield NodeVisit(node, parent, depth, path)
+                continue
+            stack.append((node, parent, depth, path, True))
+        else:
+            yield NodeVisit(node, parent, depth, path)
+        for i in range(len(children) - 1, -1, -1):
+            stack.append((children[i], node, depth + 1, path + (i,), False))
+
+def iter_preorder(structure):
+    """先序产出节点本身（引用，不复制）；只需要节点时比 walk_tree 更省"""
+    stack = list(reversed(_root_nodes(structure)))
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict): continue
+        yield node
+        stack.extend(reversed(_child_nodes(node)))
+
+def iter_postorder(structure):
+    """后序产出节点本身（子在父前），不构造路径"""
+    stack = [(node, False) for node in reversed(_root_nodes(structure))]
+    while stack:
+        node, expanded = stack.pop()
+        if not isinstance(node, dict): continue
+        children = _child_nodes(node)
+        if expanded or not children:
+            yield node
+            continue
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(children))
 
 def write_node_id(data, node_id=0):
-    if isinstance(data, dict):
-        data['node_id'] = str(node_id).zfill(4); node_id += 1
-        for k in list(data.keys()):
-            if 'nodes' in k: node_id = write_node_id(data[k], node_id)
-    elif isinstance(data, list):
-        for i in range(len(data)): node_id = write_node_id(data[i], node_id)
+    for node in iter_preorder(data):
+        node['node_id'] = str(node_id).zfill(4); node_id += 1
     return node_id
 
 def get_nodes(structure):
-    # NOTE: This original version uses deepcopy, which prevents in-place modification.
-    # For in-place modifications (like summaries), use collect_nodes_by_reference in page_index.py
-    if isinstance(structure, dict):
-        sn = copy.deepcopy(structure); sn.pop('nodes', None)
-        nodes = [sn]
-        for k in list(structure.keys()):
-            if 'nodes' in k: nodes.extend(get_nodes(structure[k]))
-        return nodes
-    elif isinstance(structure, list):
-        res = []
-        for i in structure: res.extend(get_nodes(i))
-        return res
+    # 先序扁平列表；每项是节点自身字段的浅拷贝（不含 'nodes'），不再深拷贝整棵子树。
+    # 需要原地修改节点时用 iter_preorder
+    return [{k: v for k, v in node.items() if k != 'nodes'} for node in iter_preorder(structure)]
 
 def get_pdf_name(pdf_path):
     if hasattr(pdf_path, 'name'): return pdf_path.name
     return os.path.basename(pdf_path)
 
 class JsonLogger:
-    def __init__(self, file_path):
+    """
+    每次运行一个 JSON Lines 日志 logs/<pdf_name>_<时间戳>.jsonl，每行一个条目，只追加不重写。
+    条目先进缓冲区，攒够 LOG_FLUSH_ENTRIES 条或遇到 WARNING 及以上级别时立即写盘；
+    其余条目由定时器在 LOG_FLUSH_INTERVAL 秒内写盘（不依赖下一次 log 调用），进程被强制结束最多丢这段时间的条目。
+    close() 和进程退出时写出剩余条目。文件超过 LOG_MAX_BYTES 时轮转为 .1 / .2 ...（数字越大越旧）。
+    旧版整文件 JSON 数组格式的日志用 read_json_log 读取。
+    """
+    def __init__(self, file_path, log_dir=None, max_bytes=None, backup_count=None):
         name = get_pdf_name(file_path)
-        self.filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        os.makedirs("./logs", exist_ok=True); self.log_data = []
-    
+        self.log_dir = log_dir or LOG_DIR
+        self.filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        self.path = os.path.join(self.log_dir, self.filename)
+        self.max_bytes = LOG_MAX_BYTES if max_bytes is None else max_bytes
+        self.backup_count = LOG_BACKUP_COUNT if backup_count is None else backup_count
+        self.buffer = []
+        self.lock = threading.Lock()
+        self._timer = None
+        os.makedirs(self.log_dir, exist_ok=True)
+        atexit.register(self.close)
+
     def log(self, level, message, **kwargs):
         entry = {'message': str(message), 'level': level, 'timestamp': datetime.now().isoformat()}
-        self.log_data.append(entry)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.buffer.append(line)
+            if level in LOG_IMMEDIATE_LEVELS or len(self.buffer) >= LOG_FLUSH_ENTRIES:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(LOG_FLUSH_INTERVAL, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _rotate_locked(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"): os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backup_count > 0: os.replace(self.path, f"{self.path}.1")
+        else: os.remove(self.path)
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.buffer: return
+        data = "".join(self.buffer)
+        self.buffer = []
         try:
-            with open(os.path.join("logs", self.filename), "w", encoding="utf-8-sig") as f:
-                json.dump(self.log_data, f, indent=2, ensure_ascii=False)
+            if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self._rotate_locked()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(data)
         except Exception: pass
 
+    def flush(self):
+        with self.lock: self._flush_locked()
+
+    def close(self):
+        self.flush()
+        # 否则 atexit 一直引用本实例，批量运行时每个任务的 logger 都活到进程结束
+        atexit.unregister(self.close)
+
     def info(self, m): self.log("INFO", m)
+    def warning(self, m): self.log("WARNING", m)
     def error(self, m): self.log("ERROR", m)
 
-def get_page_tokens(pdf_path, model=None):
+def _iter_log_file(path):
+    # 旧版：整个文件是一个 JSON 数组（utf-8-sig）
+    with open(path, "r", encoding="utf-8-sig") as f:
+        head = f.read(1)
+        while head and head.isspace(): head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            try:
+                yield from json.load(f)
+            except json.JSONDecodeError: pass
+            return
+        for line in f:
+            # 崩溃时可能留下写了一半的最后一行
+            try: yield json.loads(line)
+            except json.JSONDecodeError: continue
+
+def read_json_log(path, level=None):
+    """
+    读取 JsonLogger 日志，兼容旧版 .json 数组格式和新版 .jsonl（含轮转出的 .1/.2 等分卷，按时间顺序拼接）。
+    level 不为空时只返回该级别的条目。
+    """
+    parts = [path]
+    if not path.endswith(".json"):
+        i = 1
+        while os.path.exists(f"{path}.{i}"):
+            parts.insert(0, f"{path}.{i}")
+            i += 1
+    entries = []
+    for part in parts:
+        if not os.path.exists(part): continue
+        for entry in _iter_log_file(part):
+            if isinstance(entry, dict) and (level is None or entry.get('level') == level):
+                entries.append(entry)
+    return entries
+
+FINGERPRINT_KEYS = ('model', 'toc_check_page_num', 'max_page_num_each_node', 'max_token_num_each_node',
+                    'toc_detect_mode', 'toc_heuristic', 'no_toc_mode', 'summary_mode', 'if_strip_headers_footers',
+                    'toc_verify_mode')
+
+def get_options_fingerprint(opt):
+    """影响结构树结果的配置项指纹；检查点和增量产物在指纹变化时作废"""
+    return hashlib.sha256(json.dumps(
+        {k: getattr(opt, k, None) for k in FINGERPRINT_KEYS}, sort_keys=True, default=str
+    ).encode('utf-8')).hexdigest()
+
+class StageCheckpoint:
+    """
+    page_index_main 各阶段的持久化检查点。
+    每个 PDF 一个目录 work_dir/<pdf_name>_<sha256[:16]>/：
+      <stage>.json     阶段完成后原子写入
+      <stage>.jsonl    阶段内的逐条进度（如逐节点摘要），追加写入
+      meta.json        PDF 哈希 + 配置指纹，配置变化时旧检查点作废
+    doc 为 None 时所有方法都是空操作。
+    """
+    def __init__(self, doc=None, opt=None, work_dir=None, resume=False):
+        self.enabled = doc is not None
+        self.lock = threading.Lock()
+        if not self.enabled: return
+        pdf_sha256 = get_pdf_sha256(doc)
+        self.dir = self.dir_for(doc, work_dir, pdf_sha256)
+        meta = {'pdf_sha256': pdf_sha256, 'fingerprint': get_options_fingerprint(opt)}
+
+        if resume and self._read_json(os.path.join(self.dir, "meta.json")) == meta:
+            done = [f[:-5] for f in os.listdir(self.dir) if f.endswith('.json') and f != 'meta.json']
+            print(f"[INFO] Resuming from checkpoint {self.dir} (completed stages: {', '.join(sorted(done)) or 'none'})")
+        else:
+            if resume: print("[INFO] No compatible checkpoint found, starting from scratch.")
+            self.clear()
+        os.makedirs(self.dir, exist_ok=True)
+        self._write_json(os.path.join(self.dir, "meta.json"), meta)
+
+    @staticmethod
+    def dir_for(doc, work_dir=None, pdf_sha256=None):
+        """文档的检查点目录；运行结束后该目录仍存在说明没有完整跑完"""
+        pdf_sha256 = pdf_sha256 or get_pdf_sha256(doc)
+        name = get_pdf_name(doc) if isinstance(doc, str) else "document"
+        return os.path.join(work_dir or CHECKPOINT_DIR, f"{os.path.splitext(name)[0]}_{pdf_sha256[:16]}")
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+        except Exception: return None
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def has(self, stage):
+        return self.enabled and os.path.exists(os.path.join(self.dir, f"{stage}.json"))
+
+    def load(self, stage):
+        if not self.has(stage): return None
+        data = self._read_json(os.path.join(self.dir, f"{stage}.json"))
+        return data.get('data') if isinstance(data, dict) else None
+
+    def save(self, stage, data):
+        if not self.enabled: return
+        try:
+            self._write_json(os.path.join(self.dir, f"{stage}.json"), {'stage': stage, 'saved_at': datetime.now().isoformat(), 'data': data})
+            print(f"[INFO] Checkpoint saved: {stage}")
+        except Exception as e:
+            logging.warning(f"⚠️ Failed to save checkpoint {stage}: {e}")
+
+    def append(self, stage, record):
+        if not self.enabled: return
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(os.path.join(self.dir, f"{stage}.jsonl"), 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def load_records(self, stage):
+        """读取追加进度，忽略崩溃时写了一半的最后一行"""
+        records = []
+        if not self.enabled: return records
+        path = os.path.join(self.dir, f"{stage}.jsonl")
+        if not os.path.exists(path): return records
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try: records.append(json.loads(line))
+                except json.JSONDecodeError: continue
+        return records
+
+    def clear(self):
+        if self.enabled and os.path.isdir(self.dir): shutil.rmtree(self.dir, ignore_errors=True)
+
+# (绝对路径, mtime_ns, 文件大小) -> sha256：get_text_of_pages 每读一个章节都要查页缓存，不能每次重新哈希整个 PDF
+_pdf_sha256_memo = {}
+PDF_SHA256_MEMO_SIZE = 256
+
+def get_pdf_sha256(pdf_path):
+    h = hashlib.sha256()
+    if isinstance(pdf_path, BytesIO):
+        h.update(pdf_path.getvalue())
+        return h.hexdigest()
+    st = os.stat(pdf_path)
+    key = (os.path.abspath(pdf_path), st.st_mtime_ns, st.st_size)
+    if key in _pdf_sha256_memo: return _pdf_sha256_memo[key]
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    if len(_pdf_sha256_memo) >= PDF_SHA256_MEMO_SIZE: _pdf_sha256_memo.clear()
+    _pdf_sha256_memo[key] = h.hexdigest()
+    return _pdf_sha256_memo[key]
+
+def get_page_extractor_id():
+    engine = "pdfplumber" if HAS_PDFPLUMBER else "pypdf2"
+    return f"{engine}-v{PAGE_EXTRACTOR_VERSION}"
+
+def _page_cache_path(pdf_sha256):
+    return os.path.join(PAGE_CACHE_DIR, f"{pdf_sha256}_{get_page_extractor_id()}.json.gz")
+
+_page_cache_memo = {}
+
+def load_cached_pages(pdf_sha256):
+    """返回缓存的 [(text, token_count), ...]，未命中返回 None"""
+    if not PAGE_CACHE_ENABLED: return None
+    path = _page_cache_path(pdf_sha256)
+    if path in _page_cache_memo: return list(_page_cache_memo[path])
+    if not os.path.exists(path): return None
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('tokenizer') == get_tokenizer_id():
+            page_list = list(zip(data['pages'], data['tokens']))
+        else:
+            # 分词器变化时只需重新计数，不必重新提取文本
+            page_list = [(text, count_tokens(text)) for text in data['pages']]
+            save_cached_pages(pdf_sha256, page_list)
+        _page_cache_memo[path] = page_list
+        return list(page_list)
+    except Exception as e:
+        logging.warning(f"⚠️ Page cache unreadable ({path}): {e}")
+        return None
+
+def save_cached_pages(pdf_sha256, page_list):
+    if not PAGE_CACHE_ENABLED or not page_list: return
+    path = _page_cache_path(pdf_sha256)
+    try:
+        os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump({
+                'sha256': pdf_sha256,
+                'extractor': get_page_extractor_id(),
+                'tokenizer': get_tokenizer_id(),
+                'pages': [p[0] for p in page_list],
+                'tokens': [p[1] for p in page_list]
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        _page_cache_memo[path] = list(page_list)
+    except Exception as e:
+        logging.warning(f"⚠️ Failed to write page cache: {e}")
+
+def get_page_tokens(pdf_path, model=None, workers=None):
+    pdf_sha256 = None
+    if PAGE_CACHE_ENABLED:
+        try:
+            pdf_sha256 = get_pdf_sha256(pdf_path)
+            cached = load_cached_pages(pdf_sha256)
+            if cached is not None:
+                print(f"[INFO] Loaded {len(cached)} pages from page text cache ({pdf_sha256[:12]}).")
+                return cached
+        except Exception as e:
+            logging.warning(f"⚠️ Page cache lookup failed: {e}")
+
+    page_list = _extract_page_tokens_parallel(pdf_path, workers)
+    if page_list is None:
+        page_list = _extract_page_tokens(pdf_path)
+    page_list = [(text, count_tokens(text)) for text, _ in page_list]
+    if pdf_sha256: save_cached_pages(pdf_sha256, page_list)
+    return page_list
+
+def _count_pdf_pages(source):
+    if HAS_PDFPLUMBER:
+        with pdfplumber.open(source) as pdf: return len(pdf.pages)
+    import PyPDF2
+    return len(PyPDF2.PdfReader(source).pages)
+
+def _extract_page_range(task):
+    """
+    Worker: 独立打开 PDF，提取 [start, end) 页。
+    pdfplumber 出错时该分片整体回退到 PyPDF2。
+    """
+    source, start, end = task
+    if isinstance(source, bytes): source = BytesIO(source)
+    if HAS_PDFPLUMBER:
+        try:
+            shard = []
+            with pdfplumber.open(source) as pdf:
+                for i in range(start, end):
+                    t = (pdf.pages[i].extract_text() or "").replace('\x00', '')
+                    shard.append((t, len(t)))
+            return shard
+        except Exception:
+            if isinstance(source, BytesIO): source.seek(0)
+    shard = []
+    try:
+        import PyPDF2
+        reader = PyPDF2.PdfReader(source)
+        for i in range(start, end):
+            t = (reader.pages[i].extract_text() or "").replace('\x00', '')
+            shard.append((t, len(t)))
+    except Exception:
+        shard.extend([("", 0)] * (end - start - len(shard)))
+    return shard
+
+def _extract_page_tokens_parallel(pdf_path, workers=None):
+    """
+    多进程分片提取。返回与串行版本相同顺序的 [(text, length), ...]；
+    页数太少或只有 1 个 worker 时返回 None，由调用方走串行路径。
+    """
+    if workers is None or workers == 0: workers = PAGE_EXTRACT_WORKERS
+    if not workers: workers = os.cpu_count() or 1
+    if workers <= 1: return None
+    try:
+        source = pdf_path.getvalue() if isinstance(pdf_path, BytesIO) else pdf_path
+        total_pages = _count_pdf_pages(BytesIO(source) if isinstance(source, bytes) else source)
+    except Exception as e:
+        logging.warning(f"⚠️ Page count failed, using serial extraction: {e}")
+        return None
+
+    workers = min(workers, total_pages // PAGE_EXTRACT_MIN_PAGES_PER_WORKER)
+    if workers <= 1: return None
+
+    # 分片数取 worker 数的 2 倍，缓解页面复杂度不均导致的长尾
+    shard_count = workers * 2
+    shard_size = math.ceil(total_pages / shard_count)
+    tasks = [(source, start, min(start + shard_size, total_pages)) for start in range(0, total_pages, shard_size)]
+    print(f"[INFO] Extracting {total_pages} pages with {workers} processes ({len(tasks)} shards).")
+    try:
+        page_list = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for shard in executor.map(_extract_page_range, tasks):
+                page_list.extend(shard)
+        return page_list
+    except Exception as e:
+        print(f"[ERROR] Parallel extraction failed: {e}. Falling back to serial extraction.")
+        return None
+
+def _extract_page_tokens(pdf_path):
     page_list = []
     
     if HAS_PDFPLUMBER:
@@ -292,6 +977,7 @@ def get_page_tokens(pdf_path, model=None):
             return page_list
         except Exception as e:
             print(f"[ERROR] pdfplumber failed: {e}. Falling back to PyPDF2.")
+            page_list = []
             
     try:
         import PyPDF2
@@ -309,6 +995,16 @@ def get_page_tokens(pdf_path, model=None):
 def get_text_of_pages(pdf_path, start, end, tag=True):
     text = ""
     start = max(1, start)
+
+    if PAGE_CACHE_ENABLED:
+        try:
+            cached = load_cached_pages(get_pdf_sha256(pdf_path))
+            if cached is not None:
+                for i in range(start-1, min(end, len(cached))):
+                    t = cached[i][0]
+                    text += f"<start_index_{i+1}>\n{t}\n<end_index_{i+1}>\n" if tag else t
+                return text
+        except Exception: pass
     
     if HAS_PDFPLUMBER:
         try:
@@ -375,11 +1071,11 @@ def reorder_dict(data, key_order):
     return {k: data[k] for k in key_order if k in data}
 
 def format_structure(structure, order=None):
-    if isinstance(structure, dict):
-        if 'nodes' in structure: structure['nodes'] = format_structure(structure['nodes'], order)
-        return reorder_dict(structure, order) if order else structure
-    elif isinstance(structure, list):
-        return [format_structure(i, order) for i in structure]
+    # 原地按 order 重排每个节点的键（不在 order 中的键被丢弃），节点对象保持不变
+    if not order: return structure
+    for node in iter_preorder(structure):
+        items = [(k, node[k]) for k in order if k in node]
+        node.clear(); node.update(items)
     return structure
 
 class ConfigLoader:
@@ -441,25 +1137,18 @@ def convert_page_to_int(toc_list):
     return toc_list
 
 def add_node_text(structure, page_list):
-    if isinstance(structure, list):
-        for node in structure: add_node_text(node, page_list)
-    elif isinstance(structure, dict):
+    for node in iter_preorder(structure):
         try:
-            start = int(structure.get('start_index') or 1)
-            end = int(structure.get('end_index') or start)
-            text_content = ""
-            max_page = len(page_list)
+            start = int(node.get('start_index') or 1)
+            end = int(node.get('end_index') or start)
             start_idx = max(0, start - 1)
-            end_idx = min(max_page, end)
-            for i in range(start_idx, end_idx):
-                if i < len(page_list): text_content += page_list[i][0] + "\n"
-            structure['text'] = text_content
-            if 'nodes' in structure: add_node_text(structure['nodes'], page_list)
+            end_idx = min(len(page_list), end)
+            node['text'] = "".join(page_list[i][0] + "\n" for i in range(start_idx, end_idx))
         except: pass
 
 async def generate_summaries_for_structure(structure, model=None):
     # Fallback legacy function if used elsewhere, though page_index.py now has its own robust version
-    nodes = get_nodes(structure)
+    nodes = list(iter_preorder(structure))
     tasks = []
     async def summarize_node(node):
         text_content = node.get('text', '')
@@ -474,23 +1163,89 @@ async def generate_summaries_for_structure(structure, model=None):
     return structure
 
 def clean_page_numbers(data):
-    if isinstance(data, dict):
-        for k, v in data.items():
+    # 任意嵌套的 dict / list 都处理（不只 'nodes'），显式栈迭代
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            stack.extend(item)
+            continue
+        if not isinstance(item, dict): continue
+        for k, v in item.items():
             if k in ['page_number', 'page', 'physical_index', 'start_index', 'end_index']:
                 try:
                     if isinstance(v, str):
                         digits = ''.join(filter(str.isdigit, v))
-                        data[k] = int(digits) if digits else 0
-                    elif isinstance(v, (float, int)): data[k] = int(v)
+                        item[k] = int(digits) if digits else 0
+                    elif isinstance(v, (float, int)): item[k] = int(v)
                 except: pass
-        for k, v in data.items(): clean_page_numbers(v)
-    elif isinstance(data, list):
-        for item in data: clean_page_numbers(item)
+            if isinstance(v, (dict, list)): stack.append(v)
     return data
 
 def remove_structure_text(structure):
-    if isinstance(structure, dict):
-        structure.pop('text', None)
-        if 'nodes' in structure: remove_structure_text(structure['nodes'])
-    elif isinstance(structure, list):
-        for item in structure: remove_structure_text(item)
\ No newline at end of file
+    for node in iter_preorder(structure): node.pop('text', None)
+    return structure
+
+# --- Markdown 树 (page_index_md) 用到的辅助函数 ---
+MD_SUMMARY_MAX_CHARS = 6000
+
+def structure_to_list(structure):
+    # 先序列表，元素是节点本身的引用（可原地写入 summary 等字段）
+    return list(iter_preorder(structure))
+
+async def generate_node_summary(node, model=None):
+    # ChatGPT_API 只接受 JSON 形式的回复，提示词统一要求返回 JSON 对象
+    prompt = f"""
+    You are given a part of a document, your task is to generate a description of the partial document about what are main points covered in the partial document.
+
+    Partial Document Text:
+    {node.get('text', '')[:MD_SUMMARY_MAX_CHARS]}
+
+    Return ONLY the JSON object. Do not add markdown blocks.
+    Format: {{ "summary": "<your description>" }}
+    """
+    response = await ChatGPT_API_async(model, prompt)
+    data = extract_json(response)
+    return data.get('summary', '') if isinstance(data, dict) else ''
+
+def create_clean_structure_for_description(structure):
+    # 只保留标题 / 编号 / 摘要，用于生成文档描述（不带正文，控制 prompt 长度）
+    keep = ('title', 'node_id', 'summary', 'prefix_summary')
+    clean_roots = []
+    stack = [(node, clean_roots) for node in reversed(_root_nodes(structure))]
+    while stack:
+        node, siblings = stack.pop()
+        if not isinstance(node, dict): continue
+        clean = {k: node[k] for k in keep if k in node}
+        siblings.append(clean)
+        children = _child_nodes(node)
+        if children:
+            clean['nodes'] = []
+            stack.extend((child, clean['nodes']) for child in reversed(children))
+    return clean_roots
+
+def generate_doc_description(structure, model=None):
+    prompt = f"""
+    You are an expert in generating descriptions for a document.
+    You are given a structure of a document. Your task is to generate a one-sentence description for the document, which makes it easy to distinguish the document from other documents.
+
+    Document Structure: {json.dumps(structure, ensure_ascii=False)}
+
+    Return ONLY the JSON object. Do not add markdown blocks.
+    Format: {{ "description": "<your description>" }}
+    """
+    data = extract_json(ChatGPT_API(model, prompt))
+    return data.get('description', '') if isinstance(data, dict) else ''
+
+def print_json(data, max_len=40):
+    # 长字符串截断后打印，便于在控制台查看树结构
+    def shorten(item):
+        if isinstance(item, dict): return {k: shorten(v) for k, v in item.items()}
+        if isinstance(item, list): return [shorten(v) for v in item]
+        if isinstance(item, str) and len(item) > max_len: return item[:max_len] + '...'
+        return item
+    print(json.dumps(shorten(data), indent=2, ensure_ascii=False))
+
+def print_toc(structure, indent=2):
+    for visit in walk_tree(structure):
+        print(' ' * (indent * visit.depth) + str(visit.node.get('title', '')))
@@ -14,6 +14,15 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QTextCursor, QTextCharFormat, QColor
 
+# PageIndex 结果文件读取（自动识别 gzip / zstd 压缩）；缺少 pageindex 包时只支持纯 JSON
+try:
+    from pageindex.result_io import load_result_json, RESULT_FILE_PATTERNS
+except ImportError:
+    RESULT_FILE_PATTERNS = "*.json"
+    def load_result_json(path):
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            return json.load(f)
+
 # 兼容不同 PyQt5 版本的 QKeySequence 位置
 try:
     from PyQt5.QtGui import QKeySequence
@@ -299,7 +308,7 @@ class PGIRecallWindow(QMainWindow):
 
     def load_json(self):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "选择索引文件", "", "JSON Files (*.json);;All Files (*)"
+            self, "选择索引文件", "", f"PageIndex Results ({RESULT_FILE_PATTERNS});;All Files (*)"
         )
         if file_path:
             self._load_file(file_path)
@@ -313,8 +322,7 @@ class PGIRecallWindow(QMainWindow):
 
     def _load_file(self, file_path):
         try:
-            with open(file_path, 'r', encoding='utf-8-sig') as f:
-                self.data = json.load(f)
+            self.data = load_result_json(file_path)
 
             self.all_nodes = []
             root_nodes = self._smart_parse_structure(self.data)
@@ -0,0 +1,51 @@
+"""
+查看 PageIndex 运行日志（logs/ 下 JsonLogger 写出的文件）。
+兼容旧版 .json（整个文件一个 JSON 数组）和新版 .jsonl（含轮转分卷 .1/.2 ...）。
+
+用法:
+    python read_json_log.py logs/earthmover.pdf_20251224_141608.json
+    python read_json_log.py logs/earthmover.pdf_20261019_101500.jsonl --level ERROR --tail 20
+    python read_json_log.py logs/old.json --to-jsonl          # 旧格式转换为 .jsonl
+"""
+import os
+import sys
+import json
+import argparse
+
+if sys.stdout:
+    sys.stdout.reconfigure(encoding='utf-8')
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pageindex.utils import read_json_log
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read PageIndex JSON / JSONL run logs")
+    parser.add_argument('path', help="Log file (.json old format or .jsonl)")
+    parser.add_argument('--level', type=str, default=None, help="Only show entries of this level (INFO / ERROR)")
+    parser.add_argument('--tail', type=int, default=None, help="Only show the last N entries")
+    parser.add_argument('--max-chars', type=int, default=300, help="Truncate long messages (0 = no limit)")
+    parser.add_argument('--to-jsonl', action='store_true', help="Convert the log to a .jsonl file next to it")
+    args = parser.parse_args()
+
+    entries = read_json_log(args.path, level=args.level)
+    if args.to_jsonl:
+        out_path = os.path.splitext(args.path)[0] + ".jsonl"
+        with open(out_path, 'w', encoding='utf-8') as f:
+            for entry in entries: f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"[SUCCESS] {len(entries)} entries written to {out_path}")
+        return 0
+
+    if args.tail: entries = entries[-args.tail:]
+    for entry in entries:
+        # 更早的日志直接存放原始字典，没有 message / level / timestamp 字段
+        message = str(entry['message']) if 'message' in entry else json.dumps(entry, ensure_ascii=False)
+        if args.max_chars and len(message) > args.max_chars: message = message[:args.max_chars] + " ..."
+        print(f"{entry.get('timestamp', '')} [{entry.get('level', '')}] {message}")
+    print(f"[INFO] {len(entries)} entries")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,7 +8,7 @@ import random
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QLineEdit, QPushButton, QTextEdit, QComboBox, 
                              QFileDialog, QMessageBox, QFrame, QTabWidget, QSplitter, 
-                             QListWidget, QListWidgetItem, QShortcut, QSlider, QStyleFactory)
+                             QListWidget, QListWidgetItem, QShortcut, QSlider, QStyleFactory, QCheckBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QPointF
 from PyQt5.QtGui import QColor, QFont, QTextCursor, QKeySequence, QTextCharFormat, QPainter, QPen, QBrush
 
@@ -33,7 +33,18 @@ try:
 except ImportError:
     HAS_PANDAS = False
 
+# PageIndex 结果文件读取（自动识别 gzip / zstd 压缩）；缺少 pageindex 包时只支持纯 JSON
+try:
+    from pageindex.result_io import load_result_json, RESULT_FILE_PATTERNS
+except ImportError:
+    RESULT_FILE_PATTERNS = "*.json"
+    def load_result_json(path):
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            return json.load(f)
+
 CONFIG_FILE = "gui_configs.json"
+# 走 run_pageindex_doc.py 快速路径的文档类型（与 pageindex.page_index_doc.DOC_EXTENSIONS 一致）
+DOC_EXTENSIONS = ('.md', '.markdown', '.docx', '.txt')
 
 # === 全局统一样式表 (基础) ===
 # 注意：为了支持透明度调节，部分背景色将在代码中动态生成
@@ -381,7 +392,7 @@ class IndexerTab(QWidget):
         # File Select
         file_layout = QHBoxLayout()
         self.edit_pdf = QLineEdit()
-        self.edit_pdf.setPlaceholderText("Select PDF document path...")
+        self.edit_pdf.setPlaceholderText("Select PDF / Markdown / DOCX / TXT document path...")
         btn_file = QPushButton("📂 BROWSE")
         btn_file.clicked.connect(self.get_file)
         file_layout.addWidget(QLabel("DOCUMENT:"))
@@ -398,6 +409,11 @@ class IndexerTab(QWidget):
         model_layout.addWidget(QLabel("AI MODEL:"))
         model_layout.addWidget(self.combo_model, 1)
         input_layout.addLayout(model_layout)
+
+        # MD / DOCX / TXT 直接按标题构树（run_pageindex_doc.py）；勾选后不生成摘要，全程零 LLM 调用
+        self.chk_structure_only = QCheckBox("⚡ STRUCTURE ONLY (MD / DOCX / TXT: headings only, no LLM calls)")
+        self.chk_structure_only.setStyleSheet("color: #8b949e;")
+        input_layout.addWidget(self.chk_structure_only)
         
         layout.addLayout(input_layout)
 
@@ -524,7 +540,7 @@ class IndexerTab(QWidget):
             self.combo_model.setCurrentText(model)
 
     def get_file(self):
-        f, _ = QFileDialog.getOpenFileName(self, "Select PDF", "", "*.pdf")
+        f, _ = QFileDialog.getOpenFileName(self, "Select Document", "", f"Documents (*.pdf {' '.join('*' + ext for ext in DOC_EXTENSIONS)});;All Files (*)")
         if f: self.edit_pdf.setText(f)
 
     def append_log(self, text):
@@ -542,7 +558,12 @@ class IndexerTab(QWidget):
         py_exe = sys.executable
         # 使用 combox 的文本
         model_name = self.combo_model.currentText()
-        cmd = f'"{py_exe}" -u run_pageindex.py --pdf_path "{pdf_path}" --model "{model_name}" --toc-check-pages 3'
+        if pdf_path.lower().endswith(DOC_EXTENSIONS):
+            # 带标题的文档走快速路径，不做目录检测 / 校验
+            cmd = f'"{py_exe}" -u run_pageindex_doc.py --doc_path "{pdf_path}" --model "{model_name}"'
+            if self.chk_structure_only.isChecked(): cmd += ' --no-summary'
+        else:
+            cmd = f'"{py_exe}" -u run_pageindex.py --pdf_path "{pdf_path}" --model "{model_name}" --toc-check-pages 3'
         
         self.txt_console.clear()
         self.txt_console.append(f"<span style='color:#FFFF00'>[SYSTEM] Initializing subprocess with model: {model_name}...</span>")
@@ -786,7 +807,7 @@ class RecallTab(QWidget):
             self.edit_inner_search.selectAll()
 
     def open_file_dialog(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "选择索引文件", "", "JSON Files (*.json);;All Files (*)")
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择索引文件", "", f"PageIndex Results ({RESULT_FILE_PATTERNS});;All Files (*)")
         if file_path:
             self.load_file_content(file_path)
 
@@ -800,8 +821,7 @@ class RecallTab(QWidget):
 
     def load_file_content(self, file_path):
         try:
-            with open(file_path, 'r', encoding='utf-8-sig') as f:
-                self.data = json.load(f)
+            self.data = load_result_json(file_path)
             
             self.all_nodes = []
             if isinstance(self.data, dict):
@@ -26,6 +26,15 @@ def main():
     parser.add_argument('--pdf_path', type=str, required=True, help="Path to the PDF file")
     parser.add_argument('--model', type=str, default="DeepSeek-V3", help="AI Model to use")
     parser.add_argument('--toc-check-pages', type=int, default=3, help="Number of pages to check for TOC")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the persistent LLM response cache")
+    parser.add_argument('--resume', action='store_true', help="Resume from the last completed stage checkpoint")
+    parser.add_argument('--incremental', action='store_true', help="Reuse the previous run's tree and summaries for unchanged pages")
+    parser.add_argument('--work-dir', type=str, default=None, help="Directory for stage checkpoints (default: work)")
+    parser.add_argument('--result-format', choices=['pretty', 'compact'], default='compact', help="Indented or compact result JSON")
+    parser.add_argument('--summary-mode', choices=['flat', 'bottom_up'], default='bottom_up', help="Summarize every node from its own text, or parents from their children's summaries")
+    parser.add_argument('--compress', choices=['none', 'gzip', 'zstd'], default='none', help="Write the result as .json.gz / .json.zst")
+    parser.add_argument('--keep-headers', action='store_true', help="Keep repeated page headers / footers / page numbers in the page text")
+    parser.add_argument('--toc-verify', choices=['full', 'sequential'], default='sequential', help="Check every TOC item, or sample until the accuracy decision is clear")
     
     # Parse arguments
     args = parser.parse_args()
@@ -44,7 +53,16 @@ def main():
         # --- CRITICAL SETTINGS FOR FULL OUTPUT ---
         if_add_node_text='yes',       # Must be 'yes' to generate summaries based on text
         if_add_node_summary='yes',    # Generate summaries for each node
-        if_add_doc_description='yes'  # Generate global document description
+        if_add_doc_description='yes',  # Generate global document description
+        if_use_llm_cache='no' if args.no_cache else 'yes',
+        resume='yes' if args.resume else 'no',
+        incremental='yes' if args.incremental else 'no',
+        work_dir=args.work_dir,
+        result_format=args.result_format,
+        summary_mode=args.summary_mode,
+        result_compression=args.compress,
+        if_strip_headers_footers='no' if args.keep_headers else 'yes',
+        toc_verify_mode=args.toc_verify
     )
 
     print(f"[INFO] Starting indexing for: {args.pdf_path}")
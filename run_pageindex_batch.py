@@ -0,0 +1,214 @@
+"""
+批量索引：一个进程内并发处理多个 PDF，所有文档共享同一个全局 LLM 并发 / 速率预算。
+
+输入为目录（递归查找 *.pdf）或清单文件（.txt 每行一个路径，.json 为路径列表）。
+任务队列持久化在 --queue 指定的 JSON 中，记录每个文档的状态、尝试次数、耗时和错误；
+中断后用相同参数重跑即可续跑：已完成的文档跳过，未完成的文档带 resume 从阶段检查点继续。
+结束时写出一份汇总报告。
+
+用法:
+    python run_pageindex_batch.py tests/pdfs --jobs 3 --llm-concurrency 4 --rpm 120
+    python run_pageindex_batch.py manifest.txt --max-retries 2 --report results/batch_report.json
+"""
+import argparse
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+if sys.stdout:
+    sys.stdout.reconfigure(encoding='utf-8')
+if sys.stderr:
+    sys.stderr.reconfigure(encoding='utf-8')
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pageindex.utils import ConfigLoader, StageCheckpoint, CHECKPOINT_DIR, set_llm_limits
+from pageindex.page_index import page_index_main
+
+DEFAULT_QUEUE_PATH = os.path.join(CHECKPOINT_DIR, "batch_queue.json")
+
+
+def collect_pdfs(source):
+    """目录递归查找 PDF；清单文件支持 .json（路径列表）和纯文本（每行一个路径，# 开头为注释）"""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, f) for f in files if f.lower().endswith('.pdf'))
+        return sorted(paths)
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r', encoding='utf-8') as f:
+        if source.lower().endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+    # 清单中的相对路径相对于清单文件所在目录
+    return [e if os.path.isabs(e) else os.path.join(base_dir, e) for e in entries]
+
+
+class JobQueue:
+    """持久化任务队列：{path: {status, attempts, elapsed, error, ...}}，每次状态变化后原子写盘"""
+    def __init__(self, path, pdf_paths, reset=False):
+        self.path = path
+        self.lock = threading.Lock()
+        data = None if reset else self._read()
+        self.jobs = (data or {}).get('jobs', {})
+        for pdf_path in pdf_paths:
+            key = os.path.abspath(pdf_path)
+            job = self.jobs.setdefault(key, {'status': 'pending', 'attempts': 0})
+            # 上次运行中断时仍在处理的文档重新排队
+            if job['status'] == 'running': job['status'] = 'pending'
+        self.save()
+
+    def _read(self):
+        if not os.path.exists(self.path): return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: return json.load(f)
+        except Exception as e:
+            print(f"[WARNING] Job queue unreadable ({self.path}), starting a new one: {e}")
+            return None
+
+    def save(self):
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'updated_at': datetime.now().isoformat(), 'jobs': self.jobs}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def update(self, key, **fields):
+        with self.lock: self.jobs[key].update(fields)
+        self.save()
+
+    def runnable(self, keys, max_retries):
+        return [k for k in keys if self.jobs[k]['status'] == 'pending'
+                or (self.jobs[k]['status'] == 'failed' and self.jobs[k]['attempts'] <= max_retries)]
+
+
+def count_nodes(structure):
+    stack, total = list(structure or []), 0
+    while stack:
+        node = stack.pop()
+        total += 1
+        stack.extend(node.get('nodes') or [])
+    return total
+
+
+def run_job(queue, key, base_opt, max_retries, work_dir):
+    """处理一个文档，失败时在本线程内重试；重试和续跑都从阶段检查点继续"""
+    while True:
+        job = queue.jobs[key]
+        attempt = job['attempts'] + 1
+        queue.update(key, status='running', attempts=attempt, started_at=datetime.now().isoformat())
+        print(f"[BATCH] Start ({attempt}/{max_retries + 1}): {key}", flush=True)
+        opt = ConfigLoader().load({**vars(base_opt), 'resume': 'yes' if attempt > 1 or job.get('error') else 'no'})
+        start = time.perf_counter()
+        error = None
+        try:
+            result = page_index_main(doc=key, opt=opt) or {}
+            if result.get('error'): error = result['error']
+            # page_index_main 只在完整成功后删除检查点目录
+            elif os.path.isdir(StageCheckpoint.dir_for(key, work_dir)): error = "Pipeline interrupted, partial result saved"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+            result = {}
+        elapsed = round(time.perf_counter() - start, 2)
+        total_elapsed = round(job.get('total_elapsed', 0) + elapsed, 2)
+
+        if error is None:
+            queue.update(key, status='done', error=None, elapsed=elapsed, total_elapsed=total_elapsed,
+                         finished_at=datetime.now().isoformat(), node_count=count_nodes(result.get('structure')))
+            print(f"[BATCH] Done in {elapsed}s: {key}", flush=True)
+            return
+        queue.update(key, status='failed', error=error, elapsed=elapsed, total_elapsed=total_elapsed,
+                     finished_at=datetime.now().isoformat())
+        print(f"[BATCH] Failed ({attempt}/{max_retries + 1}): {key}: {error}", flush=True)
+        if attempt > max_retries: return
+
+
+def build_report(queue, keys, wall_time):
+    jobs = [{'pdf_path': k, **queue.jobs[k]} for k in keys]
+    counts = {}
+    for job in jobs: counts[job['status']] = counts.get(job['status'], 0) + 1
+    return {
+        'generated_at': datetime.now().isoformat(),
+        'wall_time': round(wall_time, 2),
+        'total': len(jobs),
+        'counts': counts,
+        'documents': jobs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PageIndex batch indexer")
+    parser.add_argument('source', help="Directory of PDFs or a manifest file (.txt / .json)")
+    parser.add_argument('--model', type=str, default=None, help="AI Model to use (default: config.yaml)")
+    parser.add_argument('--toc-check-pages', type=int, default=None, help="Number of pages to check for TOC")
+    parser.add_argument('--jobs', type=int, default=2, help="Documents processed concurrently")
+    parser.add_argument('--llm-concurrency', type=int, default=4, help="Max in-flight LLM requests across all documents (0 = unlimited)")
+    parser.add_argument('--rpm', type=float, default=0, help="Max LLM requests per minute across all documents (0 = unlimited)")
+    parser.add_argument('--max-retries', type=int, default=1, help="Retries per document after a failure")
+    parser.add_argument('--queue', type=str, default=DEFAULT_QUEUE_PATH, help="Persistent job queue file")
+    parser.add_argument('--reset', action='store_true', help="Discard the existing job queue and start over")
+    parser.add_argument('--report', type=str, default=None, help="Summary report path (default: results/batch_report_<timestamp>.json)")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the persistent LLM response cache")
+    parser.add_argument('--incremental', action='store_true', help="Reuse previous trees and summaries for unchanged pages")
+    parser.add_argument('--work-dir', type=str, default=None, help="Directory for stage checkpoints (default: work)")
+    args = parser.parse_args()
+
+    pdf_paths = [p for p in collect_pdfs(args.source) if os.path.isfile(p)]
+    if not pdf_paths:
+        print(f"[ERROR] No PDF files found in {args.source}")
+        return 1
+    keys = list(dict.fromkeys(os.path.abspath(p) for p in pdf_paths))
+
+    limiter = set_llm_limits(args.llm_concurrency, args.rpm)
+    print(f"[INFO] {len(keys)} documents, {args.jobs} concurrent, LLM budget: "
+          f"{limiter.max_concurrency or 'unlimited'} in flight, {limiter.rpm or 'unlimited'} rpm")
+
+    user_opt = {
+        'if_add_node_id': 'yes',
+        'if_add_node_text': 'yes',
+        'if_add_node_summary': 'yes',
+        'if_add_doc_description': 'yes',
+        'if_use_llm_cache': 'no' if args.no_cache else 'yes',
+        'incremental': 'yes' if args.incremental else 'no',
+        'work_dir': args.work_dir,
+    }
+    if args.model: user_opt['model'] = args.model
+    if args.toc_check_pages is not None: user_opt['toc_check_page_num'] = args.toc_check_pages
+    base_opt = ConfigLoader().load(user_opt)
+
+    queue = JobQueue(args.queue, keys, reset=args.reset)
+    runnable = queue.runnable(keys, args.max_retries)
+    skipped = len(keys) - len(runnable)
+    if skipped: print(f"[INFO] Job queue: {skipped} documents already done or out of retries, skipped.")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [executor.submit(run_job, queue, key, base_opt, args.max_retries, args.work_dir) for key in runnable]
+        for future in as_completed(futures):
+            future.result()
+
+    report = build_report(queue, keys, time.perf_counter() - start)
+    report_path = args.report or os.path.join("results", f"batch_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print("\n=== Batch Summary ===")
+    for job in report['documents']:
+        print(f"  [{job['status']:>7}] {os.path.basename(job['pdf_path'])}  "
+              f"{job.get('total_elapsed', 0)}s  attempts={job['attempts']}  nodes={job.get('node_count', '-')}")
+    print(f"[SUCCESS] {report['counts'].get('done', 0)}/{report['total']} documents indexed in {report['wall_time']}s. "
+          f"Report: {os.path.abspath(report_path)}")
+    return 0 if report['counts'].get('done', 0) == report['total'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
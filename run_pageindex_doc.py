@@ -0,0 +1,64 @@
+"""
+Markdown / DOCX / TXT 文档的快速索引：直接按标题构树，不经过 PDF 流程的目录检测和校验。
+结果与 run_pageindex.py 相同，写到 results/<文件名>_<时间戳>.json。
+
+用法:
+    python run_pageindex_doc.py --doc_path docs/PRD.md
+    python run_pageindex_doc.py --doc_path manual.docx --no-summary          # 只构树，零 LLM 调用
+    python run_pageindex_doc.py --doc_path notes.txt --min-node-tokens 300 --description
+"""
+import argparse
+import os
+import sys
+
+if sys.stdout:
+    sys.stdout.reconfigure(encoding='utf-8')
+if sys.stderr:
+    sys.stderr.reconfigure(encoding='utf-8')
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pageindex.utils import ConfigLoader
+from pageindex.page_index_doc import doc_index_main, DOC_EXTENSIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PageIndex fast path for Markdown / DOCX / TXT documents")
+    parser.add_argument('--doc_path', type=str, required=True, help=f"Document to index ({' / '.join(DOC_EXTENSIONS)})")
+    parser.add_argument('--model', type=str, default=None, help="AI Model for summaries (default: config.yaml)")
+    parser.add_argument('--no-summary', action='store_true', help="Structure only, no LLM calls at all")
+    parser.add_argument('--description', action='store_true', help="Also generate a document description")
+    parser.add_argument('--min-node-tokens', type=int, default=0, help="Merge sections smaller than this into their parent (0 = off)")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the persistent LLM response cache")
+    parser.add_argument('--result-format', choices=['pretty', 'compact'], default='compact', help="Indented or compact result JSON")
+    parser.add_argument('--summary-mode', choices=['flat', 'bottom_up'], default='bottom_up', help="Summarize every node from its own text, or parents from their children's summaries")
+    parser.add_argument('--compress', choices=['none', 'gzip', 'zstd'], default='none', help="Write the result as .json.gz / .json.zst")
+    args = parser.parse_args()
+
+    user_opt = {
+        'if_add_node_id': 'yes',
+        'if_add_node_text': 'yes',
+        'if_add_node_summary': 'no' if args.no_summary else 'yes',
+        'if_add_doc_description': 'yes' if args.description else 'no',
+        'if_use_llm_cache': 'no' if args.no_cache else 'yes',
+        'min_node_tokens': args.min_node_tokens,
+        'result_format': args.result_format,
+        'summary_mode': args.summary_mode,
+        'result_compression': args.compress,
+    }
+    if args.model: user_opt['model'] = args.model
+    opt = ConfigLoader().load(user_opt)
+
+    print(f"[INFO] Starting indexing for: {args.doc_path}")
+    try:
+        doc_index_main(doc=args.doc_path, opt=opt)
+    except Exception as e:
+        print(f"[ERROR] Failed to process document: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import copy
+
+from pageindex.incremental import get_page_hashes, map_pages, plan_incremental_update
+
+FINGERPRINT = 'fp'
+
+
+def make_pages(count, titles):
+    """titles: {物理页: 标题}；其余页只有正文"""
+    pages = []
+    for page in range(1, count + 1):
+        body = f"Body paragraph of physical page {page} describing results and discussion in detail."
+        text = f"{titles[page]}\n{body}" if page in titles else body
+        pages.append((text, 20))
+    return pages
+
+
+TITLES = {1: 'Cover', 3: 'Topic A', 4: 'Sub 1', 6: 'Sub 2', 7: 'Sub 3', 11: 'Topic B'}
+STRUCTURE = [
+    {'title': 'Cover', 'start_index': 1, 'end_index': 2, 'summary': 'cover'},
+    {'title': 'Topic A', 'start_index': 3, 'end_index': 10, 'summary': 'topic a', 'nodes': [
+        {'title': 'Sub 1', 'start_index': 4, 'end_index': 5, 'summary': 'sub 1'},
+        {'title': 'Sub 2', 'start_index': 6, 'end_index': 6, 'summary': 'sub 2'},
+        {'title': 'Sub 3', 'start_index': 7, 'end_index': 10, 'summary': 'sub 3'},
+    ]},
+    {'title': 'Topic B', 'start_index': 11, 'end_index': 20, 'summary': 'topic b'},
+]
+
+
+def previous_artifact(pages):
+    return {'fingerprint': FINGERPRINT, 'page_hashes': get_page_hashes(pages),
+            'doc_description': 'desc', 'structure': copy.deepcopy(STRUCTURE)}
+
+
+def titles_of(structure):
+    return [(node['title'], node['start_index'], node['end_index'])
+            for node in [n for root in structure for n in [root] + root.get('nodes', [])]]
+
+
+def test_map_pages_identical():
+    page_map, changed, deleted = map_pages(['a', 'b', 'c'], ['a', 'b', 'c'])
+    assert page_map == {1: 1, 2: 2, 3: 3}
+    assert changed == set() and deleted == set()
+
+
+def test_map_pages_deletion_marks_following_page_changed():
+    page_map, changed, deleted = map_pages(['a', 'b', 'c', 'd'], ['a', 'c', 'd'])
+    assert deleted == {2}
+    assert changed == {2}
+    assert page_map == {1: 1, 2: 2, 3: 2, 4: 3}
+
+
+def test_map_pages_deletion_at_end():
+    page_map, changed, deleted = map_pages(['a', 'b', 'c'], ['a', 'b'])
+    assert deleted == {3}
+    assert changed == {2}
+    assert page_map[3] == 2
+
+
+def test_map_pages_insertion_and_replacement():
+    page_map, changed, deleted = map_pages(['a', 'b', 'c'], ['a', 'x', 'b', 'y'])
+    assert page_map[1] == 1 and page_map[2] == 3 and page_map[3] == 4
+    assert changed == {2, 4}
+    assert deleted == set()
+
+
+def test_plan_unchanged_reuses_every_summary():
+    pages = make_pages(20, TITLES)
+    plan = plan_incremental_update(previous_artifact(pages), pages, get_page_hashes(pages), FINGERPRINT)
+    assert plan['dirty'] == 0
+    assert len(plan['summaries']) == 6
+    assert plan['doc_description'] == 'desc'
+
+
+def test_plan_does_not_reuse_empty_summaries():
+    pages = make_pages(20, TITLES)
+    previous = previous_artifact(pages)
+    previous['structure'][1]['nodes'][1]['summary'] = ''
+    plan = plan_incremental_update(previous, pages, get_page_hashes(pages), FINGERPRINT)
+    # 先序位置 3 是 Sub 2：空摘要不带入，本次会重新生成
+    assert 3 not in plan['summaries']
+    assert len(plan['summaries']) == 5
+
+
+def test_plan_deleted_section_is_dropped_and_parent_is_dirty():
+    old_pages = make_pages(20, TITLES)
+    new_pages = old_pages[:5] + old_pages[6:]
+    plan = plan_incremental_update(previous_artifact(old_pages), new_pages, get_page_hashes(new_pages), FINGERPRINT)
+    assert plan is not None
+    assert titles_of(plan['structure']) == [
+        ('Cover', 1, 2), ('Topic A', 3, 9), ('Sub 1', 4, 5), ('Sub 3', 6, 9), ('Topic B', 10, 19),
+    ]
+    assert plan['changed_pages'] == [6]
+    # Topic A 少了一页、Sub 3 移到了删除位置，两者都要重新生成摘要
+    assert plan['dirty'] == 2
+    assert sorted(plan['summaries'].values()) == ['cover', 'sub 1', 'topic b']
+
+
+def test_plan_options_changed_returns_none():
+    pages = make_pages(20, TITLES)
+    assert plan_incremental_update(previous_artifact(pages), pages, get_page_hashes(pages), 'other') is None
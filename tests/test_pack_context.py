@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("jieba")
+
+from RAG_Backend import pack_context, estimate_tokens, truncate_to_tokens
+
+
+def make_item(rank, content, source='VECTOR', path='Doc > Section'):
+    return {'rank': rank, 'final_score': 1.0 / rank, 'path': path, 'source': source, 'content': content}
+
+
+def test_empty_results():
+    context, stats = pack_context([], token_budget=1000)
+    assert context == ""
+    assert stats['included'] == 0 and stats['total'] == 0
+
+
+def test_everything_fits():
+    items = [make_item(i, f"Paragraph number {i} about fuel efficiency and maintenance costs.") for i in range(1, 4)]
+    context, stats = pack_context(items, token_budget=10000)
+    assert stats['included'] == 3 and not stats['truncated']
+    assert all(f"Paragraph number {i}" in context for i in range(1, 4))
+
+
+def test_child_covered_by_parent_is_skipped():
+    child = "The 737 MAX program resumed deliveries in most markets during the year."
+    parent = "Commercial Airplanes overview for the fiscal year.\n" + child
+    context, stats = pack_context([make_item(1, parent), make_item(2, child)], token_budget=10000)
+    assert stats['included'] == 1
+    assert context.count(child) == 1
+
+
+def test_json_source_keeps_keyword_windows_only():
+    content = "x" * 2000 + " revenue grew strongly " + "y" * 2000
+    context, _ = pack_context([make_item(1, content, source='JSON_Source')], keywords=['revenue'], token_budget=0, window=50)
+    assert "revenue grew strongly" in context
+    assert "x" * 200 not in context
+
+
+def test_first_result_without_line_breaks_is_truncated_not_dropped():
+    # 单个超长行：按行截断装不下任何一行，旧实现会返回空上下文
+    content = "engine " * 5000
+    context, stats = pack_context([make_item(1, content), make_item(2, "second result")], token_budget=500)
+    assert stats['included'] == 1 and stats['truncated']
+    assert "engine engine" in context and "(truncated)" in context
+    assert "second result" not in context
+    assert stats['packed_tokens'] <= 500
+
+
+def test_tiny_budget_still_returns_first_result_head():
+    context, stats = pack_context([make_item(1, "word " * 1000)], token_budget=10)
+    assert stats['included'] == 1
+    assert "word word" in context
+
+
+def test_later_results_are_cut_at_budget():
+    items = [make_item(i, "\n".join(f"Line {i}.{j} with distinct filler text for packing" for j in range(40)))
+             for i in range(1, 6)]
+    context, stats = pack_context(items, token_budget=1200)
+    assert stats['truncated']
+    assert 1 <= stats['included'] < 5
+    assert stats['packed_tokens'] <= 1200
+
+
+def test_truncate_to_tokens():
+    text = "abcd" * 100
+    assert truncate_to_tokens(text, 1000) == text
+    head = truncate_to_tokens(text, 10)
+    assert text.startswith(head) and estimate_tokens(head) <= 10 and estimate_tokens(text[:len(head) + 1]) > 10
@@ -0,0 +1,53 @@
+from pageindex.page_cleaner import detect_repeated_lines, restore_page_text, strip_repeated_lines
+
+BODIES = [
+    'Revenue grew in every region during the first quarter.',
+    'Operating costs were flat compared with last year.',
+    'The board approved a new dividend policy in March.',
+    'Capital expenditure focused on the northern plant.',
+    'Headcount increased by four percent across divisions.',
+    'Customer churn fell to the lowest level on record.',
+    'Inventory turnover improved after the system upgrade.',
+    'The outlook for the second half remains cautious.',
+]
+
+
+def body_of(page):
+    return f"{BODIES[page - 1]}\n{BODIES[-page]}"
+
+
+def make_pages(header='ACME Annual Report 2023', count=8):
+    return [(f"{header}\n{body_of(page)}\n- {page} -", 10) for page in range(1, count + 1)]
+
+
+def test_headers_and_page_numbers_removed_after_first_page():
+    pages = make_pages()
+    cleaned, removed = strip_repeated_lines(pages)
+    # 第一页保留页眉 / 页码，其余页只剩正文
+    assert cleaned[0] == pages[0]
+    for page, (text, _) in enumerate(cleaned[1:], start=2):
+        assert text == body_of(page)
+    assert removed['2'] == [[0, 'ACME Annual Report 2023'], [3, '- 2 -']]
+    assert '1' not in removed
+
+
+def test_restore_page_text_round_trip():
+    pages = make_pages()
+    cleaned, removed = strip_repeated_lines(pages)
+    for page, (text, _) in enumerate(cleaned, start=1):
+        assert restore_page_text(text, removed.get(str(page), [])) == pages[page - 1][0]
+
+
+def test_count_fn_recounts_only_modified_pages():
+    cleaned, removed = strip_repeated_lines(make_pages(), count_fn=len)
+    assert cleaned[0][1] == 10
+    assert all(tokens == len(text) for text, tokens in cleaned[1:])
+
+
+def test_body_lines_and_short_documents_untouched():
+    # 每页第一行都不同，不能当作页眉
+    pages = [(f"{body}\nshared closing note for the section", 5) for body in BODIES]
+    removals = detect_repeated_lines([text for text, _ in pages])
+    assert all(0 not in lines for lines in removals.values())
+    # 页数少于 MIN_PAGES 时不做任何处理
+    assert strip_repeated_lines(make_pages(count=3)) == (make_pages(count=3), {})
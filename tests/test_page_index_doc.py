@@ -0,0 +1,53 @@
+from pageindex import page_index_md
+from pageindex.page_index_doc import build_doc_structure, text_to_markdown
+
+
+def headings(markdown):
+    return [line for line in markdown.split('\n') if line.startswith('#')]
+
+
+def test_numbered_list_items_are_not_sections():
+    markdown = text_to_markdown("1 Introduction\nFollow these steps\n1. Open the file\n2. Click OK\n2 Results")
+    assert headings(markdown) == ['# 1 Introduction', '# 2 Results']
+    assert '1. Open the file\n2. Click OK' in markdown
+
+
+def test_numbered_headings_follow_their_numbering():
+    text = "1 Scope\n1.1 Background\n1.2 Terms\n2.3.1 Measured values\n3 Outlook\n1. first note\n2. second note\n4 Annex"
+    assert headings(text_to_markdown(text)) == [
+        '# 1 Scope', '## 1.1 Background', '## 1.2 Terms', '### 2.3.1 Measured values', '# 3 Outlook', '# 4 Annex']
+
+
+def test_setext_named_and_cjk_headings():
+    text = "Overview\n========\nIntro.\n\nUsage\n-----\n第一章 总则\n第一节 范围\nChapter 2 Scope\nSection 3 Terms"
+    assert headings(text_to_markdown(text)) == [
+        '# Overview', '## Usage', '# 第一章 总则', '## 第一节 范围', '# Chapter 2 Scope', '## Section 3 Terms']
+
+
+def test_body_lines_not_taken_as_headings():
+    text = "2023 revenue grew strongly\n1 This line ends like a sentence.\n" + "1 " + "word " * 30 + "\n```\ncode"
+    markdown = text_to_markdown(text)
+    assert headings(markdown) == []
+    assert markdown.endswith('\\```\ncode')
+
+
+def test_build_doc_structure_preface_and_unescape():
+    structure = build_doc_structure("Lead text\n# A\na body\n## B\n\\# not a heading\n", 'Doc', unescape=True)
+    assert [node['title'] for node in structure] == ['Preface', 'A']
+    assert structure[0]['text'] == 'Lead text'
+    child = structure[1]['nodes'][0]
+    assert child['title'] == 'B' and child['text'] == '## B\n# not a heading'
+    assert 'nodes' not in child
+
+
+def test_build_doc_structure_without_headings():
+    assert build_doc_structure("just text", 'Doc') == [{'title': 'Doc', 'node_id': '0001', 'text': 'just text', 'line_num': 1}]
+
+
+def test_build_doc_structure_from_text_with_min_node_tokens(monkeypatch):
+    monkeypatch.setattr(page_index_md, 'count_tokens', lambda text, model=None: len(text.split()))
+    text = "1 Introduction\nshort intro\n1.1 Detail\ntiny\n2 Results\n" + "word " * 50
+    structure = build_doc_structure(text_to_markdown(text), 'Doc', min_node_tokens=10, unescape=True)
+    assert [node['title'] for node in structure] == ['1 Introduction', '2 Results']
+    assert 'nodes' not in structure[0]
+    assert structure[0]['text'].endswith('## 1.1 Detail\ntiny')
@@ -0,0 +1,68 @@
+import pytest
+
+from pageindex import page_index_md
+from pageindex.page_index_md import (
+    build_tree_from_nodes, extract_node_text_content, extract_nodes_from_markdown,
+    tree_thinning_for_index, update_node_list_with_text_token_count,
+)
+
+MARKDOWN = """# Guide
+intro words here
+
+## Install
+one two three four five six seven eight
+
+### Linux
+apt get
+
+## Usage
+run it
+
+# Reference
+api listing with several more words
+"""
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # 用词数代替 tokenizer，结果可以手算
+    monkeypatch.setattr(page_index_md, 'count_tokens', lambda text, model=None: len(text.split()))
+
+
+def parse(markdown=MARKDOWN):
+    node_list, lines = extract_nodes_from_markdown(markdown)
+    return extract_node_text_content(node_list, lines)
+
+
+def test_subtree_token_counts():
+    nodes = update_node_list_with_text_token_count(parse())
+    counts = {node['title']: node['text_token_count'] for node in nodes}
+    # 自身文本（含标题行）+ 全部后代
+    assert counts == {'Linux': 4, 'Install': 14, 'Usage': 4, 'Guide': 23, 'Reference': 8}
+
+
+def test_thinning_merges_small_subtrees_into_their_root():
+    nodes = tree_thinning_for_index(update_node_list_with_text_token_count(parse()), 15)
+    assert [node['title'] for node in nodes] == ['Guide', 'Install', 'Usage', 'Reference']
+    # Install（14）小于阈值，吸收子节点 Linux；Guide（23）不合并
+    assert nodes[1]['text'] == '## Install\none two three four five six seven eight\n\n### Linux\napt get'
+    assert nodes[0]['text'] == '# Guide\nintro words here'
+    # Usage 本身小于阈值，但没有子节点，文本不变
+    assert nodes[2]['text'] == '## Usage\nrun it'
+
+
+def test_thinning_whole_document_under_threshold():
+    nodes = tree_thinning_for_index(update_node_list_with_text_token_count(parse()), 100)
+    assert [node['title'] for node in nodes] == ['Guide', 'Reference']
+    assert nodes[0]['text'].split('\n\n') == [
+        '# Guide\nintro words here', '## Install\none two three four five six seven eight',
+        '### Linux\napt get', '## Usage\nrun it']
+    assert tree_thinning_for_index(parse(), None) == parse()
+
+
+def test_code_block_headers_ignored_and_tree_built():
+    markdown = "# Top\n```\n# not a header\n```\n## Child\ntext\n"
+    tree = build_tree_from_nodes(parse(markdown))
+    assert [node['title'] for node in tree] == ['Top']
+    assert [node['title'] for node in tree[0]['nodes']] == ['Child']
+    assert '# not a header' in tree[0]['text']
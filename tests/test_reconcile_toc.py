@@ -0,0 +1,48 @@
+from pageindex.page_index import reconcile_toc_parts
+
+
+def titles(merged):
+    return [(item['structure'], item['title'], item['physical_index']) for item in merged]
+
+
+def test_parts_are_merged_in_page_order():
+    parts = [
+        [{'structure': '2', 'title': 'Methods', 'physical_index': '<physical_index_12>'}],
+        [{'structure': '1', 'title': 'Introduction', 'physical_index': '<physical_index_3>'},
+         {'structure': '1.1', 'title': 'Background', 'physical_index': '<physical_index_5>'}],
+    ]
+    assert titles(reconcile_toc_parts(parts)) == [
+        ('1', 'Introduction', 3), ('1.1', 'Background', 5), ('2', 'Methods', 12)]
+
+
+def test_overlapping_pages_deduplicated_by_normalized_title():
+    parts = [
+        [{'structure': '1', 'title': 'Results', 'physical_index': '<physical_index_20>'}],
+        [{'structure': '3', 'title': '  results ', 'physical_index': '<physical_index_20>'},
+         {'structure': '4', 'title': 'Results', 'physical_index': '<physical_index_30>'}],
+    ]
+    assert titles(reconcile_toc_parts(parts)) == [('1', 'Results', 20), ('2', 'Results', 30)]
+
+
+def test_structure_renumbered_without_gaps():
+    # 各部分的编号互不一致；子节点不能比父节点深一层以上
+    parts = [
+        [{'structure': '7', 'title': 'A', 'physical_index': 1},
+         {'structure': '7.1.1', 'title': 'A deep', 'physical_index': 2}],
+        [{'structure': '1.1', 'title': 'A sub', 'physical_index': 3},
+         {'structure': '1', 'title': 'B', 'physical_index': 4},
+         {'structure': None, 'title': 'C', 'physical_index': 5}],
+    ]
+    assert [item['structure'] for item in reconcile_toc_parts(parts)] == ['1', '1.1', '1.2', '2', '3']
+
+
+def test_invalid_parts_and_items_skipped():
+    parts = [
+        None,
+        'not a list',
+        [{'structure': '1', 'title': '', 'physical_index': 2},
+         {'structure': '1', 'title': 'No page', 'physical_index': 'unknown'},
+         'garbage',
+         {'structure': '1', 'title': 'Kept', 'physical_index': '<physical_index_4>'}],
+    ]
+    assert titles(reconcile_toc_parts(parts)) == [('1', 'Kept', 4)]
@@ -0,0 +1,42 @@
+import asyncio
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pageindex.metrics import start_run
+from pageindex.title_matcher import is_local_title_match_enabled, local_title_match_scope, match_title_appearance
+
+page_index = importlib.import_module('pageindex.page_index')
+
+PAGES = [(f"Chapter {i} Results of the survey\nBody text of page {i}.", 10) for i in range(1, 7)]
+TOC = [{'title': f'Chapter {i} Results of the survey', 'physical_index': i} for i in range(1, 7)]
+
+
+def test_scope_disables_local_matching_and_restores():
+    text = PAGES[0][0]
+    assert match_title_appearance(TOC[0]['title'], text) == 'yes'
+    with local_title_match_scope(False):
+        assert not is_local_title_match_enabled()
+        assert match_title_appearance(TOC[0]['title'], text) is None
+    assert is_local_title_match_enabled()
+
+
+def test_concurrent_runs_keep_their_own_flag_and_counts(monkeypatch):
+    async def fake_llm(model, prompt):
+        await asyncio.sleep(0.01)
+        return '{"answer": "yes"}'
+
+    monkeypatch.setattr(page_index, 'ChatGPT_API_async', fake_llm)
+    barrier = threading.Barrier(2)
+
+    def run(enabled):
+        metrics = start_run(f'doc-{enabled}', emit_progress=False)
+        with local_title_match_scope(enabled):
+            barrier.wait()
+            accuracy, _ = asyncio.run(page_index.verify_toc(PAGES, TOC))
+        return accuracy, metrics.title_checks
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        local_run, llm_run = executor.map(run, [True, False])
+    assert local_run == (1.0, {'local': 6, 'llm': 0})
+    assert llm_run == (1.0, {'local': 0, 'llm': 6})
@@ -0,0 +1,67 @@
+import asyncio
+import importlib
+
+import pytest
+
+page_index = importlib.import_module('pageindex.page_index')
+from pageindex.page_index import sequential_z, verify_toc_sequential, wilson_interval, VERIFY_CONFIDENCE_Z
+
+
+def test_wilson_interval_bounds():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    lo, hi = wilson_interval(50, 100)
+    assert lo < 0.5 < hi
+    assert lo == pytest.approx(1 - hi)
+    # 全部正确时上界为 1，下界随样本数上升
+    assert wilson_interval(10, 10)[1] == 1.0
+    assert wilson_interval(10, 10)[0] < wilson_interval(40, 40)[0] < 1.0
+
+
+def test_sequential_z_spends_alpha_over_looks():
+    assert sequential_z(1) == pytest.approx(VERIFY_CONFIDENCE_Z)
+    assert sequential_z(0) == pytest.approx(VERIFY_CONFIDENCE_Z)
+    # 5% 双侧 alpha 分给 5 次检查：每次 1%
+    assert sequential_z(5) == pytest.approx(2.5758, abs=1e-3)
+    assert VERIFY_CONFIDENCE_Z < sequential_z(5) < sequential_z(25)
+
+
+def run_verify(monkeypatch, truth):
+    """truth: [bool, ...]，每个目录条目是否正确；所有条目都需要 LLM 检查"""
+    calls = []
+
+    async def fake_check(item, page_list=None, start_index=1, model=None):
+        calls.append(item['list_index'])
+        answer = 'yes' if truth[item['list_index']] else 'no'
+        return {'list_index': item['list_index'], 'answer': answer, 'title': item['title'], 'page_number': 1}
+
+    monkeypatch.setattr(page_index, 'check_title_appearance_local', lambda item, page_list, start_index=1: None)
+    monkeypatch.setattr(page_index, 'check_title_appearance', fake_check)
+    items = [{'title': f'Section {i}', 'physical_index': 1} for i in range(len(truth))]
+    accuracy, incorrect = asyncio.run(verify_toc_sequential([('text', 1)], items))
+    return accuracy, incorrect, calls
+
+
+def test_clean_toc_accepted_without_checking_everything(monkeypatch):
+    accuracy, incorrect, calls = run_verify(monkeypatch, [True] * 200)
+    assert accuracy == 1.0 and incorrect == []
+    assert len(calls) < 200
+
+
+def test_bad_toc_falls_back_early(monkeypatch):
+    truth = [i % 10 < 3 for i in range(200)]
+    accuracy, incorrect, calls = run_verify(monkeypatch, truth)
+    assert accuracy <= page_index.VERIFY_FIX_THRESHOLD
+    assert len(calls) < 200
+
+
+def test_fixable_toc_checks_every_item(monkeypatch):
+    truth = [i % 10 != 0 for i in range(200)]
+    accuracy, incorrect, calls = run_verify(monkeypatch, truth)
+    assert sorted(calls) == list(range(200))
+    assert accuracy == pytest.approx(0.9)
+    assert sorted(r['list_index'] for r in incorrect) == [i for i in range(200) if i % 10 == 0]
+
+
+def test_small_toc_is_checked_in_full(monkeypatch):
+    accuracy, incorrect, calls = run_verify(monkeypatch, [True] * 40)
+    assert accuracy == 1.0 and len(calls) == 40